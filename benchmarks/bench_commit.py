@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+""" Measures time per ``Archive.add`` commit in a gitroot containing
+many unrelated files, staging only the archive vs. the previous
+``is_dirty(untracked_files=True)`` + ``git add -A`` .
+
+Example:
+
+    ::
+
+        python benchmarks/bench_commit.py
+        python benchmarks/bench_commit.py --unrelated 100000 --adds 10
+
+"""
+# builtin
+from __future__ import absolute_import, division, print_function
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+# external
+import git
+# internal
+# measure the checkout the benchmarks live in, not an installed wallpapermgr
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wallpapermgr import datafile, storage  # noqa: E402
+
+
+def git_cmd(cwd, *args):
+    subprocess.check_call(
+        ['git', '-C', cwd] + list(args),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def make_gitroot(tmpdir, name, unrelated):
+    gitroot = os.path.join(tmpdir, name)
+    os.makedirs(os.path.join(gitroot, 'unrelated'))
+    git_cmd(gitroot, 'init', '-q')
+    git_cmd(gitroot, 'config', 'user.name', 'bench')
+    git_cmd(gitroot, 'config', 'user.email', 'bench@localhost')
+    git_cmd(gitroot, 'config', 'gc.auto', '0')
+    for i in range(unrelated):
+        subdir = os.path.join(gitroot, 'unrelated', str(i % 100))
+        if not os.path.isdir(subdir):
+            os.makedirs(subdir)
+        with open(os.path.join(subdir, '{}.txt'.format(i)), 'w') as fd:
+            fd.write(str(i))
+    git_cmd(gitroot, 'add', '-A')
+    git_cmd(gitroot, 'commit', '-q', '-m', 'init')
+    return gitroot
+
+
+def write_config(tmpdir, gitroot):
+    filepath = os.path.join(tmpdir, 'config2.yml')
+    with open(filepath, 'w') as fd:
+        fd.write('\n'.join([
+            "show_wallpaper_cmd: ['true']",
+            'archives:',
+            '   walls:',
+            '      archive:   {}/walls.tar'.format(gitroot),
+            '      gitroot:   {}'.format(gitroot),
+            '      gitsource: {}'.format(gitroot),
+            '      desc:      bench',
+        ]) + '\n')
+    return datafile.Config(filepath)
+
+
+def add_whole_tree(gitroot, filepath):
+    """ previous implementation of Archive.add + Archive.commit
+    """
+    with storage.open_storage(os.path.join(gitroot, 'walls.tar')) as store:
+        store.add([filepath])
+    repo = git.Repo(gitroot)
+    if not repo.is_dirty(untracked_files=True):
+        return
+    repo.git.add(A=True)
+    repo.git.commit('-m', 'add', author='wallpapermgr <wallpapermgr@domain.com>')
+
+
+def bench(tmpdir, args):
+    image = os.path.join(tmpdir, 'image.jpg')
+    results = {}
+    for strategy in ('whole-tree', 'touched-paths'):
+        gitroot = make_gitroot(tmpdir, strategy, args.unrelated)
+        config = write_config(tmpdir, gitroot)
+        archive = datafile.Archive('walls', config=config)
+
+        times = []
+        for i in range(args.adds):
+            with open(image, 'wb') as fd:
+                fd.write(os.urandom(args.size))
+            start = time.time()
+            if strategy == 'whole-tree':
+                add_whole_tree(gitroot, image)
+            else:
+                archive.add([image], push=False)
+            times.append(time.time() - start)
+        results[strategy] = sum(times) / len(times)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--unrelated', type=int, default=50000, help='unrelated files in gitroot')
+    parser.add_argument('--adds', type=int, default=5, help='number of add+commits')
+    parser.add_argument('--size', type=int, default=200000, help='bytes per image')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='wallpapermgr-bench-')
+    try:
+        results = bench(tmpdir, args)
+        print('{:>14}  {:>16}'.format('strategy', 'per --add (ms)'))
+        for strategy in results:
+            print('{:>14}  {:>16.1f}'.format(strategy, results[strategy] * 1000))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+""" Compares size and extraction latency of an uncompressed tar, compressed tars
+with one frame per member (random access), and a single-stream ``.tar.gz``
+(read with :py:mod:`tarfile` , like a tar archive).
+
+Example:
+
+    ::
+
+        python benchmarks/bench_compressed.py
+        python benchmarks/bench_compressed.py --members 2000 --size 500000 --compressible 0.3
+
+"""
+# builtin
+from __future__ import absolute_import, division, print_function
+import argparse
+import gzip
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import timeit
+# external
+# internal
+# measure the checkout the benchmarks live in, not an installed wallpapermgr
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wallpapermgr import storage  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synth  # noqa: E402
+
+
+def read_single_stream(path, name):
+    """ How a ``.tar.gz`` is read without an index (decompresses up to the member).
+    """
+    with tarfile.open(path, 'r') as archive_fd:
+        fr = archive_fd.extractfile(name)
+        try:
+            return fr.read()
+        finally:
+            fr.close()
+
+
+def bench(path, names, read, repeat):
+    positions = (
+        ('first', names[0]),
+        ('middle', names[len(names) // 2]),
+        ('last', names[-1]),
+    )
+    results = {'bytes': os.path.getsize(path)}
+    for (position, name) in positions:
+        results[position] = min(timeit.repeat(
+            lambda: read(name), number=1, repeat=repeat
+        ))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--members', type=int, default=500)
+    parser.add_argument('--size', type=int, default=200000, help='mean bytes per image')
+    parser.add_argument('--compressible', type=float, default=0.1,
+                        help='fraction of each image that compresses away (0-1)')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='wallpapermgr-bench-')
+    try:
+        tarpath = os.path.join(tmpdir, 'walls.tar')
+        names = synth.generate(
+            tarpath, args.members, args.size, 'lognormal', compressible=args.compressible
+        )
+
+        single_path = os.path.join(tmpdir, 'single.tar.gz')
+        with open(tarpath, 'rb') as fr:
+            with gzip.open(single_path, 'wb', compresslevel=6) as fw:
+                shutil.copyfileobj(fr, fw)
+
+        rows = [
+            ('tar', tarpath, storage.open_storage(tarpath).read),
+            ('tar.gz (single stream)', single_path,
+             lambda name: read_single_stream(single_path, name)),
+        ]
+        index_times = {}
+        for ext in ('.tar.gz', '.tar.xz'):
+            path = os.path.join(tmpdir, 'framed{}'.format(ext))
+            storage.convert(tarpath, path)
+
+            # first scan of an archive without it's checkpoint index
+            os.remove(storage.CompressedStorage(path).index_path)
+            storage.CompressedStorage._index_cache.clear()
+            index_times[path] = min(timeit.repeat(
+                lambda: storage.open_storage(path).scan(), number=1, repeat=1
+            ))
+            rows.append((
+                '{} (framed)'.format(ext[1:]), path, storage.open_storage(path).read
+            ))
+
+        print('{:>24}  {:>10}  {:>10}  {:>10}  {:>10}  {:>10}'.format(
+            'format', 'size(MB)', 'first(ms)', 'middle(ms)', 'last(ms)', 'index(ms)'))
+        for (fmt, path, read) in rows:
+            results = bench(path, names, read, args.repeat)
+            index_time = index_times.get(path)
+            print('{:>24}  {:>10.2f}  {:>10.3f}  {:>10.3f}  {:>10.3f}  {:>10}'.format(
+                fmt,
+                results['bytes'] / 1024 / 1024,
+                results['first'] * 1000,
+                results['middle'] * 1000,
+                results['last'] * 1000,
+                '{:.1f}'.format(index_time * 1000) if index_time else '-',
+            ))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+""" Measures time to read/validate the configfile, with and without
+the compiled config cache, at different numbers of archives.
+
+Example:
+
+    ::
+
+        python benchmarks/bench_config.py
+        python benchmarks/bench_config.py --archives 5 500 5000
+
+"""
+# builtin
+from __future__ import absolute_import, division, print_function
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+# external
+# internal
+# measure the checkout the benchmarks live in, not an installed wallpapermgr
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wallpapermgr import datafile  # noqa: E402
+
+
+def write_config(filepath, num_archives):
+    lines = [
+        "choose_archive_cmd: ['echo', 'archive_0']",
+        "show_wallpaper_cmd: ['feh', '--bg-scale', '${wallpaper}']",
+        "change_interval: 30",
+        "archives:",
+    ]
+    for i in range(num_archives):
+        lines.extend([
+            '   archive_{}:'.format(i),
+            '      archive:   ~/wallpapers/archive_{}.tar'.format(i),
+            '      gitroot:   ~/wallpapers',
+            '      gitsource: ssh://gitbox:/gitrepos/wallpapers',
+            '      desc:      "synthetic archive {}"'.format(i),
+        ])
+    with open(filepath, 'w') as fd:
+        fd.write('\n'.join(lines) + '\n')
+
+
+def bench(num_archives, repeat):
+    tmpdir = tempfile.mkdtemp(prefix='wallpapermgr-bench-')
+    try:
+        filepath = os.path.join(tmpdir, 'config2.yml')
+        write_config(filepath, num_archives)
+        cachepath = datafile.Config(filepath).cachepath
+
+        def uncached():
+            if os.path.isfile(cachepath):
+                os.remove(cachepath)
+            datafile.Config(filepath).read()
+
+        def cached():
+            datafile.Config(filepath).read()
+
+        results = {}
+        for (name, func) in (('uncached', uncached), ('cached', cached)):
+            func()  # warmup (and for 'cached', write the cache)
+            times = timeit.repeat(func, number=1, repeat=repeat)
+            results[name] = min(times)
+        return results
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--archives', type=int, nargs='*', default=[5, 500])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print('{:>10}  {:>12}  {:>12}  {:>8}'.format(
+        'archives', 'uncached(ms)', 'cached(ms)', 'speedup'))
+    for num_archives in args.archives:
+        results = bench(num_archives, args.repeat)
+        print('{:>10}  {:>12.3f}  {:>12.3f}  {:>7.1f}x'.format(
+            num_archives,
+            results['uncached'] * 1000,
+            results['cached'] * 1000,
+            results['uncached'] / results['cached'],
+        ))
+
+
+if __name__ == '__main__':
+    main()
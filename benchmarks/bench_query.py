@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+""" Measures ``query`` filter time over the metadata of a synthetic archive
+with many wallpapers (numpy is used if it is installed).
+
+Example:
+
+    ::
+
+        python benchmarks/bench_query.py
+        python benchmarks/bench_query.py --members 1000000 --repeat 5
+
+"""
+# builtin
+from __future__ import absolute_import, division, print_function
+import argparse
+import os
+import random
+import sys
+import time
+# external
+# internal
+# measure the checkout the benchmarks live in, not an installed wallpapermgr
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wallpapermgr import metadata  # noqa: E402
+
+
+_resolutions = [(1920, 1080), (2560, 1440), (3440, 1440), (3840, 2160), (5120, 1440)]
+
+_queries = [
+    ['width>=3440'],
+    ['width>=3440', 'height>=1440', 'size<2m'],
+    ['name~7$'],
+    ['width=5120', 'name~^wallhaven-1'],
+]
+
+
+def build_table(members):
+    rng = random.Random(0)
+    table = metadata.Table()
+    for i in range(members):
+        name = 'wallhaven-{}.png'.format(i)
+        (width, height) = rng.choice(_resolutions)
+        table.append(name, (
+            i,
+            int(rng.lognormvariate(14, 0.7)),
+            width,
+            height,
+            1500000000 + i,
+            rng.getrandbits(64),
+        ))
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--members', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    table = build_table(args.members)
+    print('{} wallpapers, numpy: {}'.format(len(table), metadata.numpy is not None))
+    print('{:<48}  {:>8}  {:>10}'.format('query', 'matches', 'seconds'))
+    for query in _queries:
+        terms = metadata.parse_terms(query)
+        timings = []
+        for _ in range(args.repeat):
+            start = time.monotonic()
+            rows = table.select(terms)
+            timings.append(time.monotonic() - start)
+        print('{:<48}  {:>8}  {:>10.4f}'.format(' '.join(query), len(rows), min(timings)))
+
+
+if __name__ == '__main__':
+    main()
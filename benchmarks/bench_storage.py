@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+""" Compares git repo size and clone time of tar vs loose-file archives,
+after a series of ``Archive.add`` style commits.
+
+Example:
+
+    ::
+
+        python benchmarks/bench_storage.py
+        python benchmarks/bench_storage.py --images 200 --size 500000 --adds 20
+
+"""
+# builtin
+from __future__ import absolute_import, division, print_function
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+# external
+# internal
+# measure the checkout the benchmarks live in, not an installed wallpapermgr
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wallpapermgr import storage  # noqa: E402
+
+
+def git(cwd, *args):
+    subprocess.check_call(
+        ['git', '-C', cwd] + list(args),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def repo_size(gitroot):
+    """ Returns bytes used by objects in repo.
+    """
+    stdout = subprocess.check_output(
+        ['git', '-C', gitroot, 'count-objects', '-v'],
+        universal_newlines=True,
+    )
+    stats = dict(line.split(': ') for line in stdout.splitlines())
+    return (int(stats['size']) + int(stats['size-pack'])) * 1024
+
+
+def write_images(dirpath, prefix, count, size):
+    filepaths = []
+    for i in range(count):
+        filepath = os.path.join(dirpath, '{}-{:05d}.jpg'.format(prefix, i))
+        with open(filepath, 'wb') as fd:
+            fd.write(os.urandom(size))  # incompressible, like jpg/png
+        filepaths.append(filepath)
+    return filepaths
+
+
+def bench(archive_name, tmpdir, args):
+    gitroot = os.path.join(tmpdir, 'repo-{}'.format(archive_name))
+    imagedir = os.path.join(tmpdir, 'images-{}'.format(archive_name))
+    os.makedirs(gitroot)
+    os.makedirs(imagedir)
+    git(gitroot, 'init', '-q')
+
+    store = storage.open_storage(os.path.join(gitroot, archive_name))
+    batches = [write_images(imagedir, 'initial', args.images, args.size)]
+    for i in range(args.adds):
+        batches.append(
+            write_images(imagedir, 'add{}'.format(i), args.per_add, args.size)
+        )
+
+    for (i, filepaths) in enumerate(batches):
+        store.add(filepaths)
+        git(gitroot, 'add', '-A')
+        git(gitroot, '-c', 'user.name=bench', '-c', 'user.email=bench@localhost',
+            'commit', '-q', '-m', 'add {}'.format(i))
+
+    # tar revisions are stored as full blobs until git delta-compresses
+    # them during gc (which is itself expensive for multi-GB tars).
+    size = repo_size(gitroot)
+    git(gitroot, 'gc', '-q')
+    size_gc = repo_size(gitroot)
+
+    clonedir = os.path.join(tmpdir, 'clone-{}'.format(archive_name))
+    start = time.time()
+    git(tmpdir, 'clone', '-q', 'file://{}'.format(gitroot), clonedir)
+    clone_time = time.time() - start
+
+    return {
+        'repo_bytes': size,
+        'repo_bytes_gc': size_gc,
+        'clone_seconds': clone_time,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--images', type=int, default=50, help='images in initial archive')
+    parser.add_argument('--size', type=int, default=200000, help='bytes per image')
+    parser.add_argument('--adds', type=int, default=10, help='number of add+commits')
+    parser.add_argument('--per-add', type=int, default=5, help='images per add')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='wallpapermgr-bench-')
+    try:
+        print('{:>8}  {:>14}  {:>18}  {:>10}'.format(
+            'format', 'repo size(MB)', 'after git-gc(MB)', 'clone(s)'))
+        for (fmt, archive_name) in (('tar', 'walls.tar'), ('loose', 'walls')):
+            results = bench(archive_name, tmpdir, args)
+            print('{:>8}  {:>14.2f}  {:>18.2f}  {:>10.3f}'.format(
+                fmt,
+                results['repo_bytes'] / 1024 / 1024,
+                results['repo_bytes_gc'] / 1024 / 1024,
+                results['clone_seconds'],
+            ))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
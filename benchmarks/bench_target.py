@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+""" Compares extraction targets: bytes written to block devices, and latency,
+for a day of wallpaper changes.
+
+Each change extracts a wallpaper, then deletes the previous one (like the server).
+Disk writes are read from ``/proc/self/io`` ( ``write_bytes`` counts page-cache
+bytes dirtied on a block device, tmpfs/memfd writes are not counted).
+
+Example:
+
+    ::
+
+        python benchmarks/bench_target.py
+        python benchmarks/bench_target.py --interval 300 --size 2000000
+
+"""
+# builtin
+from __future__ import absolute_import, division, print_function
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+# external
+# internal
+# measure the checkout the benchmarks live in, not an installed wallpapermgr
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wallpapermgr import datafile, storage, targets  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synth  # noqa: E402
+
+
+def io_counters():
+    """ Returns ``/proc/self/io`` as a dict (empty if unavailable).
+    """
+    counters = {}
+    try:
+        with open('/proc/self/io', 'r') as fd:
+            for line in fd:
+                (key, _, value) = line.partition(':')
+                counters[key] = int(value)
+    except(IOError, OSError):
+        pass
+    return counters
+
+
+def bench(target, store, names, changes):
+    output = datafile.default_output
+    target.start()
+    try:
+        before = io_counters()
+        start = time.monotonic()
+        for i in range(changes):
+            name = names[i % len(names)]
+            target.delete(output)
+            filepath = target.wallpaperfile(output).format(ext=os.path.splitext(name)[-1])
+            store.extract(name, filepath)
+        duration = time.monotonic() - start
+        target.delete(output)
+        after = io_counters()
+    finally:
+        target.close()
+
+    written = after.get('write_bytes', 0) - before.get('write_bytes', 0)
+    cancelled = after.get('cancelled_write_bytes', 0) - before.get('cancelled_write_bytes', 0)
+    return {
+        'write_bytes': written,
+        'cancelled_write_bytes': cancelled,
+        'seconds_per_change': duration / changes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--members', type=int, default=50)
+    parser.add_argument('--size', type=int, default=1000000, help='mean bytes per image')
+    parser.add_argument('--changes', type=int, default=200, help='changes measured')
+    parser.add_argument('--interval', type=float, default=30,
+                        help='seconds between changes (to extrapolate a day)')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='wallpapermgr-bench-', dir=os.path.expanduser('~'))
+    try:
+        tarpath = os.path.join(tmpdir, 'walls.tar')
+        names = synth.generate(tarpath, args.members, args.size, 'lognormal')
+        store = storage.open_storage(tarpath)
+
+        rows = [
+            ('disk', targets.DirTarget(os.path.join(tmpdir, 'wallpapers'), name='disk')),
+        ]
+        runtime = targets.runtime_dir()
+        if runtime is None and os.path.isdir('/dev/shm'):
+            runtime = os.path.join(tempfile.mkdtemp(dir='/dev/shm'), 'wallpapers')
+        if runtime is not None:
+            rows.append(('runtime ({})'.format(targets.filesystem_type(runtime)),
+                         targets.DirTarget(runtime, name='runtime')))
+        if targets.MemfdTarget.is_supported():
+            rows.append(('memfd', targets.MemfdTarget()))
+
+        changes_per_day = 86400 / args.interval
+        print('{:>16}  {:>14}  {:>14}  {:>18}  {:>12}'.format(
+            'target', 'written(MB)', 'cancelled(MB)', 'written/day(MB)', 'change(ms)'))
+        for (name, target) in rows:
+            results = bench(target, store, names, args.changes)
+            print('{:>16}  {:>14.2f}  {:>14.2f}  {:>18.1f}  {:>12.3f}'.format(
+                name,
+                results['write_bytes'] / 1024 / 1024,
+                results['cancelled_write_bytes'] / 1024 / 1024,
+                results['write_bytes'] / args.changes * changes_per_day / 1024 / 1024,
+                results['seconds_per_change'] * 1000,
+            ))
+        if runtime is not None and runtime.startswith('/dev/shm/'):
+            shutil.rmtree(os.path.dirname(runtime))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+""" Measures members/second listed from tar archives by :py:mod:`wallpapermgr.tarscan` ,
+compared to :py:mod:`tarfile` (what ``reload`` used to scan archives with).
+
+Results of both are compared first (names, offsets, sizes, types, end offset).
+
+Example:
+
+    ::
+
+        python benchmarks/bench_tarscan.py
+        python benchmarks/bench_tarscan.py --members 200000 --repeat 5
+
+"""
+# builtin
+from __future__ import absolute_import, division, print_function
+import argparse
+import io
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+# external
+# internal
+# measure the checkout the benchmarks live in, not an installed wallpapermgr
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wallpapermgr import tarscan  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synth  # noqa: E402
+
+
+def write_longnames(path, members, fmt):
+    """ Writes an archive whose names need GNU longname/PAX headers (> 100 characters).
+    """
+    with tarfile.open(path, 'w', format=fmt) as archive_fd:
+        for i in range(members):
+            info = tarfile.TarInfo('{}/{}'.format('wallpapers/' * 10, synth.member_name(i)))
+            info.size = 1024
+            archive_fd.addfile(info, io.BytesIO(b'\0' * info.size))
+
+
+def tarfile_scan(path):
+    with tarfile.open(path, 'r:') as archive_fd:
+        members = archive_fd.getmembers()
+        return (
+            [(m.name, m.offset_data, m.size, m.type) for m in members],
+            archive_fd.offset,
+        )
+
+
+def tarscan_scan(path):
+    members = tarscan.scan_file(path)
+    return (
+        [
+            (name, offset, size, members.types[i:i + 1])
+            for (i, (name, offset, size)) in enumerate(zip(members.names, members.offsets, members.sizes))
+        ],
+        members.end,
+    )
+
+
+def best_of(repeat, fn, *args):
+    timings = []
+    for _ in range(repeat):
+        start = time.monotonic()
+        fn(*args)
+        timings.append(time.monotonic() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--members', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='wallpapermgr-bench-', dir=os.path.expanduser('~'))
+    try:
+        paths = [os.path.join(tmpdir, 'walls.tar')]
+        synth.generate(paths[0], args.members, 1024)
+        for (name, fmt) in (('gnu-longnames.tar', tarfile.GNU_FORMAT), ('pax-longnames.tar', tarfile.PAX_FORMAT)):
+            paths.append(os.path.join(tmpdir, name))
+            write_longnames(paths[-1], args.members, fmt)
+
+        print('{:>18}  {:>8}  {:>14}  {:>14}  {:>8}'.format(
+            'archive', 'members', 'tarfile/s', 'tarscan/s', 'speedup',
+        ))
+        for path in paths:
+            if tarscan_scan(path) != tarfile_scan(path):
+                raise RuntimeError('tarscan differs from tarfile: {}'.format(path))
+            # (the comparison read the archive into the page cache)
+            slow = best_of(args.repeat, tarfile_scan, path)
+            fast = best_of(args.repeat, tarscan.scan_file, path)
+            print('{:>18}  {:>8}  {:>14.0f}  {:>14.0f}  {:>7.1f}x'.format(
+                os.path.basename(path), args.members, args.members / slow, args.members / fast, slow / fast,
+            ))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
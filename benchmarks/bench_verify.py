@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+""" Measures ``--verify`` throughput (GB/s) of each archive format,
+for increasing numbers of threads.
+
+Example:
+
+    ::
+
+        python benchmarks/bench_verify.py
+        python benchmarks/bench_verify.py --members 2000 --size 2000000 --jobs 1 2 4 8
+
+"""
+# builtin
+from __future__ import absolute_import, division, print_function
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+# external
+# internal
+# measure the checkout the benchmarks live in, not an installed wallpapermgr
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wallpapermgr import storage, verify  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synth  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--members', type=int, default=500)
+    parser.add_argument('--size', type=int, default=1000000, help='mean bytes per image')
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='wallpapermgr-bench-', dir=os.path.expanduser('~'))
+    try:
+        tarpath = os.path.join(tmpdir, 'walls.tar')
+        synth.generate(tarpath, args.members, args.size, 'lognormal', compressible=0.5)
+        paths = [tarpath]
+        for dst in ('walls.zip', 'walls.tar.gz', 'walls.tar.xz', 'walls'):
+            dst = os.path.join(tmpdir, dst)
+            storage.convert(tarpath, dst)
+            paths.append(dst)
+
+        print('{:>14}  {:>6}  {:>10}  {:>10}'.format('archive', 'jobs', 'seconds', 'GB/s'))
+        for path in paths:
+            for jobs in args.jobs:
+                # first run reads the archive into the page cache
+                reports = [
+                    verify.verify_archive(path, jobs=jobs) for _ in range(args.repeat + 1)
+                ][1:]
+                best = min(reports, key=lambda r: r.seconds)
+                if best.problems:
+                    raise RuntimeError(best.summary())
+                print('{:>14}  {:>6}  {:>10.3f}  {:>10.2f}'.format(
+                    os.path.basename(path), jobs, best.seconds, best.throughput / 1e9,
+                ))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
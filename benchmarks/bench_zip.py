@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+""" Compares member listing and extraction time of tar and zip archives
+with many members. Zip reads it's central directory, tar walks every header.
+
+Example:
+
+    ::
+
+        python benchmarks/bench_zip.py
+        python benchmarks/bench_zip.py --members 10000 100000 --size 4096
+
+"""
+# builtin
+from __future__ import absolute_import, division, print_function
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+# external
+# internal
+# measure the checkout the benchmarks live in, not an installed wallpapermgr
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wallpapermgr import storage  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synth  # noqa: E402
+
+
+def clear_caches():
+    storage.ZipStorage._index_cache.clear()
+
+
+def bench(path, names, repeat):
+    def listing():
+        clear_caches()
+        storage.open_storage(path).names()
+
+    results = {
+        'list': min(timeit.repeat(listing, number=1, repeat=repeat)),
+    }
+
+    positions = (
+        ('first', names[0]),
+        ('middle', names[len(names) // 2]),
+        ('last', names[-1]),
+    )
+    for (position, name) in positions:
+        def extract_cold():
+            clear_caches()
+            storage.open_storage(path).read(name)
+
+        def extract_warm():
+            storage.open_storage(path).read(name)
+
+        results[position] = min(timeit.repeat(extract_cold, number=1, repeat=repeat))
+        extract_warm()
+        results[position + '_warm'] = min(timeit.repeat(extract_warm, number=1, repeat=repeat))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--members', type=int, nargs='*', default=[100000])
+    parser.add_argument('--size', type=int, default=2048, help='mean bytes per image')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='wallpapermgr-bench-')
+    try:
+        print('{:>8} {:>6}  {:>9}  {:>20}  {:>20}  {:>20}'.format(
+            'members', 'format', 'list(ms)',
+            'first(ms) cold/warm', 'middle(ms) cold/warm', 'last(ms) cold/warm',
+        ))
+        for members in args.members:
+            for ext in ('tar', 'zip'):
+                path = os.path.join(tmpdir, 'walls-{}.{}'.format(members, ext))
+                names = synth.generate(path, members, args.size, 'lognormal')
+                results = bench(path, names, args.repeat)
+                print('{:>8} {:>6}  {:>9.1f}  {:>20}  {:>20}  {:>20}'.format(
+                    members, ext, results['list'] * 1000, *[
+                        '{:.2f}/{:.2f}'.format(
+                            results[position] * 1000,
+                            results[position + '_warm'] * 1000,
+                        )
+                        for position in ('first', 'middle', 'last')
+                    ]
+                ))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,430 @@
+#!/usr/bin/env python
+""" Benchmark suite for wallpapermgr's hot paths, using synthetic archives
+(see ``synth.py`` ). Results are written as json, so they can be compared
+between commits.
+
+Benchmarks run against a scratch ``$HOME`` / ``$XDG_*`` , your own
+config/datafile/server are never touched.
+
+Example:
+
+    ::
+
+        python benchmarks/run.py -o before.json
+        git checkout my-branch
+        python benchmarks/run.py -o after.json --compare before.json
+
+        python benchmarks/run.py --only scan extract --members 1000 20000
+
+"""
+# builtin
+from __future__ import absolute_import, division, print_function
+import argparse
+import collections
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+# external
+# internal
+
+# measure the checkout the benchmarks live in, not an installed wallpapermgr
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_root)
+import synth  # noqa: E402
+
+
+class Env(object):
+    """ Scratch home directory, config and synthetic archives shared by benchmarks.
+    """
+    def __init__(self, args):
+        self.args = args
+        self.root = tempfile.mkdtemp(prefix='wallpapermgr-bench-')
+        self.home = os.path.join(self.root, 'home')
+        self.archives = {}  # {name: [member, ...]}
+        os.makedirs(os.path.join(self.home, 'walls'))
+
+        # wallpapermgr reads XDG paths on import
+        os.environ['HOME'] = self.home
+        os.environ['XDG_CONFIG_HOME'] = os.path.join(self.root, 'config')
+        os.environ['XDG_DATA_HOME'] = os.path.join(self.root, 'data')
+        os.environ['PYTHONPATH'] = os.pathsep.join(
+            [repo_root] + [p for p in [os.environ.get('PYTHONPATH')] if p]
+        )
+
+        for members in args.members:
+            name = 'walls_{}'.format(members)
+            self.archives[name] = synth.generate(
+                self.archive_path(name), members, args.size, args.dist
+            )
+        self.write_config()
+
+    def archive_path(self, name):
+        return os.path.join(self.home, 'walls', '{}.tar'.format(name))
+
+    def write_config(self, extra_archives=None):
+        lines = [
+            "choose_archive_cmd: ['echo', '{}']".format(sorted(self.archives)[0]),
+            "show_wallpaper_cmd: ['true', '${wallpaper}']",
+            "change_interval: 3600",
+            "auto_reload: False",
+            "archives:",
+        ]
+        archives = dict((name, self.archive_path(name)) for name in self.archives)
+        archives.update(extra_archives or {})
+        for name in sorted(archives):
+            lines.extend([
+                '   {}:'.format(name),
+                '      archive:   {}'.format(archives[name]),
+                '      gitroot:   {}'.format(os.path.dirname(archives[name])),
+                '      gitsource: file:///dev/null',
+                '      desc:      "synthetic"',
+            ])
+
+        configdir = os.path.join(os.environ['XDG_CONFIG_HOME'], 'wallpapermgr')
+        if not os.path.isdir(configdir):
+            os.makedirs(configdir)
+        with open(os.path.join(configdir, 'config2.yml'), 'w') as fd:
+            fd.write('\n'.join(lines) + '\n')
+
+        from wallpapermgr import datafile
+        cachepath = datafile.Config().cachepath
+        if os.path.isfile(cachepath):
+            os.remove(cachepath)
+
+    def cleanup(self):
+        shutil.rmtree(self.root)
+
+
+def summarize(times):
+    """ Returns min/median/max of a list of durations, in seconds.
+    """
+    return {
+        'min': min(times),
+        'median': statistics.median(times),
+        'max': max(times),
+    }
+
+
+def bench_scan(env):
+    """ ``Data.reload_archive`` time, and peak memory allocated while scanning.
+    """
+    from wallpapermgr import datafile
+    config = datafile.Config()
+    results = {}
+    for archive in sorted(env.archives, key=lambda a: len(env.archives[a])):
+        data = datafile.Data(os.path.join(env.root, 'scan.json'))
+        times = timeit.repeat(
+            lambda: data.reload_archive(config, archive),
+            number=1, repeat=env.args.repeat,
+        )
+
+        tracemalloc.start()
+        data.reload_archive(config, archive)
+        (_, peak) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        result = summarize(times)
+        result['peak_bytes'] = peak
+        results['members={}'.format(len(env.archives[archive]))] = result
+    return results
+
+
+def bench_extract(env):
+    """ ``extract_wallpaper`` latency, by position of member in archive.
+    """
+    from wallpapermgr import datafile, display, storage
+    config = datafile.Config()
+    data = datafile.Data()
+    data.reload_archive(config)
+
+    wallpaper_dir = os.path.dirname(display.Server.wallpaperfile)
+    if not os.path.isdir(wallpaper_dir):
+        os.makedirs(wallpaper_dir)
+
+    results = {}
+    for archive in sorted(env.archives, key=lambda a: len(env.archives[a])):
+        members = env.archives[archive]
+        data.data['archives'][archive]['sequence'] = list(members)  # archive order
+        positions = (
+            ('first', 0),
+            ('middle', len(members) // 2),
+            ('last', len(members) - 1),
+        )
+        for (position, index) in positions:
+            times = timeit.repeat(
+                lambda: display.extract_wallpaper(config, data, archive, index),
+                number=1, repeat=env.args.repeat,
+            )
+            results['members={} position={}'.format(len(members), position)] = summarize(times)
+
+            # through the server's shared memory-map (mapped, and indexed, once)
+            mappings = storage.MappingCache()
+            display.extract_wallpaper(config, data, archive, index, mappings=mappings)
+            times = timeit.repeat(
+                lambda: display.extract_wallpaper(config, data, archive, index, mappings=mappings),
+                number=1, repeat=env.args.repeat,
+            )
+            mappings.close()
+            results['members={} position={} mapped'.format(len(members), position)] = summarize(times)
+    return results
+
+
+def bench_display(env):
+    """ ``Server.display`` end to end (extraction, no-op display backend, prefetch).
+    """
+    from wallpapermgr import backends, display, metrics
+    results = {}
+    srv = display.Server(backend=backends.FakeBackend())
+    try:
+        for archive in sorted(env.archives, key=lambda a: len(env.archives[a])):
+            metrics.registry.reset()
+            times = []
+            for index in range(min(env.args.repeat, srv.data.archive_len(archive))):
+                start = time.monotonic()
+                srv.display(archive, index)
+                times.append(time.monotonic() - start)
+                time.sleep(env.args.display_pause)  # time for prefetch to finish
+
+            result = summarize(times)
+            result['prefetch_hits'] = metrics.registry.counter('prefetch_total', result='hit').value
+            results['members={}'.format(len(env.archives[archive]))] = result
+    finally:
+        time.sleep(env.args.display_pause)
+        srv.server_close()
+        if os.path.exists(srv.sockfile):
+            os.unlink(srv.sockfile)
+    return results
+
+
+def bench_cli(env):
+    """ Cold start of ``wallmgr next`` (new interpreter) against a running server.
+    """
+    from wallpapermgr import backends, display
+    srv = display.Server(backend=backends.FakeBackend())
+    thread = threading.Thread(target=srv.serve_forever)
+    thread.start()
+    try:
+        time.sleep(0.5)
+        commands = (
+            ('import', [sys.executable, '-c', 'import wallpapermgr.cli']),
+            ('next', [
+                sys.executable, '-c',
+                'from wallpapermgr.cli import CommandlineInterface; CommandlineInterface.show()',
+                'next',
+            ]),
+        )
+        results = {}
+        for (name, cmds) in commands:
+            times = timeit.repeat(
+                lambda: subprocess.check_call(cmds, stdout=subprocess.DEVNULL),
+                number=1, repeat=env.args.repeat,
+            )
+            results[name] = summarize(times)
+        return results
+    finally:
+        srv.shutdown()
+        thread.join()
+
+
+def bench_datafile(env):
+    """ ``Data.write`` / ``Data.read`` with large sequences.
+    """
+    from wallpapermgr import datafile
+    results = {}
+    for members in sorted(set(env.args.members + [100000])):
+        filepath = os.path.join(env.root, 'datafile-{}.json'.format(members))
+        data = datafile.Data(filepath)
+        contents = {'archives': {
+            'walls': {
+                'last_index': 0,
+                'sequence': [synth.member_name(i) for i in range(members)],
+            },
+        }}
+        write_times = timeit.repeat(
+            lambda: data.write(contents), number=1, repeat=env.args.repeat
+        )
+        read_times = timeit.repeat(
+            lambda: datafile.Data(filepath).read(), number=1, repeat=env.args.repeat
+        )
+        results['members={}'.format(members)] = {
+            'write': summarize(write_times),
+            'read': summarize(read_times),
+            'file_bytes': os.path.getsize(filepath),
+        }
+    return results
+
+
+def bench_add(env):
+    """ ``Archive.add`` throughput (storage write + git commit), one image per add.
+    """
+    from wallpapermgr import datafile
+    gitroot = os.path.join(env.home, 'addrepo')
+    imagedir = os.path.join(env.root, 'add-images')
+    os.makedirs(gitroot)
+    os.makedirs(imagedir)
+
+    def git(*args):
+        subprocess.check_call(
+            ['git', '-C', gitroot] + list(args),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+
+    git('init', '-q')
+    git('config', 'user.name', 'bench')
+    git('config', 'user.email', 'bench@localhost')
+    git('config', 'gc.auto', '0')
+
+    archives = {
+        'add_tar': os.path.join(gitroot, 'add_tar.tar'),
+        'add_loose': os.path.join(gitroot, 'add_loose'),
+    }
+    for path in archives.values():
+        synth.generate(path, env.args.members[0], env.args.size, env.args.dist)
+    git('add', '-A')
+    git('commit', '-q', '-m', 'initial')
+    env.write_config(extra_archives=archives)
+
+    results = {}
+    try:
+        for name in sorted(archives):
+            archive = datafile.Archive(name)
+            sizes = synth.member_sizes(env.args.adds, env.args.size, env.args.dist, seed=1)
+            filepaths = []
+            for (i, size) in enumerate(sizes):
+                filepath = os.path.join(imagedir, '{}-{:05d}.jpg'.format(name, i))
+                with open(filepath, 'wb') as fd:
+                    fd.write(os.urandom(size))
+                filepaths.append(filepath)
+
+            times = []
+            for filepath in filepaths:
+                start = time.monotonic()
+                archive.add([filepath], push=False)
+                times.append(time.monotonic() - start)
+
+            result = summarize(times)
+            result['images_per_second'] = len(times) / sum(times)
+            result['bytes_per_second'] = sum(sizes) / sum(times)
+            results['format={}'.format(name.split('_')[-1])] = result
+    finally:
+        env.write_config()
+    return results
+
+
+benchmarks = collections.OrderedDict([
+    ('scan', bench_scan),
+    ('extract', bench_extract),
+    ('display', bench_display),
+    ('cli', bench_cli),
+    ('datafile', bench_datafile),
+    ('add', bench_add),
+])
+
+
+def git_revision():
+    try:
+        revision = subprocess.check_output(
+            ['git', '-C', repo_root, 'rev-parse', 'HEAD'],
+            universal_newlines=True, stderr=subprocess.DEVNULL,
+        ).strip()
+        dirty = subprocess.check_output(
+            ['git', '-C', repo_root, 'status', '--porcelain', '--untracked-files=no'],
+            universal_newlines=True, stderr=subprocess.DEVNULL,
+        ).strip()
+    except(subprocess.CalledProcessError, OSError):
+        return None
+    return revision + ('-dirty' if dirty else '')
+
+
+def flatten(results, prefix=''):
+    """ Returns ``{'scan.members=1000.median': 0.0123, ...}``
+    """
+    flat = collections.OrderedDict()
+    for key in results:
+        name = '{}.{}'.format(prefix, key) if prefix else key
+        if isinstance(results[key], dict):
+            flat.update(flatten(results[key], name))
+        else:
+            flat[name] = results[key]
+    return flat
+
+
+def compare(old, new):
+    """ Returns a table comparing every metric in two result files.
+    """
+    old = flatten(old['results'])
+    new = flatten(new['results'])
+    lines = ['{:<60} {:>14} {:>14} {:>8}'.format('metric', 'old', 'new', 'new/old')]
+    for key in new:
+        if key not in old:
+            continue
+        ratio = new[key] / old[key] if old[key] else float('nan')
+        lines.append('{:<60} {:>14.6g} {:>14.6g} {:>7.2f}x'.format(
+            key, old[key], new[key], ratio
+        ))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--only', nargs='*', choices=list(benchmarks), help='benchmarks to run')
+    parser.add_argument('--members', type=int, nargs='*', default=[1000, 10000],
+                        help='members in each synthetic archive')
+    parser.add_argument('--size', type=int, default=16 * 1024, help='mean member size (bytes)')
+    parser.add_argument('--dist', choices=synth.distributions, default='lognormal')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--adds', type=int, default=10, help='number of add+commits')
+    parser.add_argument('--display-pause', type=float, default=0.1,
+                        help='seconds between displays (prefetch)')
+    parser.add_argument('-o', '--output', help='write results to this json file')
+    parser.add_argument('--compare', help='json results of a previous run')
+    args = parser.parse_args()
+
+    env = Env(args)
+    try:
+        results = collections.OrderedDict()
+        for name in (args.only or benchmarks):
+            print('running {} ...'.format(name), file=sys.stderr)
+            start = time.monotonic()
+            results[name] = benchmarks[name](env)
+            print('  done ({:.1f}s)'.format(time.monotonic() - start), file=sys.stderr)
+    finally:
+        env.cleanup()
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.datetime.now().isoformat(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump(report, fd, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r') as fd:
+            print(compare(json.load(fd), report))
+    else:
+        for (key, value) in flatten(results).items():
+            print('{:<60} {:>14.6g}'.format(key, value))
+
+
+if __name__ == '__main__':
+    main()
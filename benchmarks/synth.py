@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+""" Generates synthetic wallpaper archives for benchmarks.
+
+Member contents are random (incompressible, like jpg) unless ``--compressible``
+is used, sizes follow a configurable distribution.
+
+Example:
+
+    ::
+
+        python benchmarks/synth.py /tmp/walls.tar --members 10000 --size 500000
+        python benchmarks/synth.py /tmp/walls.tar --members 500 --dist lognormal
+        python benchmarks/synth.py /tmp/walls --members 500   # loose-file archive
+        python benchmarks/synth.py /tmp/walls.tar.gz --members 500 --compressible 0.3
+        python benchmarks/synth.py /tmp/walls.zip --members 100000 --size 4096
+
+"""
+# builtin
+from __future__ import absolute_import, division, print_function
+import argparse
+import io
+import math
+import os
+import random
+import shutil
+import tarfile
+import tempfile
+import zipfile
+# external
+# internal
+from wallpapermgr import storage
+
+
+distributions = ('fixed', 'uniform', 'lognormal')
+
+
+def member_sizes(count, size, dist='fixed', seed=0):
+    """ Returns `count` member sizes, averaging roughly `size` bytes.
+
+    Args:
+        dist (str):
+            ``fixed``     every member is `size`
+            ``uniform``   between 0.5x and 1.5x `size`
+            ``lognormal`` mostly near `size` , with a long tail of large images
+    """
+    rand = random.Random(seed)
+    if dist == 'fixed':
+        return [size] * count
+    if dist == 'uniform':
+        return [rand.randint(size // 2, size * 3 // 2) for _ in range(count)]
+    if dist == 'lognormal':
+        sigma = 0.75
+        mu = math.log(size) - (sigma ** 2) / 2  # mean of distribution is `size`
+        return [max(1, int(rand.lognormvariate(mu, sigma))) for _ in range(count)]
+    raise RuntimeError('invalid distribution: "{}"'.format(dist))
+
+
+def member_name(index):
+    return 'wallhaven-{:07d}.jpg'.format(index)
+
+
+def _payload(rand, size, block, compressible=0.0):
+    # slicing a shared random block is much faster than generating every byte
+    offset = rand.randint(0, len(block) - 1)
+    random_size = int(size * (1 - compressible))
+    data = (block[offset:] + block[:offset]) * (random_size // len(block) + 1)
+    return data[:random_size] + b'\0' * (size - random_size)
+
+
+def generate(path, members=1000, size=200 * 1024, dist='fixed', seed=0, compressible=0.0):
+    """ Writes an archive at `path` .
+    The format is chosen by :py:func:`wallpapermgr.storage.storage_type` .
+
+    Args:
+        compressible (float):
+            fraction of each member that is zeros (0 is incompressible, like jpg)
+
+    Returns:
+        list: names of members, in the order they were added.
+    """
+    path = os.path.expanduser(path)
+    if os.path.exists(path):
+        raise RuntimeError('path already exists: "{}"'.format(path))
+
+    rand = random.Random(seed)
+    block = bytes(bytearray(rand.getrandbits(8) for _ in range(64 * 1024)))
+    sizes = member_sizes(members, size, dist, seed)
+    names = [member_name(i) for i in range(members)]
+
+    if storage.storage_type(path) is storage.TarStorage:
+        with tarfile.open(path, 'w') as archive_fd:
+            for (name, member_size) in zip(names, sizes):
+                info = tarfile.TarInfo(name)
+                info.size = member_size
+                payload = _payload(rand, member_size, block, compressible)
+                archive_fd.addfile(info, io.BytesIO(payload))
+        return names
+
+    if storage.storage_type(path) is storage.ZipStorage:
+        # one pass, adding in batches rewrites the central directory each time
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_STORED) as archive_fd:
+            for (name, member_size) in zip(names, sizes):
+                payload = _payload(rand, member_size, block, compressible)
+                archive_fd.writestr(zipfile.ZipInfo(name), payload)
+        return names
+
+    tmpdir = tempfile.mkdtemp(prefix='wallpapermgr-synth-')
+    try:
+        with storage.open_storage(path) as store:
+            for i in range(0, members, 256):
+                filepaths = []
+                for (name, member_size) in zip(names[i:i + 256], sizes[i:i + 256]):
+                    filepath = os.path.join(tmpdir, name)
+                    with open(filepath, 'wb') as fd:
+                        # unique prefix, so objects are not deduplicated
+                        fd.write(name.encode() + _payload(rand, member_size, block, compressible))
+                    filepaths.append(filepath)
+                store.add(filepaths)
+                for filepath in filepaths:
+                    os.remove(filepath)
+    finally:
+        shutil.rmtree(tmpdir)
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('path', help='archive to create (.tar, .tar.gz, .tar.xz, .zip, or directory for loose-files)')
+    parser.add_argument('--members', type=int, default=1000)
+    parser.add_argument('--size', type=int, default=200 * 1024, help='mean member size (bytes)')
+    parser.add_argument('--dist', choices=distributions, default='fixed')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compressible', type=float, default=0.0,
+                        help='fraction of each member that compresses away (0-1)')
+    args = parser.parse_args()
+
+    generate(args.path, args.members, args.size, args.dist, args.seed, args.compressible)
+
+
+if __name__ == '__main__':
+    main()
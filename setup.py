@@ -58,6 +58,10 @@ setuptools.setup(
         'setuptools',
         'six',
     ],
+    extras_require={
+        # `wallmgr query` / filters evaluate metadata columns with numpy (pure python without)
+        'fast': ['numpy'],
+    },
     classifiers=[
         # windows not currently supported, using unix-domain-sockets
         'Operating System :: POSIX :: Linux',
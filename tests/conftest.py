@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+""" Fixtures creating git remotes and configs in a temporary directory.
+"""
+# builtin
+from __future__ import absolute_import, division, print_function
+import os
+import subprocess
+# external
+import pytest
+import yaml
+# internal
+from wallpapermgr import datafile
+
+
+def git(gitroot, *args):
+    """ Runs a git command in `gitroot` , returning it's stripped output.
+    """
+    return subprocess.check_output(
+        ['git', '-C', gitroot, '-c', 'user.name=test', '-c', 'user.email=test@example.com'] + list(args),
+        universal_newlines=True,
+        stderr=subprocess.STDOUT,
+    ).strip()
+
+
+@pytest.fixture
+def make_remote(tmp_path):
+    """ Returns a function creating a bare repo with `commits` commits,
+    each adding a wallpaper to ``walls.tar`` (and allowing partial clones).
+    """
+    def make_remote(name, commits=1):
+        bare = str(tmp_path / 'remotes' / '{}.git'.format(name))
+        work = str(tmp_path / 'work' / name)
+        os.makedirs(work)
+        git(work, 'init', '-q', '-b', 'master')
+        for i in range(commits):
+            with open(os.path.join(work, 'walls.tar'), 'ab') as fd:
+                fd.write(os.urandom(1024))
+            git(work, 'add', 'walls.tar')
+            git(work, 'commit', '-q', '-m', 'wallpaper {}'.format(i))
+        git(str(tmp_path), 'clone', '-q', '--bare', work, bare)
+        git(bare, 'config', 'uploadpack.allowFilter', 'true')
+        return bare
+    return make_remote
+
+
+@pytest.fixture
+def make_config(tmp_path):
+    """ Returns a function writing a config with archives ``{name: (gitroot, gitsource)}`` .
+    """
+    def make_config(archives):
+        data = {
+            'show_wallpaper_cmd': ['true', '${wallpaper}'],
+            'archives': dict(
+                (name, {
+                    'archive': os.path.join(gitroot, 'walls.tar'),
+                    'gitroot': gitroot,
+                    'gitsource': gitsource,
+                    'desc': name,
+                })
+                for (name, (gitroot, gitsource)) in archives.items()
+            ),
+        }
+        filepath = str(tmp_path / 'config2.yml')
+        with open(filepath, 'w') as fd:
+            yaml.safe_dump(data, fd)
+        return datafile.Config(filepath)
+    return make_config
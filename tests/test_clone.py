@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# builtin
+from __future__ import absolute_import, division, print_function
+import os
+# external
+import pytest
+# internal
+from wallpapermgr import datafile
+from conftest import git
+
+
+def _archive(tmp_path, make_remote, make_config, commits=3):
+    remote = make_remote('walls', commits=commits)
+    gitroot = str(tmp_path / 'checkouts' / 'walls')
+    config = make_config({'normal_walls': (gitroot, remote)})
+    return datafile.Archive('normal_walls', config=config)
+
+
+def _is_shallow(gitroot):
+    return git(gitroot, 'rev-parse', '--is-shallow-repository') == 'true'
+
+
+def _commits(gitroot):
+    return int(git(gitroot, 'rev-list', '--count', 'HEAD'))
+
+
+def test_clone_cmd_uses_file_url_for_local_paths(tmp_path, make_remote, make_config):
+    archive = _archive(tmp_path, make_remote, make_config, commits=1)
+
+    assert archive.clone_cmd() == ['git', 'clone', archive.gitsource, archive.gitroot]
+    assert archive.clone_cmd(depth=1, blobless=True) == [
+        'git', 'clone', '--depth', '1', '--filter=blob:none',
+        'file://{}'.format(archive.gitsource), archive.gitroot,
+    ]
+
+
+def test_clone_full(tmp_path, make_remote, make_config):
+    archive = _archive(tmp_path, make_remote, make_config)
+
+    assert archive.clone()
+    assert not _is_shallow(archive.gitroot)
+    assert _commits(archive.gitroot) == 3
+
+
+def test_clone_shallow_blobless(tmp_path, make_remote, make_config):
+    archive = _archive(tmp_path, make_remote, make_config)
+
+    assert archive.clone(depth=1, blobless=True)
+    assert _is_shallow(archive.gitroot)
+    assert _commits(archive.gitroot) == 1
+    assert git(archive.gitroot, 'config', 'remote.origin.promisor') == 'true'
+    assert git(archive.gitroot, 'config', 'remote.origin.partialclonefilter') == 'blob:none'
+    assert os.path.isfile(archive.filepath)
+
+
+def test_prune_history(tmp_path, make_remote, make_config):
+    archive = _archive(tmp_path, make_remote, make_config)
+    archive.clone()
+
+    archive.prune_history(depth=1)
+    assert _is_shallow(archive.gitroot)
+    assert _commits(archive.gitroot) == 1
+    assert os.path.isfile(archive.filepath)
+
+
+def test_prune_history_refuses_unpushed_commits(tmp_path, make_remote, make_config):
+    archive = _archive(tmp_path, make_remote, make_config)
+    archive.clone()
+    git(archive.gitroot, 'commit', '-q', '--allow-empty', '-m', 'unpushed')
+
+    with pytest.raises(RuntimeError):
+        archive.prune_history(depth=1)
+    assert not _is_shallow(archive.gitroot)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# builtin
+from __future__ import absolute_import, division, print_function
+import io
+import os
+import tarfile
+import threading
+# external
+import pytest
+import xdg.BaseDirectory
+import yaml
+# internal
+from wallpapermgr import backends, display, metrics
+
+_delay = 0.05  # seconds FakeBackend takes to display a wallpaper
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """ Runs a :py:class:`wallpapermgr.display.Server` displaying to a
+    :py:class:`wallpapermgr.backends.FakeBackend` , in `tmp_path` .
+
+    Yields:
+        tuple: ``(server, backend)``
+    """
+    # Server's paths are resolved when wallpapermgr.display is imported
+    monkeypatch.setattr(xdg.BaseDirectory, 'xdg_data_home', str(tmp_path / 'data'))
+    monkeypatch.setattr(xdg.BaseDirectory, 'xdg_config_home', str(tmp_path / 'config'))
+    monkeypatch.delenv('XDG_RUNTIME_DIR', raising=False)
+    datadir = xdg.BaseDirectory.save_data_path('wallpapermgr')
+    for (attr, filename) in (
+            ('sockfile', 'wallpapermgr.sock'),
+            ('historyfile', 'history'),
+            ('jobsfile', 'jobs.json'),
+            ('metadatadir', 'metadata')):
+        monkeypatch.setattr(display.Server, attr, os.path.join(datadir, filename))
+
+    walls = str(tmp_path / 'walls.tar')
+    with tarfile.open(walls, 'w') as archive_fd:
+        for i in range(4):
+            data = os.urandom(256)
+            info = tarfile.TarInfo('wall{}.png'.format(i))
+            info.size = len(data)
+            archive_fd.addfile(info, io.BytesIO(data))
+    config = {
+        'choose_archive_cmd': ['echo', 'normal_walls'],
+        'show_wallpaper_cmd': ['true', '${wallpaper}'],
+        'change_interval': 0,
+        'auto_reload': False,
+        'archives': {
+            'normal_walls': {
+                'archive': walls,
+                'gitroot': str(tmp_path),
+                'gitsource': str(tmp_path),
+                'desc': 'normal_walls',
+            },
+        },
+    }
+    configfile = os.path.join(xdg.BaseDirectory.save_config_path('wallpapermgr'), 'config2.yml')
+    with open(configfile, 'w') as fd:
+        yaml.safe_dump(config, fd)
+
+    metrics.registry.reset()
+    backend = backends.FakeBackend(delay=_delay)
+    srv = display.Server(backend=backend)
+    thread = threading.Thread(target=srv.serve_forever)
+    thread.start()
+    try:
+        yield (srv, backend)
+    finally:
+        srv.shutdown()
+        thread.join(10)
+        assert not thread.is_alive()
+
+
+def _request(command):
+    return display.Server.request(command).decode()
+
+
+def test_next_prev(server):
+    (srv, backend) = server
+    start = srv.current_index
+
+    assert _request('next') == 'displaying normal_walls({})'.format(start + 1)
+    assert srv.current_index == start + 1
+    assert backend.calls == 1
+
+    # prev/next walk the history, without moving the output's position in it's sequence
+    assert _request('prev') == 'displaying normal_walls({})'.format(start)
+    assert _request('next') == 'displaying normal_walls({})'.format(start + 1)
+    assert srv.current_index == start + 1
+
+    assert _request('next') == 'displaying normal_walls({})'.format(start + 2)
+    assert srv.current_index == start + 2
+    assert backend.calls == 4
+    assert _request('next missing') == 'no output named: "missing"'
+
+
+def test_interval(server):
+    (srv, backend) = server
+    assert not backend.wait(1, timeout=1.5)
+
+    assert _request('interval 1') == 'setting display interval to 1s'
+    assert backend.wait(2, timeout=10)
+
+    srv.set_change_interval(0)
+    with pytest.raises(TypeError):
+        srv.set_change_interval('1')
+
+
+def test_display_latency(server):
+    (srv, backend) = server
+    for _ in range(3):
+        _request('next')
+    assert backend.calls == 3
+
+    total = metrics.registry.histogram('display_seconds', stage='total')
+    show = metrics.registry.histogram('display_seconds', stage='show')
+    assert total.count == show.count == 3
+    assert show.min >= _delay
+    assert total.max >= show.max
+    assert 'display_seconds' in _request('stats')
+
+
+def test_filter_before_metadata(server):
+    # metadata is read while idle, after the server started
+    assert _request('filter width>0').startswith('metadata not ready: ')
+    assert _request('filter') == 'no filters'
+
+    # names are matched without metadata
+    assert _request('filter name~wall1') == 'normal_walls: 1 of 4 wallpapers match name~wall1'
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# builtin
+from __future__ import absolute_import, division, print_function
+import io
+import os
+import shutil
+import tarfile
+import zipfile
+# external
+import pytest
+# internal
+from wallpapermgr import storage
+
+
+def _wallpapers(tmp_path, count=3):
+    """ Returns ``{name: data}`` of wallpapers written to ``tmp_path/new/`` , and their paths.
+    """
+    dirpath = tmp_path / 'new'
+    dirpath.mkdir()
+    wallpapers = {}
+    for i in range(count):
+        name = 'wallhaven-{}.png'.format(474183 + i)
+        wallpapers[name] = os.urandom(700 + 900 * i)
+        (dirpath / name).write_bytes(wallpapers[name])
+    return (wallpapers, sorted(str(dirpath / name) for name in wallpapers))
+
+
+def _extracted(store, name, tmp_path):
+    filepath = str(tmp_path / 'extracted')
+    assert store.extract(name, filepath) == store.size(name)
+    with open(filepath, 'rb') as fd:
+        return fd.read()
+
+
+def _round_trip(store, tmp_path):
+    """ add -> extract -> remove -> list.
+    """
+    (wallpapers, filepaths) = _wallpapers(tmp_path)
+    names = sorted(wallpapers)
+
+    store.add(filepaths[:2])
+    store.add(filepaths[2:])
+    assert store.names() == names
+    for name in names:
+        assert _extracted(store, name, tmp_path) == wallpapers[name]
+        assert store.read(name) == wallpapers[name]
+
+    store.remove([names[1]])
+    assert store.names() == [names[0], names[2]]
+    for name in (names[0], names[2]):
+        assert store.read(name) == wallpapers[name]
+    with pytest.raises(RuntimeError):
+        store.read(names[1])
+    with pytest.raises(RuntimeError):
+        store.remove([names[1]])
+    return wallpapers
+
+
+@pytest.mark.parametrize('ext', ['.tar.gz', '.tar.xz'])
+def test_compressed_round_trip(tmp_path, ext):
+    path = str(tmp_path / 'normal_walls{}'.format(ext))
+    store = storage.open_storage(path)
+    assert isinstance(store, storage.CompressedStorage)
+
+    wallpapers = _round_trip(store, tmp_path)
+    assert os.path.isfile(store.index_path)
+    assert store.verify(store.names())[1] == {}
+
+    # still a valid .tar.gz/.tar.xz
+    with tarfile.open(path) as archive_fd:
+        assert archive_fd.getnames() == store.names()
+        for name in store.names():
+            assert archive_fd.extractfile(name).read() == wallpapers[name]
+
+
+def test_compressed_missing_index(tmp_path):
+    path = str(tmp_path / 'normal_walls.tar.gz')
+    store = storage.open_storage(path)
+    (wallpapers, filepaths) = _wallpapers(tmp_path)
+    store.add(filepaths)
+
+    os.remove(store.index_path)
+    store = storage.open_storage(path)
+    assert store.names() == sorted(wallpapers)
+    assert os.path.isfile(store.index_path)
+    for name in wallpapers:
+        assert store.read(name) == wallpapers[name]
+
+
+def test_compressed_stale_index(tmp_path):
+    path = str(tmp_path / 'normal_walls.tar.gz')
+    store = storage.open_storage(path)
+    (wallpapers, filepaths) = _wallpapers(tmp_path)
+    store.add(filepaths[:1])
+    stale = str(tmp_path / 'stale.idx')
+    shutil.copy(store.index_path, stale)
+    store.add(filepaths[1:])
+
+    # (ex: the archive was pulled, but not it's index)
+    shutil.copy(stale, store.index_path)
+    store = storage.open_storage(path)
+    assert store.names() == sorted(wallpapers)
+    for name in wallpapers:
+        assert store.read(name) == wallpapers[name]
+
+    # removing rewrites the archive from it's frames, not the stale index
+    shutil.copy(stale, store.index_path)
+    store.remove([sorted(wallpapers)[0]])
+    assert store.names() == sorted(wallpapers)[1:]
+
+
+def test_compressed_single_stream(tmp_path):
+    # (ex: tar -czf), readable but not appendable
+    (wallpapers, filepaths) = _wallpapers(tmp_path)
+    path = str(tmp_path / 'normal_walls.tar.gz')
+    with tarfile.open(path, 'w:gz') as archive_fd:
+        for filepath in filepaths:
+            archive_fd.add(filepath, os.path.basename(filepath))
+
+    store = storage.open_storage(path)
+    assert store.names() == sorted(wallpapers)
+    for name in wallpapers:
+        assert _extracted(store, name, tmp_path) == wallpapers[name]
+    added = tmp_path / 'added.png'
+    added.write_bytes(os.urandom(100))
+    with pytest.raises(RuntimeError, match='one member per frame'):
+        store.add([str(added)])
+
+
+class _Unseekable(io.RawIOBase):
+    """ A write-only stream, zipfile writes a data descriptor after each member.
+    """
+    def __init__(self, fd):
+        self.fd = fd
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.fd.write(data)
+
+
+def test_zip_round_trip(tmp_path):
+    path = str(tmp_path / 'normal_walls.zip')
+    store = storage.open_storage(path)
+    assert isinstance(store, storage.ZipStorage)
+
+    wallpapers = _round_trip(store, tmp_path)
+    assert store.verify(store.names())[1] == {}
+    with zipfile.ZipFile(path) as archive_fd:
+        assert archive_fd.testzip() is None
+        assert archive_fd.namelist() == store.names()
+        for name in store.names():
+            assert archive_fd.read(name) == wallpapers[name]
+
+
+@pytest.mark.parametrize('compression', [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+def test_zip_data_descriptor(tmp_path, compression):
+    (wallpapers, filepaths) = _wallpapers(tmp_path)
+    path = str(tmp_path / 'normal_walls.zip')
+    with open(path, 'wb') as fd:
+        with zipfile.ZipFile(_Unseekable(fd), 'w', compression=compression) as archive_fd:
+            for filepath in filepaths:
+                archive_fd.write(filepath, os.path.basename(filepath))
+    with zipfile.ZipFile(path) as archive_fd:
+        assert all(info.flag_bits & 0x08 for info in archive_fd.infolist())
+
+    store = storage.open_storage(path)
+    names = sorted(wallpapers)
+    assert store.names() == names
+    for name in names:
+        assert _extracted(store, name, tmp_path) == wallpapers[name]
+
+    store.remove([names[0]])
+    assert store.names() == names[1:]
+    for name in names[1:]:
+        assert store.read(name) == wallpapers[name]
+    assert store.verify(store.names())[1] == {}
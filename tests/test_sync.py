@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# builtin
+from __future__ import absolute_import, division, print_function
+import collections
+import io
+import os
+# external
+# internal
+from wallpapermgr import sync
+from conftest import git
+
+
+def _archives(tmp_path, make_remote):
+    # normal_walls and wide_walls share a gitroot
+    shared = make_remote('shared')
+    single = make_remote('single')
+    checkouts = str(tmp_path / 'checkouts')
+    return {
+        'normal_walls': (os.path.join(checkouts, 'shared'), shared),
+        'wide_walls': (os.path.join(checkouts, 'shared'), shared),
+        'other_walls': (os.path.join(checkouts, 'single'), single),
+    }
+
+
+def _record_git(monkeypatch):
+    calls = []
+    run_git = sync._git
+
+    def record(gitroot, *args):
+        calls.append((gitroot,) + args)
+        return run_git(gitroot, *args)
+    monkeypatch.setattr(sync, '_git', record)
+    return calls
+
+
+def test_group_by_gitroot(tmp_path, make_remote, make_config):
+    archives = _archives(tmp_path, make_remote)
+    config = make_config(archives)
+
+    groups = sync.group_by_gitroot(config)
+    assert sorted(groups) == sorted(set(gitroot for (gitroot, _) in archives.values()))
+    assert sorted(groups[archives['normal_walls'][0]]) == ['normal_walls', 'wide_walls']
+
+
+def test_sync_clones_each_repo_once(tmp_path, make_remote, make_config, monkeypatch):
+    archives = _archives(tmp_path, make_remote)
+    config = make_config(archives)
+    calls = _record_git(monkeypatch)
+
+    results = sync.sync(config, 'pull', out=io.StringIO())
+    assert results == dict((gitroot, None) for (gitroot, _) in archives.values())
+
+    clones = collections.Counter(call[-1] for call in calls if call[1] == 'clone')
+    assert clones == collections.Counter(set(gitroot for (gitroot, _) in archives.values()))
+    for (gitroot, _) in archives.values():
+        assert os.path.isfile(os.path.join(gitroot, 'walls.tar'))
+
+
+def test_sync_pulls_each_repo_once(tmp_path, make_remote, make_config, monkeypatch):
+    archives = _archives(tmp_path, make_remote)
+    config = make_config(archives)
+    sync.sync(config, 'pull', out=io.StringIO())
+
+    # a new commit in the shared repo
+    (shared_root, shared_remote) = archives['normal_walls']
+    work = str(tmp_path / 'work' / 'shared')
+    git(work, 'commit', '-q', '--allow-empty', '-m', 'new wallpapers')
+    git(work, 'push', '-q', shared_remote, 'master')
+
+    calls = _record_git(monkeypatch)
+    out = io.StringIO()
+    results = sync.sync(config, 'pull', out=out)
+    assert all(exc is None for exc in results.values())
+
+    pulls = collections.Counter(call[0] for call in calls if call[1] == 'pull')
+    assert pulls == collections.Counter(set(gitroot for (gitroot, _) in archives.values()))
+    assert git(shared_root, 'log', '-1', '--format=%s') == 'new wallpapers'
+    assert out.getvalue().count('pull {} '.format(shared_root)) == 1
+
+
+def test_sync_reports_failed_repos(tmp_path, make_remote, make_config):
+    archives = _archives(tmp_path, make_remote)
+    config = make_config(archives)
+    sync.sync(config, 'pull', out=io.StringIO())
+
+    # untracked files prevent pulling one repo, the other is still synchronized
+    (single_root, _) = archives['other_walls']
+    with open(os.path.join(single_root, 'untracked.png'), 'wb') as fd:
+        fd.write(b'png')
+
+    results = sync.sync(config, 'pull', out=io.StringIO())
+    assert isinstance(results[single_root], RuntimeError)
+    assert results[archives['normal_walls'][0]] is None
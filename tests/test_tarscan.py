@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# builtin
+from __future__ import absolute_import, division, print_function
+import io
+import tarfile
+# external
+import pytest
+# internal
+from wallpapermgr import tarscan
+
+_longname = '{}/{}.png'.format('d' * 90, 'wallpaper-' * 8)  # (ustar prefix/name)
+_members = (
+    ('wallhaven-474183.png', 10),
+    (_longname, 700),
+    ('empty.jpg', 0),
+    ('wallhaven-581722.jpg', 1500),
+)
+
+
+def _archive(tar_format, members=_members):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w', format=tar_format) as archive_fd:
+        for (name, size) in members:
+            info = tarfile.TarInfo(name)
+            info.size = size
+            archive_fd.addfile(info, io.BytesIO(b'x' * size))
+    return buf.getvalue()
+
+
+def _tarfile_members(data):
+    """ Returns ``(names, offsets, sizes)`` of members :py:mod:`tarfile` reads before an error.
+    """
+    members = []
+    archive_fd = tarfile.open(fileobj=io.BytesIO(data), mode='r:')
+    try:
+        while True:
+            info = archive_fd.next()
+            if info is None:
+                break
+            members.append(info)
+    except(tarfile.ReadError):
+        pass
+    return (
+        [info.name for info in members],
+        [info.offset_data for info in members],
+        [info.size for info in members],
+    )
+
+
+def _scanned(members):
+    return (members.names, list(members.offsets), list(members.sizes))
+
+
+@pytest.mark.parametrize('tar_format', [tarfile.USTAR_FORMAT, tarfile.GNU_FORMAT, tarfile.PAX_FORMAT])
+def test_matches_tarfile(tar_format):
+    data = _archive(tar_format)
+    members = tarscan.scan(data)
+
+    assert _scanned(members) == _tarfile_members(data)
+    assert members.names == [name for (name, _) in _members]
+    assert members.types == tarfile.REGTYPE * len(_members)
+    assert members.error is None
+
+    # end is where the next member is appended
+    appended = _archive(tar_format, _members + (('new.png', 20),))
+    assert tarscan.scan(appended, members.end).names == ['new.png']
+
+
+@pytest.mark.parametrize('tar_format', [tarfile.GNU_FORMAT, tarfile.PAX_FORMAT])
+def test_extended_headers(tar_format):
+    longname = 'wallpapers/{}.png'.format('long-' * 40)
+    data = _archive(tar_format, [('first.png', 1), (longname, 600), ('é.png', 2)])
+
+    members = tarscan.scan(data)
+    assert _scanned(members) == _tarfile_members(data)
+    assert members.names == ['first.png', longname, 'é.png']
+
+
+@pytest.mark.parametrize('tar_format', [tarfile.GNU_FORMAT, tarfile.PAX_FORMAT])
+def test_truncated(tar_format):
+    data = _archive(tar_format)
+    complete = tarscan.scan(data)
+
+    # in the data of the last member, and in the longname/pax header of the second
+    for (cut, count) in ((complete.offsets[-1] + 100, 4), (complete.offsets[1] - 1024 + 100, 1)):
+        members = tarscan.scan(data[:cut])
+        assert _scanned(members) == _tarfile_members(data[:cut])
+        assert members.names == complete.names[:count]
+        assert members.error is not None
+
+
+def test_not_a_tar():
+    with pytest.raises(tarfile.ReadError):
+        tarscan.scan(b'PK\x03\x04' + b'\0' * 1020)
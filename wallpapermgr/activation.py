@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+""" systemd-style socket activation.
+
+The service manager listens on the server's socket, and starts the server
+on the first connection, passing the listening socket as an inherited
+file descriptor (``LISTEN_FDS`` / ``LISTEN_PID`` ). Clients simply connect,
+they never need to spawn the server themselves.
+
+Example:
+
+    .. code-block:: python
+
+        sockets = listen_sockets()
+        if sockets:
+            server.socket = sockets[0]   # instead of binding
+
+"""
+# builtin
+from __future__ import absolute_import, division, print_function
+import logging
+import os
+import socket
+# external
+# internal
+
+
+logger = logging.getLogger(__name__)
+
+_listen_fds_start = 3  # SD_LISTEN_FDS_START
+
+
+def listen_sockets():
+    """ Returns the listening sockets passed by the service manager,
+    or an empty list if the process was not socket-activated.
+
+    The ``LISTEN_*`` environment variables are removed,
+    so they are not inherited by child processes.
+    """
+    pid = os.environ.pop('LISTEN_PID', None)
+    count = os.environ.pop('LISTEN_FDS', None)
+    os.environ.pop('LISTEN_FDNAMES', None)
+    if not pid or not count:
+        return []
+
+    try:
+        if int(pid) != os.getpid():
+            return []
+        count = int(count)
+    except(ValueError):
+        logger.warning('ignoring invalid LISTEN_PID/LISTEN_FDS: {}/{}'.format(pid, count))
+        return []
+
+    sockets = []
+    for fd in range(_listen_fds_start, _listen_fds_start + count):
+        os.set_inheritable(fd, False)
+        sockets.append(socket.socket(fileno=fd))
+    logger.debug('socket-activated, listening on {} inherited socket(s)'.format(len(sockets)))
+    return sockets
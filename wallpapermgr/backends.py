@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+# builtin
+from __future__ import absolute_import, division, print_function
+import importlib
+import logging
+import string
+import subprocess
+import threading
+import time
+# external
+# internal
+
+
+logger = logging.getLogger(__name__)
+
+
+class DisplayBackend(object):
+    """ Base class for objects that set the wallpaper.
+
+    Backends are created once by the :py:class:`wallpapermgr.display.Server`
+    and reused for every wallpaper change, so any expensive setup
+    (starting a process, importing a module, ...) belongs in :py:meth:`start`.
+    """
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        """ Prepare the backend. Called once before the first :py:meth:`show`.
+        """
+        pass
+
+    def show(self, filepath):
+        """ Display the wallpaper at `filepath` .
+
+        Args:
+            filepath (str): ``(ex: '/path/to/wallpaper.png')``
+                path to the wallpaper you'd like to display
+        """
+        raise NotImplementedError()
+
+    def show_outputs(self, filepaths):
+        """ Display a wallpaper on each output (monitor), at once.
+
+        Backends that can set every monitor in a single operation
+        should override this, by default :py:meth:`show` is called per output.
+
+        Args:
+            filepaths (collections.OrderedDict): ``(ex: {'left': '/path/to/a.png', 'right': '/path/to/b.png'})``
+                wallpaper to display on each output, in config order.
+        """
+        for filepath in filepaths.values():
+            self.show(filepath)
+
+    def close(self):
+        """ Release any resources held by the backend.
+        """
+        pass
+
+
+class CommandBackend(DisplayBackend):
+    """ Runs a command for every wallpaper change (default).
+
+    ``${wallpaper}`` is substituted in every argument it appears in.
+    With several outputs, ``${wallpaper}`` is the first output's wallpaper,
+    ``${wallpaper_NAME}`` is output NAME's wallpaper, and an argument
+    that is exactly ``${wallpapers}`` expands to every output's wallpaper.
+    Templates are compiled once, when the backend is created.
+
+    Example:
+
+        .. code-block:: python
+
+            backend = CommandBackend(['feh', '--bg-scale', '${wallpaper}'])
+            backend.show('/path/to/wallpaper.png')
+
+            # feh assigns one image per monitor, in order
+            backend = CommandBackend(['feh', '--bg-fill', '${wallpapers}'])
+            backend.show_outputs({'left': '/path/to/a.png', 'right': '/path/to/b.png'})
+
+    """
+    expand_arg = '${wallpapers}'
+
+    def __init__(self, cmd):
+        # args without a placeholder are stored as-is,
+        # so they do not need to be rendered on every change.
+        self.__cmd = []
+        for arg in cmd:
+            if '$' in arg:
+                self.__cmd.append(string.Template(arg))
+            else:
+                self.__cmd.append(arg)
+
+    def render(self, filepath):
+        """ Returns the command, with the wallpaper substituted in.
+
+        Args:
+            filepath (str, collections.OrderedDict):
+                a wallpaper, or the wallpaper of each output.
+
+        Returns:
+            list: ``(ex: ['feh', '--bg-scale', '/path/to/wallpaper.png'])``
+        """
+        if isinstance(filepath, dict):
+            filepaths = list(filepath.values())
+            substitutions = {
+                'wallpaper_{}'.format(output): path
+                for (output, path) in filepath.items()
+            }
+            substitutions['wallpaper'] = filepaths[0]
+        else:
+            filepaths = [filepath]
+            substitutions = {'wallpaper': filepath}
+
+        cmd = []
+        for arg in self.__cmd:
+            if not isinstance(arg, string.Template):
+                cmd.append(arg)
+            elif arg.template == self.expand_arg:
+                cmd.extend(filepaths)
+            else:
+                cmd.append(arg.safe_substitute(substitutions))
+        return cmd
+
+    def show(self, filepath):
+        subprocess.check_call(
+            self.render(filepath),
+            stdin=None, stdout=None, stderr=None
+        )
+
+    def show_outputs(self, filepaths):
+        subprocess.check_call(
+            self.render(filepaths),
+            stdin=None, stdout=None, stderr=None
+        )
+
+
+class CoprocessBackend(DisplayBackend):
+    """ Keeps a single wallpaper-setter process alive, writing
+    the path of each wallpaper to it's stdin (one path per line).
+    With several outputs, each line holds every output's wallpaper,
+    separated by tabs (in config order).
+
+    Lines are not acknowledged. Each path stays valid until the next line is
+    written (the displayed wallpaper is only deleted after the following one
+    is shown), so the process may read it whenever it is ready.
+
+    The process is restarted if it exits.
+
+    Example:
+
+        .. code-block:: python
+
+            backend = CoprocessBackend(['my-setter', '--read-stdin'])
+            backend.show('/path/to/wallpaper.png')
+
+    """
+    def __init__(self, cmd):
+        self.__cmd = list(cmd)
+        self.__proc = None
+        self.__lock = threading.Lock()
+
+    def start(self):
+        with self.__lock:
+            self._start()
+
+    def _start(self):
+        if self.__proc is not None and self.__proc.poll() is None:
+            return
+
+        if self.__proc is not None:
+            logger.warning(
+                'display coprocess exited ({}), restarting..'.format(
+                    self.__proc.returncode
+                )
+            )
+
+        logger.debug('starting display coprocess: {}'.format(self.__cmd))
+        self.__proc = subprocess.Popen(
+            self.__cmd,
+            stdin=subprocess.PIPE,
+            stdout=None, stderr=None,
+            universal_newlines=True,
+            bufsize=1,
+        )
+
+    def show(self, filepath):
+        with self.__lock:
+            self._start()
+            try:
+                self.__proc.stdin.write(filepath + '\n')
+                self.__proc.stdin.flush()
+            except(BrokenPipeError):
+                # process exited between poll() and write()
+                self.__proc.wait()
+                self._start()
+                self.__proc.stdin.write(filepath + '\n')
+                self.__proc.stdin.flush()
+
+    def show_outputs(self, filepaths):
+        self.show('\t'.join(filepaths.values()))
+
+    def close(self):
+        with self.__lock:
+            if self.__proc is None:
+                return
+
+            proc = self.__proc
+            self.__proc = None
+            try:
+                proc.stdin.close()
+            except(BrokenPipeError):
+                pass
+
+            try:
+                proc.wait(timeout=2)
+            except(subprocess.TimeoutExpired):
+                proc.terminate()
+                proc.wait()
+
+
+class CallableBackend(DisplayBackend):
+    """ Calls a python function in-process for every wallpaper change.
+    With several outputs, it is called once per change with
+    a dict of ``{output: filepath}`` .
+
+    Example:
+
+        .. code-block:: python
+
+            backend = CallableBackend('mypackage.wallpaper:set_wallpaper')
+            backend.show('/path/to/wallpaper.png')
+
+    """
+    def __init__(self, func):
+        """ Constructor.
+
+        Args:
+            func (str, callable): ``(ex: 'mypackage.wallpaper:set_wallpaper')``
+                a callable, or the import-path of one. It is called
+                with the path of the wallpaper to display.
+        """
+        self.__func = func
+
+    def start(self):
+        if callable(self.__func):
+            return
+
+        (modname, _, attr) = self.__func.partition(':')
+        if not attr:
+            raise RuntimeError(
+                'expected callable in format "module:function". '
+                'received "{}"'.format(self.__func)
+            )
+        module = importlib.import_module(modname)
+        self.__func = getattr(module, attr)
+
+    def show(self, filepath):
+        self.start()
+        self.__func(filepath)
+
+    def show_outputs(self, filepaths):
+        if len(filepaths) == 1:
+            return self.show(list(filepaths.values())[0])
+        self.start()
+        self.__func(dict(filepaths))
+
+
+class FakeBackend(DisplayBackend):
+    """ Records wallpapers instead of displaying them.
+
+    Useful to measure wallpaper-change latency without an X server.
+
+    Example:
+
+        .. code-block:: python
+
+            backend = FakeBackend()
+            server = display.Server(backend=backend)
+            server.display('normal_walls', 3)
+            backend.shown
+            >>> [('/path/to/wallpaper.png', 1565398823.52)]
+
+    """
+    def __init__(self, delay=0):
+        """ Constructor.
+
+        Args:
+            delay (float, optional):
+                simulates a slow wallpaper-setter, by sleeping
+                this many seconds on every change.
+        """
+        self.delay = delay
+        self.shown = []
+        self.calls = 0  # one per change, regardless of the number of outputs
+        self.__cond = threading.Condition()
+
+    def show(self, filepath):
+        self.show_outputs({None: filepath})
+
+    def show_outputs(self, filepaths):
+        if self.delay:
+            time.sleep(self.delay)
+
+        with self.__cond:
+            now = time.time()
+            for filepath in filepaths.values():
+                self.shown.append((filepath, now))
+            self.calls += 1
+            self.__cond.notify_all()
+
+    def wait(self, count=1, timeout=None):
+        """ Blocks until at least `count` wallpapers have been shown.
+
+        Returns:
+            bool: False if `timeout` expired first.
+        """
+        with self.__cond:
+            return self.__cond.wait_for(
+                lambda: len(self.shown) >= count, timeout
+            )
+
+
+backend_types = {
+    'command': CommandBackend,
+    'coprocess': CoprocessBackend,
+    'callable': CallableBackend,
+}
+
+
+def from_config(config):
+    """ Creates the display-backend configured in `config` .
+
+    Example:
+
+        .. code-block:: yaml
+
+            # (default) run show_wallpaper_cmd on every change
+            display_backend:
+               type: command
+
+            # keep process alive, write wallpaper paths to it's stdin
+            display_backend:
+               type: coprocess
+               cmd:  ['my-setter', '--read-stdin']
+
+            # call a python function
+            display_backend:
+               type:     callable
+               callable: 'mypackage.wallpaper:set_wallpaper'
+
+    Args:
+        config (wallpapermgr.datafile.Config):
+            config to read ``display_backend`` / ``show_wallpaper_cmd`` from.
+
+    Returns:
+        DisplayBackend: the backend (not yet started)
+    """
+    data = config.read()
+    settings = data.get('display_backend', {'type': 'command'})
+    backend_type = settings['type']
+
+    if backend_type == 'command':
+        return CommandBackend(settings.get('cmd', data['show_wallpaper_cmd']))
+    elif backend_type == 'coprocess':
+        return CoprocessBackend(settings['cmd'])
+    elif backend_type == 'callable':
+        return CallableBackend(settings['callable'])
+
+    raise RuntimeError(
+        'invalid display_backend type: "{}"'.format(backend_type)
+    )
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+""" Resource budgets of the server, so it can run on low-memory machines.
+
+    * ``workers``:          max threads extracting wallpapers (foreground and prefetch).
+                            prefetches are skipped while every worker is busy.
+    * ``member_memory``:    wallpapers larger than this are streamed from the archive
+                            to the ``extract_target`` in chunks, instead of being read
+                            into memory (and the history cache).
+    * ``extracted_bytes``:  max bytes of extracted wallpapers in the ``extract_target`` .
+                            prefetches past it are skipped, the wallpaper is extracted
+                            when it is displayed instead.
+
+Background work is shed, never the wallpaper being displayed. Every time a budget
+is hit, ``budget_exceeded_total{budget="..."}`` is incremented (see ``wallmgr stats`` ).
+
+Example:
+
+    .. code-block:: python
+
+        budgets = Budgets(workers=2, member_memory=32 * 1024 * 1024)
+        if budgets.start_task(background=True):
+            future = pool.submit(prefetch)
+            future.add_done_callback(lambda f: budgets.finish_task())
+
+"""
+# builtin
+from __future__ import absolute_import, division, print_function
+import logging
+import os
+import threading
+# external
+# internal
+from wallpapermgr import metrics
+
+
+logger = logging.getLogger(__name__)
+
+default_member_memory = 32 * 1024 * 1024
+
+
+def default_workers():
+    """ Returns the number of workers of :py:class:`concurrent.futures.ThreadPoolExecutor` by default.
+    """
+    return min(32, (os.cpu_count() or 1) + 4)
+
+
+class Budgets(object):
+    """ Tracks usage of the server's resources against their budgets.
+    """
+    def __init__(self, workers=None, member_memory=default_member_memory, extracted_bytes=None):
+        """ Constructor.
+
+        Args:
+            workers (int, optional):
+                max threads extracting wallpapers (default: cpus + 4, at most 32)
+
+            member_memory (int, optional):
+                max bytes of a wallpaper read into memory (None is unlimited)
+
+            extracted_bytes (int, optional):
+                max bytes of extracted wallpapers in the extract target (None is unlimited)
+        """
+        self.__workers = workers or default_workers()
+        self.__member_memory = member_memory
+        self.__extracted_bytes = extracted_bytes
+        self.__lock = threading.Lock()
+        self.__tasks = 0
+        self.__extracted = {}  # {output: bytes}
+
+    @property
+    def workers(self):
+        return self.__workers
+
+    @property
+    def member_memory(self):
+        return self.__member_memory
+
+    @property
+    def extracted_bytes(self):
+        return self.__extracted_bytes
+
+    @property
+    def settings(self):
+        return (self.__workers, self.__member_memory, self.__extracted_bytes)
+
+    @property
+    def extracted(self):
+        """ Returns bytes of extracted wallpapers currently in the extract target.
+        """
+        with self.__lock:
+            return sum(self.__extracted.values())
+
+    @staticmethod
+    def exceeded(budget):
+        metrics.registry.counter('budget_exceeded_total', budget=budget).inc()
+        logger.debug('budget exceeded: {}'.format(budget))
+
+    def start_task(self, background=False):
+        """ Accounts for an extraction submitted to the workers.
+        Call :py:meth:`finish_task` once it is done.
+
+        Args:
+            background (bool, optional):
+                if True, the task is refused while every worker is busy.
+
+        Returns:
+            bool: False if the task was refused
+        """
+        with self.__lock:
+            if background and self.__tasks >= self.__workers:
+                refused = True
+            else:
+                refused = False
+                self.__tasks += 1
+        if refused:
+            self.exceeded('workers')
+        return not refused
+
+    def finish_task(self):
+        with self.__lock:
+            self.__tasks -= 1
+
+    def fits_in_memory(self, size):
+        """ Returns False if a wallpaper of `size` bytes should not be read into memory.
+        """
+        if self.__member_memory is None or size <= self.__member_memory:
+            return True
+        self.exceeded('member_memory')
+        return False
+
+    def reserve_extracted(self, output, size, required=False):
+        """ Accounts for `size` bytes extracted for `output` (replacing it's previous wallpaper).
+
+        Args:
+            output (tuple): ``(ex: ('left', 1))`` output, and it's target slot
+            required (bool, optional):
+                if True, the bytes are reserved even if the budget is exceeded
+                (ex: the wallpaper about to be displayed).
+
+        Returns:
+            bool: False if nothing was reserved, because it would exceed the budget.
+        """
+        with self.__lock:
+            others = sum(v for (k, v) in self.__extracted.items() if k != output)
+            over = self.__extracted_bytes is not None and others + size > self.__extracted_bytes
+            if not over or required:
+                self.__extracted[output] = size
+        if over:
+            self.exceeded('extracted_bytes')
+        return required or not over
+
+    def release_extracted(self, output):
+        """ Accounts for `output` 's extracted wallpaper (in a slot) being deleted.
+        """
+        with self.__lock:
+            self.__extracted.pop(output, None)
+
+
+def from_config(config):
+    """ Returns :py:class:`Budgets` from the ``budgets`` in the config.
+
+    Example:
+
+        .. code-block:: yaml
+
+            budgets:
+               workers:         2
+               member_memory:   33554432    # 32MB
+               extracted_bytes: 134217728   # 128MB
+
+    """
+    settings = config.read().get('budgets', {})
+    return Budgets(
+        workers=settings.get('workers'),
+        member_memory=settings.get('member_memory', default_member_memory),
+        extracted_bytes=settings.get('extracted_bytes'),
+    )
@@ -4,10 +4,11 @@ from __future__ import absolute_import, division, print_function
 import argparse
 import logging
 import numbers
+import os
 import sys
 # external
 # internal
-from wallpapermgr import display, datafile
+from wallpapermgr import budgets, display, datafile, shared, sync, trace, verify
 
 
 logger = logging.getLogger(__name__)
@@ -39,23 +40,47 @@ class CommandlineInterface(object):
             '-vv', '--very-verbose', help='enable very verbose logging',
             action='store_true',
         )
+        self.parser.add_argument(
+            '--trace', help=(
+                'When starting the server, write timing of each request/extraction '
+                'to this file (json lines). See `wallmgr trace summary`'
+            ),
+            metavar='FILE',
+        )
+        self.parser.add_argument(
+            '--profile', help=(
+                'When starting the server, run it under cProfile, '
+                'writing pstats to this file on shutdown'
+            ),
+            metavar='FILE',
+        )
 
         self._build_args()
         self._build_subparser_archive()
+        self._build_subparser_sync()
+        self._build_subparser_stats()
+        self._build_subparser_profile()
+        self._build_subparser_trace()
+        self._build_subparser_jobs()
+        self._build_subparser_query()
+        self._build_subparser_filter()
+        self._build_subparser_shared()
 
     def _build_args(self):
-        self.subparsers.add_parser(
+        parser = self.subparsers.add_parser(
             'next', help=(
                 'Display next wallpaper\n'
                 '(short for `wallmgr display --next`)'
             ),
         )
-        self.subparsers.add_parser(
+        self._add_output_arg(parser)
+        parser = self.subparsers.add_parser(
             'prev', help=(
                 'Display previous wallpaper\n '
                 '(short for `wallmgr display --prev`)'
             )
         )
+        self._add_output_arg(parser)
         self.subparsers.add_parser(
             'ls', help='List configured archives'
         )
@@ -80,6 +105,7 @@ class CommandlineInterface(object):
             '-i', '--interval',
             help='override number of seconds between wallpaper changes',
         )
+        self._add_output_arg(parser)
         parser.add_argument(
             '--add', help='Add images to an archive',
             nargs='*',
@@ -96,6 +122,228 @@ class CommandlineInterface(object):
             '--push', help='Git Push an archive',
             action='store_true',
         )
+        parser.add_argument(
+            '--prune-history', help=(
+                'Discard git history older than --depth commits (default: 1), '
+                'freeing space used by old revisions of the archive'
+            ),
+            action='store_true',
+        )
+        self._add_clone_args(parser)
+        parser.add_argument(
+            '--convert', help=(
+                'Copy archive into a new archive at this path. '
+                'A directory creates a loose-file archive (one file per image), '
+                'a .tar.gz/.tar.xz path creates a compressed archive (one frame per image), '
+                'a .zip path creates a zip archive, '
+                'a .tar path creates a tar archive.'
+            ),
+            metavar='PATH',
+        )
+        parser.add_argument(
+            '--verify', help=(
+                'Check every wallpaper in the archive for damage '
+                '(header checksums, sizes, content hashes), '
+                'and wallpapers missing from the archive'
+            ),
+            action='store_true',
+        )
+        parser.add_argument(
+            '--quarantine', help=(
+                '(with --verify) stop displaying damaged wallpapers, '
+                'and resume displaying quarantined wallpapers that are now intact'
+            ),
+            action='store_true',
+        )
+        parser.add_argument(
+            '-j', '--jobs', help='(with --verify) number of threads (default: number of cpus)',
+            type=int,
+        )
+
+    def _build_subparser_sync(self):
+        parser = self.subparsers.add_parser(
+            'sync', help=(
+                'Git Pull every archive\'s repo concurrently. '
+                '(clones if not present)'
+            ),
+        )
+        parser.add_argument(
+            '--fetch', help='Git Fetch instead of Pull',
+            action='store_true',
+        )
+        parser.add_argument(
+            '--push', help='Git Push instead of Pull',
+            action='store_true',
+        )
+        parser.add_argument(
+            '-j', '--jobs', help='number of repos to sync at once (default: 4)',
+            type=int, default=4,
+        )
+        self._add_clone_args(parser)
+
+    def _build_subparser_stats(self):
+        parser = self.subparsers.add_parser(
+            'stats', help='Print wallpaper-server latency/throughput metrics',
+        )
+        parser.add_argument(
+            '--export', help=(
+                'Write metrics to this file in the prometheus text format '
+                '(ex: for node_exporter\'s textfile collector)'
+            ),
+            metavar='PATH',
+        )
+        parser.add_argument(
+            '--reset', help='Discard all metrics collected so far',
+            action='store_true',
+        )
+
+    def _build_subparser_profile(self):
+        parser = self.subparsers.add_parser(
+            'profile', help='Start/Stop cProfile in the running wallpaper-server',
+        )
+        parser.add_argument('action', choices=('start', 'stop'))
+        parser.add_argument(
+            '-o', '--output', help='(stop) write pstats to this file, in $XDG_DATA_HOME/wallpapermgr/traces/',
+            metavar='FILE',
+        )
+
+    def _build_subparser_trace(self):
+        parser = self.subparsers.add_parser(
+            'trace', help=(
+                'Start/Stop tracing in the running wallpaper-server, '
+                'or summarize a trace file'
+            ),
+        )
+        parser.add_argument('action', choices=('start', 'stop', 'summary'))
+        parser.add_argument(
+            'filepath', help=(
+                '(start) trace file name, in $XDG_DATA_HOME/wallpapermgr/traces/ '
+                '(summary) trace file'
+            ),
+            nargs='?',
+        )
+
+    def _build_subparser_jobs(self):
+        parser = self.subparsers.add_parser(
+            'jobs', help=(
+                'Print maintenance jobs (indexing, verification) '
+                'the wallpaper-server runs while idle'
+            ),
+        )
+        parser.add_argument(
+            '--cancel', help='Stop a job\'s current run (ex: verify:normal_walls)',
+            metavar='NAME',
+        )
+
+    def _build_subparser_query(self):
+        parser = self.subparsers.add_parser(
+            'query', help=(
+                'List wallpapers of an archive matching every filter, '
+                'from the metadata the wallpaper-server reads while idle'
+            ),
+        )
+        parser.add_argument('archive', help='archive to search')
+        parser.add_argument(
+            'filters', nargs='*', help=(
+                'COLUMN OP VALUE, where COLUMN is one of id/size/width/height/mtime/hash/aspect '
+                'and OP one of = != < <= > >= (ex: width>=3440 size<2m), '
+                'or name~REGEX / name=NAME'
+            ),
+        )
+        parser.add_argument(
+            '--offset', help='skip this many matches (default: 0)', type=int, default=0,
+        )
+        parser.add_argument(
+            '--limit', help='print at most this many matches (default: 100)', type=int, default=100,
+        )
+
+    def _build_subparser_filter(self):
+        parser = self.subparsers.add_parser(
+            'filter', help=(
+                'Only play wallpapers of the current archive matching every filter '
+                '(without changing it\'s order). Without filters, prints the active filters'
+            ),
+        )
+        parser.add_argument(
+            'filters', nargs='*', help=(
+                'same as `wallmgr query` (ex: aspect>2.3 aspect>=21:9 name~space)'
+            ),
+        )
+        parser.add_argument(
+            '--clear', help='play every wallpaper of the archive again', action='store_true',
+        )
+        parser.add_argument(
+            '-o', '--output', help=(
+                'filter the archive of this output (see `outputs` in config). '
+                'By default, the archive of the first output'
+            ),
+        )
+
+    def _build_subparser_shared(self):
+        parser = self.subparsers.add_parser(
+            'shared', help=(
+                'Run the shared archive daemon (system-wide), '
+                'extracting wallpapers for every user\'s wallpaper-server. '
+                'Users set `shared_daemon` in their config to use it'
+            ),
+        )
+        parser.add_argument(
+            '--root', help=(
+                'Serve archives under this directory (repeatable). '
+                'Archives elsewhere are read by each user\'s server'
+            ),
+            action='append', required=True, metavar='DIR',
+        )
+        parser.add_argument(
+            '--socket', help='unix socket to listen on (default: {})'.format(shared.default_sockfile),
+            default=shared.default_sockfile, metavar='PATH',
+        )
+        parser.add_argument(
+            '--cache-size', help='max bytes of extracted wallpapers kept in memory (default: 512MB)',
+            type=int, default=512 * 1024 * 1024, metavar='BYTES',
+        )
+        parser.add_argument(
+            '--socket-group', help='group allowed to connect (socket mode 0660, default: any user)',
+            metavar='GROUP',
+        )
+        parser.add_argument(
+            '--socket-mode', help='permissions of the socket, in octal (default: 0666, or 0660 with --socket-group)',
+            type=lambda value: int(value, 8), metavar='MODE',
+        )
+        parser.add_argument(
+            '--workers', help='max requests handled at once (default: cpus + 4, at most 32)',
+            type=int, metavar='N',
+        )
+        parser.add_argument(
+            '--member-memory', help=(
+                'wallpapers larger than this are streamed into their memfd, '
+                'instead of being read into memory (default: 32MB)'
+            ),
+            type=int, default=budgets.default_member_memory, metavar='BYTES',
+        )
+
+    def _add_output_arg(self, parser):
+        parser.add_argument(
+            '-o', '--output', help=(
+                'Only change the wallpaper of this output (see `outputs` in config). '
+                'By default, every output changes'
+            ),
+        )
+
+    def _add_clone_args(self, parser):
+        parser.add_argument(
+            '--depth', help=(
+                'When cloning, only download the last N commits '
+                '(skips old revisions of archives)'
+            ),
+            type=int,
+        )
+        parser.add_argument(
+            '--blobless', help=(
+                'When cloning, only download files as they are checked out'
+            ),
+            action='store_true',
+        )
 
     def parse_args(self):
         args = self.parser.parse_args()
@@ -117,8 +365,7 @@ class CommandlineInterface(object):
         if not subparser:
             if not display.Server.is_active():
                 print('starting wallpapermgr server')
-                srv = display.Server(interval=args.interval)
-                srv.serve_forever()
+                self._serve(args)
                 return
             elif args.interval:
                 if subparser != display.RequestHandler.stop_command:
@@ -127,8 +374,8 @@ class CommandlineInterface(object):
 
         # interact-with server
         subparser_map = {
-            'next': lambda: display.Server.request('next'),
-            'prev': lambda: display.Server.request('prev'),
+            'next': lambda: display.Server.request(self._output_request('next', args)),
+            'prev': lambda: display.Server.request(self._output_request('prev', args)),
             'reload': lambda: display.Server.request('reload'),
             'ls': datafile.print_archive_list,
             'stop': lambda: display.Server.request(display.RequestHandler.stop_command)
@@ -141,35 +388,241 @@ class CommandlineInterface(object):
         elif subparser == 'archive':
             self._parse_subparser_archive(args)
 
+        elif subparser == 'sync':
+            self._parse_subparser_sync(args)
+
+        elif subparser == 'stats':
+            self._parse_subparser_stats(args)
+
+        elif subparser == 'profile':
+            self._parse_subparser_profile(args)
+
+        elif subparser == 'trace':
+            self._parse_subparser_trace(args)
+
+        elif subparser == 'jobs':
+            self._parse_subparser_jobs(args)
+
+        elif subparser == 'query':
+            self._parse_subparser_query(args)
+
+        elif subparser == 'filter':
+            self._parse_subparser_filter(args)
+
+        elif subparser == 'shared':
+            self._parse_subparser_shared(args)
+
+    @staticmethod
+    def _output_request(request, args):
+        if args.output:
+            return '{} {}'.format(request, args.output)
+        return request
+
+    def _serve(self, args):
+        if args.trace:
+            trace.enable(args.trace)
+
+        srv = display.Server(interval=args.interval)
+        if args.profile:
+            # profiles the thread requests are handled in
+            trace.start_profile()
+        try:
+            srv.serve_forever()
+        finally:
+            if args.profile and trace.is_profiling():
+                print(trace.stop_profile(args.profile))
+            trace.disable()
+
     def _parse_subparser_archive(self, args):
         # change archive
-        all_args = (args.add, args.remove, args.pull, args.push)
+        all_args = (
+            args.add, args.remove, args.pull, args.push,
+            args.prune_history, args.convert, args.verify,
+        )
         if len([x for x in all_args if x]) == 0:
-            display.Server.request('archive {}'.format(args.archive))
+            display.Server.request(
+                self._output_request('archive {}'.format(args.archive), args)
+            )
             if args.interval:
                 display.Server.request('interval {}'.format(args.interval))
             return
 
         archive = datafile.Archive(args.archive)
 
-        # add/remove
-        if args.add and args.remove:
-            print('cannot use --add and --remove together')
-            sys.exit(1)
-        elif args.add:
-            archive.add(args.add)
-        elif args.remove:
-            archive.remove(args.remove)
+        # add/remove (both in a single commit)
+        with archive.batch():
+            if args.add:
+                archive.add(args.add)
+            if args.remove:
+                archive.remove(args.remove)
 
         # pull/push
         if args.pull and args.push:
             print('cannot use --pull and --push together')
             sys.exit(1)
         elif args.pull:
-            archive.pull()
+            archive.pull(depth=args.depth, blobless=args.blobless)
         elif args.push:
             archive.push()
 
+        if args.prune_history:
+            archive.prune_history(depth=args.depth or 1)
+
+        if args.convert:
+            archive.convert(args.convert)
+            print((
+                'converted archive to "{}". \n'
+                'Update `archive` in your config to use it.'
+            ).format(args.convert))
+
+        if args.verify:
+            self._verify(args)
+
+    def _verify(self, args):
+        config = datafile.Config()
+        data = datafile.Data()
+        indexed = None
+        if args.archive in data.read()['archives']:
+            indexed = data.indexed(args.archive)
+
+        report = verify.verify_archive(
+            config.archive_path(args.archive), indexed=indexed, jobs=args.jobs,
+        )
+        for (name, problem) in sorted(report.problems.items()):
+            print('  BAD {}: {}'.format(name, problem))
+        if report.unindexed:
+            print('  {} wallpapers not yet in the datafile (`wallmgr reload`)'.format(
+                len(report.unindexed)
+            ))
+        print(report.summary())
+
+        if args.quarantine and indexed is not None:
+            (added, released) = data.quarantine(args.archive, sorted(report.problems))
+            print('quarantined {}, released {} wallpapers'.format(len(added), len(released)))
+        if report.problems:
+            sys.exit(1)
+
+    def _parse_subparser_stats(self, args):
+        if args.export:
+            # written here, with the permissions of the user exporting them
+            reply = display.Server.request('stats export')
+            if not reply:
+                print('unable to read metrics from the server')
+                sys.exit(1)
+            tmppath = '{}.{}'.format(args.export, os.getpid())
+            with open(tmppath, 'wb') as fd:
+                fd.write(reply)
+            os.replace(tmppath, args.export)
+            print('wrote metrics to {}'.format(os.path.abspath(args.export)))
+            return
+        elif args.reset:
+            request = 'stats reset'
+        else:
+            request = 'stats'
+
+        reply = display.Server.request(request)
+        if reply:
+            print(reply.decode())
+
+    def _parse_subparser_profile(self, args):
+        if args.action == 'start':
+            request = 'profile start'
+        elif args.output:
+            # (a name, written to the server's traces directory)
+            request = 'profile stop {}'.format(args.output)
+        else:
+            request = 'profile stop'
+
+        reply = display.Server.request(request)
+        if reply:
+            print(reply.decode())
+
+    def _parse_subparser_trace(self, args):
+        if args.action in ('start', 'summary') and not args.filepath:
+            print('`wallmgr trace {}` requires a filepath'.format(args.action))
+            sys.exit(1)
+
+        if args.action == 'summary':
+            filepath = args.filepath
+            if not os.path.isfile(filepath):
+                filepath = os.path.join(display.Server.tracedir, filepath)
+            print(trace.summarize(filepath))
+            return
+
+        if args.action == 'start':
+            # (a name, written to the server's traces directory)
+            request = 'trace start {}'.format(args.filepath)
+        else:
+            request = 'trace stop'
+
+        reply = display.Server.request(request)
+        if reply:
+            print(reply.decode())
+
+    def _parse_subparser_jobs(self, args):
+        request = 'jobs'
+        if args.cancel:
+            request = 'jobs cancel {}'.format(args.cancel)
+
+        reply = display.Server.request(request)
+        if reply:
+            print(reply.decode())
+
+    def _parse_subparser_query(self, args):
+        request = ' '.join(
+            ['query', args.archive]
+            + args.filters
+            + ['offset={}'.format(args.offset), 'limit={}'.format(args.limit)]
+        )
+        reply = display.Server.request(request)
+        if reply:
+            print(reply.decode())
+
+    def _parse_subparser_filter(self, args):
+        if args.clear and args.filters:
+            print('cannot use --clear with filters')
+            sys.exit(1)
+
+        request = ['filter']
+        if args.output:
+            request.append('output={}'.format(args.output))
+        request.extend(['clear'] if args.clear else args.filters)
+
+        reply = display.Server.request(' '.join(request))
+        if reply:
+            print(reply.decode())
+
+    def _parse_subparser_shared(self, args):
+        srv = shared.SharedServer(
+            args.root,
+            sockfile=args.socket,
+            cache_size=args.cache_size,
+            budgets=budgets.Budgets(workers=args.workers, member_memory=args.member_memory),
+            group=args.socket_group,
+            mode=args.socket_mode,
+        )
+        srv.serve_forever()
+
+    def _parse_subparser_sync(self, args):
+        if args.fetch and args.push:
+            print('cannot use --fetch and --push together')
+            sys.exit(1)
+
+        operation = 'pull'
+        if args.fetch:
+            operation = 'fetch'
+        elif args.push:
+            operation = 'push'
+
+        results = sync.sync(
+            operation=operation,
+            jobs=args.jobs,
+            depth=args.depth,
+            blobless=args.blobless,
+        )
+        if any(results.values()):
+            sys.exit(1)
+
     @staticmethod
     def show():
         cli = CommandlineInterface()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# builtin
+from __future__ import absolute_import, division, print_function
+import glob
+import importlib
+import logging
+import os
+import re
+import socket
+import subprocess
+import threading
+import time
+# external
+# internal
+
+
+logger = logging.getLogger(__name__)
+
+default_ttl = 60             # seconds a provider's result is reused for
+default_cmd_timeout = 5      # seconds before choose_archive_cmd is abandoned
+xineramawide_aspect = 2.5    # combined aspect-ratio considered 'wide' (ex: 32:9)
+
+_providers = {}
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def register(name, func=None):
+    """ Registers a condition-provider, a function that returns
+    the current value of a condition. Archives whose ``conditions``
+    match the provided values are chosen by
+    :py:meth:`wallpapermgr.datafile.Config.determine_archive` .
+
+    Example:
+
+        .. code-block:: python
+
+            @conditions.register('is_docked')
+            def is_docked():
+                return os.path.exists('/sys/devices/platform/dock.0')
+
+    Args:
+        name (str): ``(ex: 'is_xineramawide')``
+            name of condition, as it appears in the config.
+
+        func (callable, optional):
+            provider function. If not provided, returns a decorator.
+    """
+    def decorator(func):
+        _providers[name] = func
+        return func
+
+    if func is None:
+        return decorator
+    return decorator(func)
+
+
+def is_registered(name):
+    return name in _providers
+
+
+def load_providers(providers):
+    """ Registers user-defined providers from the config.
+
+    Args:
+        providers (dict): ``(ex: {'is_docked': 'mymodule:is_docked'})``
+            condition names, and the import-path of their provider.
+    """
+    for name in providers:
+        (modname, _, attr) = providers[name].partition(':')
+        if not attr:
+            raise RuntimeError(
+                'expected condition provider in format "module:function". '
+                'received "{}"'.format(providers[name])
+            )
+        module = importlib.import_module(modname)
+        register(name, getattr(module, attr))
+
+
+def _memoize(key, ttl, func):
+    now = time.monotonic()
+    with _cache_lock:
+        if key in _cache:
+            (expires, value) = _cache[key]
+            if now < expires:
+                return value
+
+    value = func()
+    with _cache_lock:
+        _cache[key] = (now + ttl, value)
+    return value
+
+
+def clear_cache():
+    """ Forgets all memoized condition values/command outputs.
+    """
+    with _cache_lock:
+        _cache.clear()
+
+
+def evaluate(name, ttl=default_ttl):
+    """ Returns the value of a condition, reusing it's last value
+    if it is younger than `ttl` seconds.
+    """
+    if name not in _providers:
+        raise RuntimeError('no condition provider named "{}"'.format(name))
+    return _memoize(('condition', name), ttl, _providers[name])
+
+
+def matches(conditions, ttl=default_ttl):
+    """ Returns True if every condition matches it's expected value.
+
+    Args:
+        conditions (dict): ``(ex: {'is_xineramawide': True})``
+    """
+    for name in conditions:
+        if evaluate(name, ttl) != conditions[name]:
+            return False
+    return True
+
+
+def choose_archive(archives, ttl=default_ttl):
+    """ Chooses an archive by it's conditions.
+
+    Archives matching a specific condition are preferred over
+    archives matching only ``is_default`` .
+
+    Args:
+        archives (dict):
+            the config's ``archives`` .
+
+    Returns:
+        str: the archive name, or None if no archive's conditions match.
+    """
+    default = None
+    for name in sorted(archives):
+        conditions = archives[name].get('conditions')
+        if not conditions:
+            continue
+        if not matches(conditions, ttl):
+            continue
+
+        if set(conditions) == {'is_default'}:
+            if default is None:
+                default = name
+        else:
+            return name
+
+    return default
+
+
+def command_output(cmds, ttl=default_ttl, timeout=default_cmd_timeout):
+    """ Returns the first line of a command's stdout, memoized for `ttl` seconds.
+
+    If the command fails or times out, but previously succeeded,
+    it's last output is reused.
+    """
+    key = ('command', tuple(cmds))
+
+    def run():
+        stdout = subprocess.check_output(
+            cmds, universal_newlines=True, timeout=timeout
+        )
+        return stdout.split('\n')[0]
+
+    try:
+        return _memoize(key, ttl, run)
+    except(subprocess.SubprocessError, OSError) as exc:
+        with _cache_lock:
+            if key not in _cache:
+                raise
+            logger.warning(
+                'command {} failed ({}), reusing last output'.format(cmds, exc)
+            )
+            return _cache[key][1]
+
+
+def _connected_modes():
+    """ Returns the preferred resolution of every connected output,
+    read from the kernel's DRM connectors (no X server query required).
+
+    Returns:
+        list: ``(ex: [(1920, 1080), (2560, 1440)])``
+    """
+    resolutions = []
+    for connector in glob.glob('/sys/class/drm/card*-*'):
+        try:
+            with open(os.path.join(connector, 'status'), 'r') as fd:
+                if fd.read().strip() != 'connected':
+                    continue
+            with open(os.path.join(connector, 'modes'), 'r') as fd:
+                mode = fd.readline().strip()
+        except(IOError, OSError):
+            continue
+
+        # ex: '1920x1080', '1920x1080i'
+        match = re.match(r'(\d+)x(\d+)', mode)
+        if match:
+            resolutions.append((int(match.group(1)), int(match.group(2))))
+    return resolutions
+
+
+@register('is_default')
+def is_default():
+    return True
+
+
+@register('is_xineramawide')
+def is_xineramawide():
+    """ True if the connected outputs, side by side, have a
+    combined aspect ratio of at least :py:data:`xineramawide_aspect` .
+    """
+    resolutions = _connected_modes()
+    if not resolutions:
+        return None
+
+    width = sum(r[0] for r in resolutions)
+    height = max(r[1] for r in resolutions)
+    return (width / height) >= xineramawide_aspect
+
+
+@register('hostname')
+def hostname():
+    return socket.gethostname()
@@ -1,14 +1,18 @@
 #!/usr/bin/env python
 # builtin
 from __future__ import absolute_import, division, print_function
+import contextlib
 import functools
 import json
+import logging
+import marshal
 import numbers
 import os
 import random
+import re
 import string
 import subprocess
-import tarfile
+import sys
 # external
 from six.moves import input
 import xdg.BaseDirectory
@@ -16,10 +20,13 @@ import six
 import yaml
 import git
 # internal
-from wallpapermgr import validate
+from wallpapermgr import conditions, metrics, storage, trace, validate
 
 
+logger = logging.getLogger(__name__)
+
 text_types = (bytes, str)
+default_output = 'default'  # name of the only output, when ``outputs`` is not configured
 
 
 class PidFile(object):
@@ -112,7 +119,6 @@ class Config(object):
             archives:
 
                normal_walls:
-                  apply_method: feh
                   archive:      ~/Downloads/wallpapers/normal_walls.tar
                   gitroot:      ~/Downloads/wallpapers
                   gitsource:    ssh://yourgit:/gitrepos/wallpapers
@@ -121,7 +127,6 @@ class Config(object):
                      is_default: True
 
                wide_walls:
-                  apply_method: feh
                   archive:      ~/Downloads/wallpapers/wide_walls.tar
                   gitroot:      ~/Downloads/wallpapers
                   gitsource:    ssh://yourgit:/gitrepos/wallpapers
@@ -129,7 +134,24 @@ class Config(object):
                   conditions:
                      is_xineramawide: True
 
+            # (optional) interleave archives, 3 normal_walls for every wide_walls.
+            # playlists are used like archives (outputs, `wallmgr archive mixed`)
+            playlists:
+               mixed:
+                  normal_walls: 3
+                  wide_walls:   1
+
+            # (optional) one wallpaper per monitor.
+            # outputs without an archive use the archive chosen by conditions.
+            outputs:
+               left:
+                  archive:      mixed
+               right:
+                  archive:      wide_walls
+
     """
+    cache_version = 8  # increment when normalize/validate change
+
     def __init__(self, filepath=None):
         if filepath is None:
             filedir = xdg.BaseDirectory.save_config_path('wallpapermgr')
@@ -142,39 +164,135 @@ class Config(object):
     def filepath(self):
         return self.__filepath
 
+    @property
+    def cachepath(self):
+        """ Returns filepath to the validated/normalized copy of the configfile.
+        """
+        (dirname, basename) = os.path.split(self.filepath)
+        return os.path.join(dirname, '.{}.cache'.format(basename))
+
     def read(self, force=False):
+        """ Read the configfile.
+
+        The validated/normalized config is cached alongside the configfile,
+        and reused until the configfile's mtime/size/inode changes.
+
+        Returns:
+            dict: configfile contents. See object example.
+        """
         if self.data and not force:
             return self.data
 
-        with open(self.filepath, 'r') as fd:
-            data = yaml.safe_load(fd.read())
+        stat = os.stat(self.filepath)
+        cachekey = (
+            stat.st_mtime_ns,
+            stat.st_size,
+            stat.st_ino,
+            tuple(sys.version_info[:2]),
+        )
+
+        data = self._read_cache(cachekey)
+        if data is None:
+            with open(self.filepath, 'r') as fd:
+                data = yaml.safe_load(fd.read())
+
+            data = self.normalize(data)
+            self.validate(data, previous=self.data)
+            self._write_cache(cachekey, data)
 
-        self.validate(data)
         self.data = data
 
         return self.data
 
+    def _read_cache(self, cachekey):
+        try:
+            with open(self.cachepath, 'rb') as fd:
+                (version, key, data) = marshal.load(fd)
+        except(IOError, OSError, EOFError, ValueError, TypeError):
+            return None
+
+        if (version, key) != (self.cache_version, cachekey):
+            return None
+        return data
+
+    def _write_cache(self, cachekey, data):
+        tmppath = '{}.{}'.format(self.cachepath, os.getpid())
+        try:
+            with open(tmppath, 'wb') as fd:
+                marshal.dump((self.cache_version, cachekey, data), fd)
+            os.replace(tmppath, self.cachepath)
+        except(IOError, OSError, ValueError) as exc:
+            # unwritable configdir, or yaml-types marshal cannot store
+            logger.debug('unable to write config cache: {}'.format(exc))
+            if os.path.isfile(tmppath):
+                os.remove(tmppath)
+
+    def normalize(self, data):
+        """ Expands ``~`` in archive paths.
+        """
+        if not isinstance(data, dict):
+            return data
+
+        for name in data.get('archives') or {}:
+            archive = data['archives'][name]
+            if not isinstance(archive, dict):
+                continue
+            for key in ('archive', 'gitroot', 'gitsource'):
+                if isinstance(archive.get(key), text_types[1]):
+                    archive[key] = os.path.expanduser(archive[key])
+        return data
+
     def write(self, data):
         self.validate(data)
         with open(self.filepath, 'r') as fd:
             fd.write(data)
 
-    def validate(self, data):
+    def validate(self, data, previous=None):
+        """ Validate the contents of a configfile.
+
+        Args:
+            data (dict):
+                config to validate.
+
+            previous (dict, optional):
+                A previously validated config. Archives that are unchanged
+                from this config are not re-validated.
+        """
+        if previous and previous.get('condition_providers') != data.get('condition_providers'):
+            previous = None
+        previous_archives = (previous or {}).get('archives') or {}
+
         validate.dictkeys(
             'data', data,
             reqd_keys={
                 'archives',
-                'choose_archive_cmd',
                 'show_wallpaper_cmd',
             },
-            avail_keys={'change_interval', },
+            avail_keys={
+                'auto_reload',
+                'budgets',
+                'change_interval',
+                'choose_archive_cmd',
+                'choose_archive_timeout',
+                'condition_providers',
+                'condition_ttl',
+                'display_backend',
+                'extract_target',
+                'history_cache_size',
+                'history_size',
+                'outputs',
+                'playlists',
+                'shared_daemon',
+                'verify_interval',
+            },
         )
 
         # validate top-level keys
-        if not isinstance(data['choose_archive_cmd'], list):
-            raise TypeError(
-                'expected data["choose_archive_cmd"] to be a list.'
-            )
+        if 'choose_archive_cmd' in data:
+            if not isinstance(data['choose_archive_cmd'], list):
+                raise TypeError(
+                    'expected data["choose_archive_cmd"] to be a list.'
+                )
         if not isinstance(data['show_wallpaper_cmd'], list):
             raise TypeError(
                 'expected data["show_wallpaper_cmd"] to be a list.'
@@ -185,10 +303,97 @@ class Config(object):
                     ('expected data["change_interval"] to be a number.'
                      'Received {}').format(data['change_interval'])
                 )
+        for key in ('choose_archive_timeout', 'condition_ttl', 'verify_interval'):
+            if key in data:
+                if not isinstance(data[key], numbers.Number):
+                    raise TypeError(
+                        ('expected data["{}"] to be a number.'
+                         'Received {}').format(key, data[key])
+                    )
+        for key in ('history_size', 'history_cache_size'):
+            if key in data:
+                if not isinstance(data[key], int) or isinstance(data[key], bool) or data[key] < 1:
+                    raise TypeError(
+                        ('expected data["{}"] to be a positive integer.'
+                         'Received {}').format(key, data[key])
+                    )
+        if 'auto_reload' in data:
+            if not isinstance(data['auto_reload'], bool):
+                raise TypeError(
+                    'expected data["auto_reload"] to be a bool.'
+                )
+        if 'condition_providers' in data:
+            if not isinstance(data['condition_providers'], dict):
+                raise TypeError(
+                    'expected data["condition_providers"] to be a dict.'
+                )
+        if 'display_backend' in data:
+            validate.dictkeys(
+                'data["display_backend"]',
+                data['display_backend'],
+                reqd_keys={'type'},
+                avail_keys={'cmd', 'callable'},
+                types={'type': text_types},
+            )
+            backend_type = data['display_backend']['type']
+            if backend_type not in ('command', 'coprocess', 'callable'):
+                raise TypeError(
+                    ('expected data["display_backend"]["type"] to be one of '
+                     'command/coprocess/callable. Received {}').format(backend_type)
+                )
+            if backend_type == 'coprocess' and 'cmd' not in data['display_backend']:
+                raise TypeError(
+                    'expected data["display_backend"]["cmd"] for coprocess backend.'
+                )
+            if backend_type == 'callable' and 'callable' not in data['display_backend']:
+                raise TypeError(
+                    'expected data["display_backend"]["callable"] for callable backend.'
+                )
+
+        if 'extract_target' in data:
+            target = data['extract_target']
+            if not isinstance(target, text_types) or not any([
+                target in ('auto', 'runtime', 'memfd', 'disk'),
+                os.path.isabs(os.path.expanduser(str(target))),
+            ]):
+                raise TypeError(
+                    ('expected data["extract_target"] to be one of '
+                     'auto/runtime/memfd/disk, or a directory. Received {}').format(target)
+                )
+        if 'budgets' in data:
+            if not isinstance(data['budgets'], dict):
+                raise TypeError(
+                    'expected data["budgets"] to be a dict.'
+                )
+            validate.dictkeys(
+                'data["budgets"]',
+                data['budgets'],
+                reqd_keys=set(),
+                avail_keys={'workers', 'member_memory', 'extracted_bytes'},
+            )
+            for (key, value) in data['budgets'].items():
+                if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+                    raise TypeError(
+                        ('expected data["budgets"]["{}"] to be a positive integer.'
+                         'Received {}').format(key, value)
+                    )
+        if 'shared_daemon' in data:
+            sockfile = data['shared_daemon']
+            if not isinstance(sockfile, text_types) or not os.path.isabs(os.path.expanduser(sockfile)):
+                raise TypeError(
+                    ('expected data["shared_daemon"] to be the absolute path '
+                     'of the shared daemon\'s socket. Received {}').format(sockfile)
+                )
+        if 'playlists' in data:
+            self._validate_playlists(data)
+        if 'outputs' in data:
+            self._validate_outputs(data)
 
         # validate archives
         for name in data['archives']:
             archive = data['archives'][name]
+            if previous_archives.get(name) == archive:
+                continue
 
             def _validate_abspath(key, val):
                 validate.abspath(
@@ -205,6 +410,7 @@ class Config(object):
                     'gitsource',
                     'desc',
                 ),
+                avail_keys={'conditions'},
                 types={
                     'archive':      text_types,
                     'gitroot':      [type(None)] + list(text_types),
@@ -217,12 +423,101 @@ class Config(object):
                 }
             )
 
+            for condition in archive.get('conditions', {}):
+                if not any([
+                    conditions.is_registered(condition),
+                    condition in data.get('condition_providers', {}),
+                ]):
+                    raise TypeError(
+                        'data["archives"]["{}"] has unknown condition: "{}"'.format(
+                            name, condition
+                        )
+                    )
+
+    @staticmethod
+    def _validate_playlists(data):
+        if not isinstance(data['playlists'], dict):
+            raise TypeError(
+                'expected data["playlists"] to be a dict.'
+            )
+        for name in data['playlists']:
+            weights = data['playlists'][name]
+            if name in data['archives']:
+                raise TypeError(
+                    'data["playlists"]["{}"] has the same name as an archive'.format(name)
+                )
+            if not isinstance(weights, dict) or not weights:
+                raise TypeError(
+                    ('expected data["playlists"]["{}"] to be a non-empty dict '
+                     'of archive weights').format(name)
+                )
+            for archive in weights:
+                if archive not in data['archives']:
+                    raise TypeError(
+                        'data["playlists"]["{}"] has unknown archive: "{}"'.format(
+                            name, archive
+                        )
+                    )
+                weight = weights[archive]
+                if isinstance(weight, bool) or not isinstance(weight, int) or weight < 1:
+                    raise TypeError(
+                        ('expected data["playlists"]["{}"]["{}"] to be a positive integer. '
+                         'Received {}').format(name, archive, weight)
+                    )
+
+    @staticmethod
+    def _validate_outputs(data):
+        if not isinstance(data['outputs'], dict) or not data['outputs']:
+            raise TypeError(
+                'expected data["outputs"] to be a non-empty dict.'
+            )
+        for name in data['outputs']:
+            # names are used in filenames, and in ``${wallpaper_NAME}``
+            if not re.match('^[A-Za-z0-9_]+$', str(name)):
+                raise TypeError(
+                    ('expected data["outputs"] names to contain only '
+                     'letters, numbers and underscores. Received "{}"').format(name)
+                )
+            output = data['outputs'][name] or {}
+            validate.dictkeys(
+                'data["outputs"]["{}"]'.format(name),
+                output,
+                reqd_keys=set(),
+                avail_keys={'archive'},
+            )
+            sources = set(data['archives']) | set(data.get('playlists') or {})
+            if 'archive' in output and output['archive'] not in sources:
+                raise TypeError(
+                    'data["outputs"]["{}"] has unknown archive: "{}"'.format(
+                        name, output['archive']
+                    )
+                )
+
     def determine_archive(self, force_read=False):
+        """ Returns the name of the archive to use on this machine.
+
+        Archive ``conditions`` are evaluated in-process first.
+        ``choose_archive_cmd`` only runs if no archive's conditions match.
+        Both results are reused for ``condition_ttl`` seconds.
+        """
         data = self.read(force_read)
+        ttl = data.get('condition_ttl', conditions.default_ttl)
+
+        conditions.load_providers(data.get('condition_providers', {}))
+        archive = conditions.choose_archive(data['archives'], ttl)
+        if archive is not None:
+            return archive
+
+        if 'choose_archive_cmd' not in data:
+            raise RuntimeError(
+                'no archive conditions matched, and no choose_archive_cmd configured'
+            )
 
-        cmds = data['choose_archive_cmd']
-        stdout = subprocess.check_output(cmds, universal_newlines=True)
-        archive = stdout.split('\n')[0]
+        archive = conditions.command_output(
+            data['choose_archive_cmd'],
+            ttl=ttl,
+            timeout=data.get('choose_archive_timeout', conditions.default_cmd_timeout),
+        )
 
         if archive not in data['archives']:
             raise RuntimeError('archive "{}" does not exist'.format(archive))
@@ -260,16 +555,40 @@ class Config(object):
         data = self.read()
         return sorted(list(data['archives'].keys()))
 
+    def playlists(self):
+        data = self.read()
+        return sorted(list((data.get('playlists') or {}).keys()))
+
     def archive_path(self, archive):
         data = self.read()
         path = data['archives'][archive]['archive']
         return os.path.expanduser(path)
 
+    def outputs(self):
+        """ Returns names of configured outputs (monitors), in config order.
+
+        Returns:
+            list: ``(ex: ['left', 'right'])`` , or ``['default']`` if none are configured.
+        """
+        data = self.read()
+        return list(data.get('outputs') or [default_output])
+
+    def output_archive(self, output):
+        """ Returns the name of the archive `output` starts on.
+        """
+        data = self.read()
+        settings = (data.get('outputs') or {}).get(output) or {}
+        if 'archive' in settings:
+            return settings['archive']
+        return self.determine_archive()
+
 
 class Archive(object):
-    """ Object representing a tar-archive of wallpapers in a git repo.
+    """ Object representing an archive of wallpapers in a git repo.
 
     Archives contain a flat list of image files. No directories/subdirectories.
+    They may be a tar-archive, or a directory of loose-files
+    (see :py:mod:`wallpapermgr.storage` ).
     """
     def __init__(self, archive, config=None):
         """ Constructor.
@@ -285,6 +604,7 @@ class Archive(object):
             config = Config()
 
         self.__config = config
+        self.__batch = None  # [(operation, names, paths), ...]
         if archive:
             self.load(archive)
 
@@ -341,27 +661,87 @@ class Archive(object):
                 raise RuntimeError('no such file: "{}"'.format(filepath))
 
         # write to archive
-        with tarfile.open(self.filepath, 'a') as archive_fd:
-            for filepath in filepaths:
-                archive_fd.add(filepath, os.path.basename(filepath))
+        with storage.open_storage(self.filepath) as store:
+            paths = store.add(filepaths)
+
+        names = [os.path.basename(x) for x in filepaths]
+        self._finish_operation('add', names, paths, commit, push)
+
+    def remove(self, filepaths, commit=True, push=True):
+        self._validate_modifyable()
+
+        names = [os.path.basename(x) for x in filepaths]
+        with storage.open_storage(self.filepath) as store:
+            paths = store.remove(names)
+
+        self._finish_operation('remove', names, paths, commit, push)
+
+    def _finish_operation(self, operation, names, paths, commit, push):
+        # within batch(), commit/push happen once at the end
+        if self.__batch is not None:
+            self.__batch.append((operation, names, paths))
+            return
 
-        # commit/push
         if commit:
-            self.commit('add', [os.path.basename(x) for x in filepaths])
+            self.commit(operation, names, paths=paths)
         if push:
             self.push()
 
-    def remove(self, filepaths, commit=True, push=True):
-        self._validate_modifyable()
+    @contextlib.contextmanager
+    def batch(self, commit=True, push=True):
+        """ Groups several add/remove operations into a single commit.
 
-        raise NotImplementedError(
-            'todo - will need to extract all, '
-            'create new archive, '
-            'then replace orig'
-        )
+        Example:
+
+            .. code-block:: python
+
+                archive = Archive('normal_walls')
+                with archive.batch():
+                    archive.add(['/path/to/new.png'])
+                    archive.remove(['old.png'])
 
-    def request_clone(self):
         """
+        if self.__batch is not None:
+            yield self
+            return
+
+        self.__batch = []
+        try:
+            yield self
+            operations = self.__batch
+        finally:
+            self.__batch = None
+
+        if not operations:
+            return
+
+        if commit:
+            paths = []
+            for (_, _, op_paths) in operations:
+                paths.extend(p for p in op_paths if p not in paths)
+            message = '\n'.join(
+                '{} {}'.format(operation, repr(names))
+                for (operation, names, _) in operations
+            )
+            self._commit(message, paths)
+        if push:
+            self.push()
+
+    def convert(self, dst_path):
+        """ Copies this archive's wallpapers into a new archive at `dst_path` ,
+        whose format is determined by it's path (ex: a directory for loose-files).
+        See :py:func:`wallpapermgr.storage.convert` .
+        """
+        self._validate_loaded()
+        storage.convert(self.filepath, dst_path)
+
+    def request_clone(self, depth=None, blobless=False):
+        """
+        Args:
+            depth (int, optional):
+            blobless (bool, optional):
+                See :py:meth:`clone` .
+
         Returns:
             bool: whether clone was performed/successful.
         """
@@ -381,7 +761,7 @@ class Archive(object):
         if reply != 'y':
             return False
 
-        return self.clone()
+        return self.clone(depth=depth, blobless=blobless)
 
     def is_submodule(self):
         # check if submodule
@@ -392,7 +772,22 @@ class Archive(object):
         except(git.InvalidGitRepositoryError, git.NoSuchPathError):
             return False
 
-    def clone(self):
+    def clone(self, depth=None, blobless=False):
+        """ Clones the archive's git repo.
+
+        Args:
+            depth (int, optional): ``(ex: 1)``
+                If provided, only the last `depth` commits are downloaded
+                (a shallow clone). Old revisions of archives are skipped.
+
+            blobless (bool, optional):
+                If True, file contents are only downloaded when they are
+                checked out (a partial clone). The remote must allow this
+                (``git config uploadpack.allowFilter true`` ).
+
+        Returns:
+            bool: whether clone was performed/successful.
+        """
         self._validate_loaded()
 
         # dir if repo, file if submodule
@@ -404,22 +799,92 @@ class Archive(object):
         if parent_repo:
             parent_gitroot = os.path.dirname(parent_repo.git_dir)
             submodule_path = self.gitsource[len(parent_gitroot) + 1:]
-            submodule = parent_repo.submodule(submodule_path)
-            submodule.update(init=True)
+            if not (depth or blobless):
+                submodule = parent_repo.submodule(submodule_path)
+                submodule.update(init=True)
+                return True
+
+            cmds = ['git', '-C', parent_gitroot, 'submodule', 'update', '--init']
+            cmds.extend(self._clone_args(depth, blobless))
+            cmds.extend(['--', submodule_path])
+            subprocess.check_call(cmds)
             return True
 
         # git clone
         else:
-            repo = git.Repo.init(self.gitroot)
-            repo.create_remote('origin', self.gitsource)
-            return self.pull()
+            parentdir = os.path.dirname(self.gitroot)
+            if not os.path.isdir(parentdir):
+                os.makedirs(parentdir)
+            subprocess.check_call(self.clone_cmd(depth, blobless))
+            return True
+
+    def clone_cmd(self, depth=None, blobless=False):
+        """ Returns the ``git clone`` command for this archive's repo.
+        See :py:meth:`clone` .
+
+        Returns:
+            list: ``(ex: ['git', 'clone', '--depth', '1', 'ssh://...', '/path/to/gitroot'])``
+        """
+        source = self.gitsource
+        if (depth or blobless) and os.path.isdir(source):
+            # git ignores --depth/--filter for plain local paths
+            source = 'file://{}'.format(os.path.abspath(source))
+
+        cmds = ['git', 'clone']
+        cmds.extend(self._clone_args(depth, blobless))
+        cmds.extend([source, self.gitroot])
+        return cmds
+
+    @staticmethod
+    def _clone_args(depth=None, blobless=False):
+        args = []
+        if depth:
+            args.extend(['--depth', str(int(depth))])
+        if blobless:
+            args.append('--filter=blob:none')
+        return args
+
+    def prune_history(self, depth=1):
+        """ Discards local git history older than `depth` commits,
+        freeing the space used by old revisions of archives.
+
+        The repo becomes a shallow clone. Changes must be pushed first.
+        """
+        self._validate_loaded()
+        gitroot = self.gitroot
+
+        ahead = subprocess.check_output(
+            ['git', '-C', gitroot, 'rev-list', '--count', '@{u}..HEAD'],
+            universal_newlines=True,
+        )
+        if int(ahead):
+            raise RuntimeError(
+                'cannot prune history, {} unpushed commits in "{}"'.format(
+                    int(ahead), gitroot
+                )
+            )
+
+        for args in (
+            ['fetch', '--depth', str(int(depth))],
+            ['merge', '--ff-only', '@{u}'],
+            ['reflog', 'expire', '--expire=now', '--all'],
+            ['gc', '--prune=now'],
+        ):
+            subprocess.check_call(['git', '-C', gitroot] + args)
 
-    def pull(self):
+    def pull(self, depth=None, blobless=False):
+        """ git pull the archive's repo, or clone it if it does not exist.
+
+        Args:
+            depth (int, optional):
+            blobless (bool, optional):
+                used if repo is cloned. See :py:meth:`clone` .
+        """
         self._validate_loaded()
 
         # if not exist, ask if wants to clone
         if not os.path.exists('{}/.git'.format(self.gitroot)):
-            return self.request_clone()
+            return self.request_clone(depth=depth, blobless=blobless)
 
         repo = git.Repo(self.gitroot)
         if repo.is_dirty(untracked_files=True):
@@ -466,21 +931,54 @@ class Archive(object):
             )
         remote.push()
 
-    def commit(self, operation, filepaths):
+    def commit(self, operation, filepaths, paths=None):
         """ performs a git commit, recording the operation
         and the files it affects.
+
+        Args:
+            operation (str): ``(ex: 'add')``
+            filepaths (list): ``(ex: ['wallpaper.png'])``
+                recorded in the commit message
+
+            paths (list, optional):
+                Only these paths are staged/committed (ex: the archive file).
+                Defaults to the archive's file/directory.
         """
         self._validate_loaded()
+        if paths is None:
+            paths = [self.filepath]
+        self._commit('{} {}'.format(operation, repr(filepaths)), paths)
+
+    def _commit(self, message, paths):
         repo = git.Repo(self.gitroot)
 
-        if not repo.is_dirty(untracked_files=True):
+        # only paths modified by the operation are staged/checked,
+        # rather than scanning the whole (potentially large) worktree.
+        missing = [p for p in paths if not os.path.exists(p)]
+        if missing:
+            # deleted paths can only be staged if they were tracked
+            tracked = repo.git.ls_files('--full-name', '--', *missing).splitlines()
+            tracked = set(os.path.join(self.gitroot, p) for p in tracked)
+            paths = [p for p in paths if p not in missing or p in tracked]
+
+        paths = [os.path.relpath(p, self.gitroot) for p in paths]
+        if not paths:
+            return
+        repo.git.add('-A', '--', *paths)
+
+        # compares index to HEAD only (no worktree scan)
+        staged = set(repo.git.diff('--cached', '--name-only', '--relative').splitlines())
+        if not staged.intersection(paths):
             return
 
-        # add all changes
-        repo.git.add(A=True)  # add all files (tracked/untracked)
+        # other staged changes are left out of the commit (slower, temporary index)
+        pathspec = []
+        if not staged.issubset(paths):
+            pathspec = ['--'] + paths
+
         repo.git.commit(
-            '-m',
-            '{} {}'.format(operation, repr(filepaths)),
+            '-m', message,
+            *pathspec,
             author='wallpapermgr <wallpapermgr@domain.com>'
         )
 
@@ -510,11 +1008,24 @@ class Data(object):
                             "oscarthegrouch.jpg",
                             "wallhaven-134328.jpg"
                             ...
-                        ]
+                        ],
+                        "quarantine": ["wallhaven-311415.jpg"]
                     }
+                },
+                "outputs": {
+                    "right": {"archive": "wide_walls", "last_index": 7}
+                },
+                "playlists": {
+                    "mixed": {"last_index": 4012}
                 }
             }
 
+    ``outputs`` holds the position of each named output
+    (the ``default`` output uses the archive/playlist's ``last_index`` ).
+
+    ``quarantine`` lists damaged wallpapers (see :py:mod:`wallpapermgr.verify` ),
+    they are left out of the ``sequence`` until they verify again.
+
     """
     def __init__(self, filepath=None):
         """ Constructor.
@@ -529,6 +1040,7 @@ class Data(object):
             filepath = '{}/data.json'.format(filedir)
 
         self.__filepath = filepath
+        self.__stat = None
         self.data = {}
 
     @property
@@ -549,6 +1061,7 @@ class Data(object):
         data = {'archives': {}}
         if os.path.isfile(self.filepath):
             with open(self.filepath, 'r') as fd:
+                self.__stat = _statkey(fd.fileno())
                 fileconts = fd.read()
                 if fileconts:
                     data = json.loads(fileconts)
@@ -568,20 +1081,53 @@ class Data(object):
         self.validate(data)
         with open(self.filepath, 'w') as fd:
             fd.write(json.dumps(data))
+            fd.flush()
+            self.__stat = _statkey(fd.fileno())
         self.data = data
 
+    def is_modified(self):
+        """ Returns True if the datafile was modified by another process
+        since it was last read/written by this object.
+        """
+        try:
+            stat = _statkey(self.filepath)
+        except(OSError):
+            return False
+        return stat != self.__stat
+
     def validate(self, data):
         """ Validate the contents of a datafile.
         """
-        validate.dictkeys('data', data, reqd_keys=set(['archives']))
+        validate.dictkeys('data', data, reqd_keys=set(['archives']), avail_keys={'outputs', 'playlists'})
 
         for name in data['archives']:
             validate.dictkeys(
                 varname='data["archives"]["{}"]'.format(name),
                 d=data['archives'][name],
                 reqd_keys=('last_index', 'sequence'),
+                avail_keys={'scan_offset', 'quarantine'},
                 types={'last_index': int, 'sequence': list},
             )
+            if not isinstance(data['archives'][name].get('quarantine', []), list):
+                raise TypeError(
+                    'expected data["archives"]["{}"]["quarantine"] to be a list.'.format(name)
+                )
+
+        for name in data.get('playlists', {}):
+            validate.dictkeys(
+                varname='data["playlists"]["{}"]'.format(name),
+                d=data['playlists'][name],
+                reqd_keys=('last_index',),
+                types={'last_index': int},
+            )
+
+        for name in data.get('outputs', {}):
+            validate.dictkeys(
+                varname='data["outputs"]["{}"]'.format(name),
+                d=data['outputs'][name],
+                reqd_keys=('archive', 'last_index'),
+                types={'last_index': int},
+            )
 
     def index(self, archive):
         """ Returns value of `last_index` in archive.
@@ -607,6 +1153,65 @@ class Data(object):
         data['archives'][archive]['last_index'] = index
         self.data = data
 
+    def playlist_index(self, playlist):
+        """ Returns value of `last_index` in playlist.
+        """
+        data = self.read()
+        return data.get('playlists', {}).get(playlist, {}).get('last_index', 0)
+
+    def set_playlist_index(self, playlist, index):
+        """ Updates `last_index` key for this playlist in the datafile.
+        """
+        data = self.read()
+        data.setdefault('playlists', {})[playlist] = {'last_index': index}
+        self.data = data
+
+    def output_index(self, output, archive, offset=0, playlist=None):
+        """ Returns the position of `output` in `archive` .
+
+        Args:
+            offset (int, optional):
+                used when `output` has no saved position in `archive` ,
+                so outputs sharing an archive do not start on the same wallpaper.
+
+            playlist (wallpapermgr.playlist.Playlist, optional):
+                provided if `archive` is the name of a playlist.
+        """
+        if output == default_output:
+            if playlist is not None:
+                return self.playlist_index(archive)
+            return self.index(archive)
+
+        data = self.read()
+        saved = data.get('outputs', {}).get(output)
+        if saved is not None and saved['archive'] == archive:
+            return saved['last_index']
+
+        if playlist is not None:
+            length = playlist.length(self)
+            index = self.playlist_index(archive)
+        else:
+            length = self.archive_len(archive)
+            index = self.index(archive)
+        if not length:
+            return 0
+        return (index + offset) % length
+
+    def set_output_index(self, output, archive, index, playlist=None):
+        """ Updates the position of `output` in the datafile.
+        """
+        if output == default_output:
+            if playlist is not None:
+                return self.set_playlist_index(archive, index)
+            return self.set_index(archive, index)
+
+        data = self.read()
+        data.setdefault('outputs', {})[output] = {
+            'archive': archive,
+            'last_index': index,
+        }
+        self.data = data
+
     def wallpaper(self, archive, index):
         """ Returns the path to wallpaper at `index` in archive.
         """
@@ -623,6 +1228,84 @@ class Data(object):
 
         return len(data['archives'][archive]['sequence'])
 
+    def indexed(self, archive):
+        """ Returns names of every wallpaper in `archive` known to the datafile
+        (sequence, and quarantine).
+        """
+        archive_data = self.read()['archives'][archive]
+        return archive_data['sequence'] + archive_data.get('quarantine', [])
+
+    def quarantined(self, archive):
+        """ Returns names of wallpapers quarantined in `archive` .
+        """
+        data = self.read()
+        return list(data['archives'][archive].get('quarantine', []))
+
+    def quarantine(self, archive, names):
+        """ Replaces the wallpapers quarantined in `archive` with `names` .
+
+        Newly quarantined wallpapers are removed from the sequence (positions are
+        adjusted to keep displaying the same wallpaper). Wallpapers no longer
+        quarantined are re-inserted after the current wallpaper, like new wallpapers.
+
+        Returns:
+            tuple: ``(added, released)`` lists of names
+        """
+        data = self.read()
+        archive_data = data['archives'][archive]
+        previous = archive_data.get('quarantine', [])
+        added = [n for n in names if n not in previous]
+        released = [n for n in previous if n not in names]
+        if not added and not released:
+            return (added, released)
+
+        positions = self._positions(data, archive)
+        sequence = archive_data['sequence']
+        removed = set(added)
+        for position in positions:
+            position['last_index'] -= len([
+                n for n in sequence[:position['last_index']] if n in removed
+            ])
+        sequence[:] = [n for n in sequence if n not in removed]
+        for position in positions:
+            position['last_index'] = min(position['last_index'], max(len(sequence) - 1, 0))
+
+        self._insert(data, archive, released)
+
+        archive_data['quarantine'] = list(names)
+        if not names:
+            archive_data.pop('quarantine')
+
+        self.validate(data)
+        self.write(data)
+        return (added, released)
+
+    @staticmethod
+    def _positions(data, archive):
+        """ Returns the position of every output on `archive` (dicts with a ``last_index`` ).
+        """
+        positions = [data['archives'][archive]]
+        for output_data in data.get('outputs', {}).values():
+            if output_data['archive'] == archive:
+                positions.append(output_data)
+        return positions
+
+    def _insert(self, data, archive, names):
+        """ Inserts `names` at random positions after the current (and already
+        extracted next) wallpaper of `archive` . Positions of outputs at or after
+        an insertion are shifted, so they keep displaying the same wallpaper.
+        """
+        archive_data = data['archives'][archive]
+        sequence = archive_data['sequence']
+        positions = self._positions(data, archive)
+        for name in names:
+            low = min(archive_data['last_index'] + 2, len(sequence))
+            insert_at = random.randint(low, len(sequence))
+            sequence.insert(insert_at, name)
+            for position in positions:
+                if position['last_index'] >= insert_at:
+                    position['last_index'] += 1
+
     def shuffle(self, archive=None):
         """ Randomize the wallpaper order.
         """
@@ -655,17 +1338,23 @@ class Data(object):
 
         def load_archive_contents(archive):
             path = config.archive_path(archive)
-            with tarfile.open(path, 'r') as archive_fd:
-                contents = list(archive_fd.getnames())
-                random.shuffle(contents)
-                data['archives'][archive] = {
-                    'last_index': 0,
-                    'sequence': [
-                        p.replace('./', '')
-                        for p in contents
-                        if p not in ('..', '.')
-                    ],
-                }
+            quarantine = data['archives'].get(archive, {}).get('quarantine', [])
+            with trace.span('scan', archive=archive, mode='full') as span:
+                with metrics.registry.timer('archive_scan_seconds', mode='full'):
+                    with storage.open_storage(path) as store:
+                        (contents, cursor) = store.scan()
+                span.set(members=len(contents))
+            metrics.registry.counter('archive_scan_members_total').inc(len(contents))
+            quarantine = [n for n in quarantine if n in contents]
+            contents = [n for n in contents if n not in quarantine]
+            random.shuffle(contents)
+            data['archives'][archive] = {
+                'last_index': 0,
+                'sequence': contents,
+                'scan_offset': cursor,
+            }
+            if quarantine:
+                data['archives'][archive]['quarantine'] = quarantine
             return data
 
         if archive is not None:
@@ -678,6 +1367,57 @@ class Data(object):
         self.write(data)
         self.data = data
 
+    def update_archive(self, config, archive):
+        """ Adds members appended to an archive since it was last scanned,
+        at random positions after the current wallpaper.
+
+        Only wallpapers added after the last scan are read (ex: new tar headers).
+        If the archive was rewritten (rather than appended to), falls back
+        to :py:meth:`reload_archive` .
+
+        Returns:
+            list: names of the added members
+        """
+        data = self.read()
+        archive_data = data['archives'].get(archive)
+        path = config.archive_path(archive)
+
+        if archive_data is None or 'scan_offset' not in archive_data:
+            self.reload_archive(config, archive)
+            return self.data['archives'][archive]['sequence']
+
+        try:
+            with trace.span('scan', archive=archive, mode='incremental') as span:
+                with metrics.registry.timer('archive_scan_seconds', mode='incremental'):
+                    with storage.open_storage(path) as store:
+                        (contents, cursor) = store.scan(archive_data['scan_offset'])
+                span.set(members=len(contents))
+            metrics.registry.counter('archive_scan_members_total').inc(len(contents))
+        except(storage.RewrittenError):
+            logger.info(
+                'archive "{}" was rewritten, rescanning'.format(archive)
+            )
+            self.reload_archive(config, archive)
+            return self.data['archives'][archive]['sequence']
+
+        quarantine = archive_data.get('quarantine', [])
+        contents = [n for n in contents if n not in quarantine]
+        if not contents and cursor == archive_data['scan_offset']:
+            return contents
+        self._insert(data, archive, contents)
+        archive_data['scan_offset'] = cursor
+
+        self.validate(data)
+        self.write(data)
+        return contents
+
+
+def _statkey(path):
+    """ Returns a tuple that changes whenever file at `path` (or fd) is modified.
+    """
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
 
 def print_archive_list(config=None):
     """ Prints all configured archives, descriptions, and paths.
@@ -705,6 +1445,18 @@ def print_archive_list(config=None):
                 path=archive_data['archive'],
             )
             printlines.append(fmt.format(**line_data))
+
+    for name in data.get('playlists') or {}:
+        weights = data['playlists'][name]
+        line_data = dict(
+            name=name,
+            sep='-',
+            desc='playlist: ' + ', '.join(
+                '{}x {}'.format(weights[archive], archive) for archive in weights
+            ),
+            path='',
+        )
+        printlines.append(fmt.format(**line_data))
     printlines.append('')
 
     print('\n'.join(printlines))
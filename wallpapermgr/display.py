@@ -1,7 +1,8 @@
 #!/usr/bin/env python
 # builtin
 from __future__ import absolute_import, division, print_function
-import glob
+import collections
+import concurrent.futures
 import logging
 import numbers
 import os
@@ -9,17 +10,25 @@ import socket
 import socketserver
 import subprocess
 import sys
-import tarfile
 import threading
 import time
 # external
 import xdg.BaseDirectory
 # internal
-from wallpapermgr import datafile
+from wallpapermgr import (
+    activation, backends, budgets, datafile, filters, history, idle, metadata, metrics, playlist,
+    shared, storage, targets, trace, verify, watch,
+)
 
 
 logger = logging.getLogger(__name__)
 
+# a wallpaper change of one output.
+#   member:    (archive, index) of the wallpaper to display
+#   position:  new (archive/playlist, index) in the output's sequence, or None to keep it
+#   record:    how it is added to the output's history ('append', 'prepend', or None)
+_Change = collections.namedtuple('_Change', ['member', 'position', 'record'])
+
 
 class RequestHandler(socketserver.BaseRequestHandler):
     """ SocketServer RequestHandler, parses/executes commands.
@@ -31,11 +40,11 @@ class RequestHandler(socketserver.BaseRequestHandler):
         return {
             'next': dict(
                 handler=self._handle_next,
-                desc='show next wallpaper'
+                desc='show next wallpaper (`next OUTPUT` only changes OUTPUT)'
             ),
             'prev': dict(
                 handler=self._handle_prev,
-                desc='show prev wallpaper'
+                desc='show prev wallpaper (`prev OUTPUT` only changes OUTPUT)'
             ),
             'interval': dict(
                 handler=self._handle_interval,
@@ -43,7 +52,7 @@ class RequestHandler(socketserver.BaseRequestHandler):
             ),
             'archive': dict(
                 handler=self._handle_archive,
-                desc='change archive wallpapers are loaded from.',
+                desc='change archive wallpapers are loaded from. (`archive NAME OUTPUT` only changes OUTPUT)',
             ),
             self.stop_command: dict(
                 handler=self._handle_stop,
@@ -53,6 +62,36 @@ class RequestHandler(socketserver.BaseRequestHandler):
                 handler=self._handle_reload,
                 desc='reload from configfile/datafile'
             ),
+            'stats': dict(
+                handler=self._handle_stats,
+                desc='print latency/throughput metrics. (`stats export` in prometheus format)',
+            ),
+            'profile': dict(
+                handler=self._handle_profile,
+                desc='`profile start` , `profile stop [FILE]` cProfile the server (FILE in the traces directory receives pstats)',
+            ),
+            'trace': dict(
+                handler=self._handle_trace,
+                desc='`trace start FILE` , `trace stop` write json-lines spans to FILE in the traces directory',
+            ),
+            'jobs': dict(
+                handler=self._handle_jobs,
+                desc='print maintenance jobs run while idle. (`jobs cancel NAME` stops one)',
+            ),
+            'query': dict(
+                handler=self._handle_query,
+                desc=(
+                    '`query ARCHIVE [FILTER ...] [offset=N] [limit=N]` list wallpapers matching '
+                    'every FILTER (ex: width>=3440 size<2m name~^wallhaven)'
+                ),
+            ),
+            'filter': dict(
+                handler=self._handle_filter,
+                desc=(
+                    '`filter [output=NAME] FILTER ...` only play wallpapers of the output\'s archive '
+                    'matching every FILTER (ex: aspect>2.3 name~space). `filter clear` plays all of them again'
+                ),
+            ),
             'help': dict(
                 handler=self._handle_help,
                 desc='print help message'
@@ -66,7 +105,17 @@ class RequestHandler(socketserver.BaseRequestHandler):
 
         data = rawdata.decode()
         data = str(data).strip()
-        self._run_command(data)
+        if not data:
+            return
+
+        keyword = data.split()[0]
+        if keyword not in self.command_map:
+            keyword = 'invalid'
+
+        metrics.registry.counter('requests_total', command=keyword).inc()
+        with trace.span('request', command=keyword):
+            with metrics.registry.timer('request_seconds', command=keyword):
+                self._run_command(data)
 
     def _run_command(self, command):
         keyword = command.split()[0]
@@ -78,37 +127,32 @@ class RequestHandler(socketserver.BaseRequestHandler):
 
         self.command_map[keyword]['handler'](*args)
 
-    def _handle_next(self):
-        data = self.server.data
-        archive = self.server.current_archive
-        index = self.server.current_index
-
-        if (index + 1) < data.archive_len(archive):
-            index = index + 1
-        else:
-            index = 0
+    def _handle_next(self, output=None):
+        self._step(1, output)
 
-        self._display(archive, index)
+    def _handle_prev(self, output=None):
+        self._step(-1, output)
 
-    def _handle_prev(self):
-        data = self.server.data
-        archive = self.server.current_archive
-        index = self.server.current_index
-
-        if (index - 1) >= 0:
-            index = index - 1
-        else:
-            index = data.archive_len(archive) - 1
+    def _step(self, step, output):
+        if output is not None and output not in self.server.outputs:
+            msg = 'no output named: "{}"'.format(output)
+            self.request.send(msg.encode())
+            return
 
-        self._display(archive, index)
+        self._reply_displayed(self.server.step_outputs(step, output))
 
     def _handle_interval(self, seconds):
         self.server.set_change_interval(float(seconds))
         msg = 'setting display interval to {}s'.format(seconds)
         self.request.send(msg.encode())
 
-    def _handle_archive(self, archive):
-        self.server.set_archive(archive)
+    def _handle_archive(self, archive, output=None):
+        if output is not None and output not in self.server.outputs:
+            msg = 'no output named: "{}"'.format(output)
+            self.request.send(msg.encode())
+            return
+
+        self.server.set_archive(archive, output)
         msg = 'switching to archive {}'.format(archive)
         self.request.send(msg.encode())
 
@@ -120,6 +164,117 @@ class RequestHandler(socketserver.BaseRequestHandler):
 
     def _handle_reload(self):
         self.request.send(b'reloading from saved data/config files..')
+        self.server.reload(reshuffle=True)
+
+    def _handle_stats(self, *args):
+        # metrics are exported by the client (the server does not write to paths clients choose)
+        if args == ('export',):
+            self.request.sendall(metrics.registry.format_prometheus().encode())
+        elif args == ('reset',):
+            metrics.registry.reset()
+            self.request.send(b'metrics reset')
+        elif not args:
+            self.request.sendall(metrics.registry.format_text().encode())
+        else:
+            self.request.send(b'usage: stats [export|reset]')
+
+    def _handle_profile(self, *args):
+        if args[:1] == ('start',):
+            trace.start_profile()
+            self.request.send(b'profiling started')
+        elif args[:1] == ('stop',) and len(args) <= 2:
+            try:
+                filepath = self._trace_path(args[1]) if len(args) == 2 else None
+                reply = trace.stop_profile(filepath)
+            except(RuntimeError) as exc:
+                reply = str(exc)
+            self.request.sendall(reply.encode())
+        else:
+            self.request.send(b'usage: profile start|stop [FILE]')
+
+    def _handle_trace(self, *args):
+        if args[:1] == ('start',) and len(args) == 2:
+            try:
+                trace.enable(self._trace_path(args[1]))
+            except(RuntimeError) as exc:
+                self.request.send(str(exc).encode())
+                return
+            self.request.send('tracing to {}'.format(trace.filepath()).encode())
+        elif args == ('stop',):
+            trace.disable()
+            self.request.send(b'tracing stopped')
+        else:
+            self.request.send(b'usage: trace start FILE|stop')
+
+    def _trace_path(self, filename):
+        """ Returns the path trace/profile file `filename` is written to,
+        in :py:attr:`Server.tracedir` (clients choose a name, not where the server writes).
+        """
+        if filename != os.path.basename(filename) or filename in ('.', '..'):
+            raise RuntimeError(
+                'expected a filename (written to {}), not a path: "{}"'.format(
+                    self.server.tracedir, filename
+                )
+            )
+        if not os.path.isdir(self.server.tracedir):
+            os.makedirs(self.server.tracedir)
+        return os.path.join(self.server.tracedir, filename)
+
+    def _handle_jobs(self, *args):
+        scheduler = self.server.scheduler
+        if args[:1] == ('cancel',) and len(args) == 2:
+            if scheduler.cancel(args[1]):
+                self.request.send('cancelled {}'.format(args[1]).encode())
+            else:
+                self.request.send('no job named: "{}"'.format(args[1]).encode())
+        elif not args:
+            self.request.sendall(scheduler.format_status().encode())
+        else:
+            self.request.send(b'usage: jobs [cancel NAME]')
+
+    def _handle_query(self, archive=None, *args):
+        if archive is None:
+            self.request.send(b'usage: query ARCHIVE [FILTER ...] [offset=N] [limit=N]')
+            return
+
+        page = {'offset': 0, 'limit': 100}
+        filters = []
+        for arg in args:
+            (key, _, value) = arg.partition('=')
+            if key in page and value.isdigit():
+                page[key] = int(value)
+            else:
+                filters.append(arg)
+
+        try:
+            reply = self.server.query(archive, filters, **page)
+        except(RuntimeError) as exc:
+            reply = str(exc)
+        self.request.sendall(reply.encode())
+
+    def _handle_filter(self, *args):
+        output = None
+        expressions = []
+        for arg in args:
+            (key, _, value) = arg.partition('=')
+            if key == 'output' and value:
+                output = value
+            else:
+                expressions.append(arg)
+        if output is not None and output not in self.server.outputs:
+            self.request.send('no output named: "{}"'.format(output).encode())
+            return
+
+        try:
+            if not expressions:
+                reply = self.server.filter_status()
+            elif expressions == ['clear']:
+                reply = self.server.clear_filter(output)
+            else:
+                reply = self.server.set_filter(expressions, output)
+        except(RuntimeError) as exc:
+            reply = str(exc)
+        self.request.sendall(reply.encode())
 
     def _handle_help(self):
         reply = [
@@ -132,12 +287,40 @@ class RequestHandler(socketserver.BaseRequestHandler):
 
         self.request.send('\n'.join(reply).encode() + b'\n\n')
 
-    def _display(self, archive, index):
-        self.server.display(archive, index)
-        msg = 'displaying {}({})'.format(archive, index)
+    def _reply_displayed(self, positions):
+        if list(positions) == [datafile.default_output]:
+            msg = 'displaying {}({})'.format(*positions[datafile.default_output])
+        else:
+            msg = 'displaying ' + ', '.join(
+                '{}: {}({})'.format(name, archive, index)
+                for (name, (archive, index)) in positions.items()
+            )
         self.request.send(msg.encode())
 
 
+class Output(object):
+    """ A monitor, showing it's own sequence of wallpapers.
+
+    Each output has it's own archive, position, prefetched wallpaper
+    and extracted files. Archive indexes, and the pool wallpapers are
+    extracted in, are shared by every output of a :py:class:`Server` .
+    """
+    __slots__ = ('name', 'archive', 'index', 'wallpaperfile', 'prefetch', 'slot')
+
+    def __init__(self, name, archive, index, wallpaperfile):
+        self.name = name
+        self.archive = archive
+        self.index = index
+        self.wallpaperfile = wallpaperfile  # (see wallpapermgr.targets.ExtractTarget.wallpaperfile)
+        self.prefetch = None  # (archive, index, future)
+        self.slot = targets.slots - 1  # target slot of the displayed wallpaper
+
+    def next_slot(self):
+        """ Returns the target slot the next wallpaper is extracted to (not the displayed one).
+        """
+        return (self.slot + 1) % targets.slots
+
+
 class Server(socketserver.UnixStreamServer):
     """ SocketServer that manages changing the wallpaper.
     """
@@ -148,24 +331,68 @@ class Server(socketserver.UnixStreamServer):
     wallpaperfile = '{}/wallpapers/wallpaper{{ext}}'.format(
         xdg.BaseDirectory.save_data_path('wallpapermgr')
     )
+    historyfile = '{}/history'.format(
+        xdg.BaseDirectory.save_data_path('wallpapermgr')
+    )
+    jobsfile = '{}/jobs.json'.format(
+        xdg.BaseDirectory.save_data_path('wallpapermgr')
+    )
+    metadatadir = '{}/metadata'.format(
+        xdg.BaseDirectory.save_data_path('wallpapermgr')
+    )
+    tracedir = '{}/traces'.format(
+        xdg.BaseDirectory.save_data_path('wallpapermgr')
+    )
 
-    def __init__(self, interval=None):
+    def __init__(self, interval=None, backend=None):
         """ constructor.
 
         Args:
             interval (numbers.Number, optional):
                 numer of seconds between wallpaper changes
+
+            backend (wallpapermgr.backends.DisplayBackend, optional):
+                If provided, used to display wallpapers instead of
+                the ``display_backend`` in the config.
+                (ex: :py:class:`wallpapermgr.backends.FakeBackend` )
         """
-        super(Server, self).__init__(self.sockfile, RequestHandler)
+        # socket-activated, the service manager owns the socket
+        sockets = activation.listen_sockets()
+        self.__activated = bool(sockets)
+        super(Server, self).__init__(
+            self.sockfile, RequestHandler, bind_and_activate=not sockets,
+        )
+        if sockets:
+            self.socket.close()
+            self.socket = sockets[0]
         self.__config = datafile.Config()
+        self.__backend = backend
+        self.__backend_from_config = backend is None
 
         if interval is None:
             interval = self.config.read().get('change_interval', None)
 
+        settings = self.config.read()
+        self.__history = history.History.read(
+            self.historyfile, size=settings.get('history_size', 256),
+        )
+        self.__member_cache = history.MemberCache(
+            settings.get('history_cache_size', 64 * 1024 * 1024),
+        )
+
         self.__data = datafile.Data()
         self.__timer = _ChangeWallpaperTimer(interval=interval)
-        self.__extract_in_progress = False
-        self.__last_extracted = None
+        self.__scheduler = idle.Scheduler(self.jobsfile)
+        self.__metadata = metadata.Store(self.metadatadir)
+        self.__watcher = None
+        self.__mappings = storage.MappingCache()
+        self.__lock = threading.RLock()
+        self.__outputs = collections.OrderedDict()
+        self.__target = None
+        self.__playlists = {}
+        self.__filters = {}  # {archive: filters.Filter}
+        self.__budgets = None
+        self.__pool = None
 
         self.reload()
 
@@ -177,13 +404,37 @@ class Server(socketserver.UnixStreamServer):
     def config(self):
         return self.__config
 
+    @property
+    def outputs(self):
+        """ Returns :py:class:`Output` s, by name (in config order).
+        """
+        return self.__outputs
+
     @property
     def current_archive(self):
-        return self.__archive
+        return list(self.__outputs.values())[0].archive
 
     @property
     def current_index(self):
-        return self.__index
+        return list(self.__outputs.values())[0].index
+
+    @property
+    def scheduler(self):
+        """ Returns :py:class:`wallpapermgr.idle.Scheduler` running maintenance jobs while idle.
+        """
+        return self.__scheduler
+
+    @property
+    def budgets(self):
+        """ Returns :py:class:`wallpapermgr.budgets.Budgets` the server runs within.
+        """
+        return self.__budgets
+
+    @property
+    def target(self):
+        """ Returns :py:class:`wallpapermgr.targets.ExtractTarget` wallpapers are extracted to.
+        """
+        return self.__target
 
     @staticmethod
     def is_active():
@@ -202,8 +453,12 @@ class Server(socketserver.UnixStreamServer):
             if not Server.is_active():
                 return
 
+        # connect first, the socket may be listened on by the service manager
+        # (socket activation), which starts the server itself.
+        sock = cls._connect()
+
         # if not the 'stop' command, start the server before issuing command.
-        if str(request) != str(RequestHandler.stop_command):
+        if sock is None and str(request) != str(RequestHandler.stop_command):
             pidfile = datafile.PidFile()
             if not pidfile.is_active():
                 logger.debug('server not running, restarting...')
@@ -217,20 +472,12 @@ class Server(socketserver.UnixStreamServer):
                 subprocess.Popen(cmds, stdin=None, stdout=None, stderr=None)
 
         # request
-        sock = None
         tries = 6
-        while tries > 0:
-            try:
-                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-                sock.connect(cls.sockfile)
-                break
-            except(FileNotFoundError, ConnectionRefusedError):
-                if tries != tries:
-                    logger.warning(
-                        'Unable to contact server - retrying in 0.5s'
-                    )
-                tries -= 1
-                time.sleep(0.5)
+        while sock is None and tries > 0:
+            logger.debug('Unable to contact server - retrying in 0.5s')
+            tries -= 1
+            time.sleep(0.5)
+            sock = cls._connect()
 
         if not sock:
             raise RuntimeError('unable to connect')
@@ -238,7 +485,13 @@ class Server(socketserver.UnixStreamServer):
         sanitized_request = request.encode()
         sock.send(sanitized_request)
         try:
-            reply = sock.recv(1024)
+            # server closes connection once request is handled
+            reply = b''
+            while True:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                reply += chunk
             sock.close()
             return reply
         except(Exception):
@@ -246,6 +499,18 @@ class Server(socketserver.UnixStreamServer):
                 return
             raise
 
+    @classmethod
+    def _connect(cls):
+        """ Returns a socket connected to the server, or None if nothing is listening.
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(cls.sockfile)
+        except(FileNotFoundError, ConnectionRefusedError):
+            sock.close()
+            return None
+        return sock
+
     def server_bind(self):
         # islink, isfile both fail
         if os.path.exists(self.sockfile):
@@ -260,128 +525,639 @@ class Server(socketserver.UnixStreamServer):
             pidfile = datafile.PidFile()
             pidfile.open()
             self.__timer.start()
+            self.__scheduler.start()
+            if self.config.read().get('auto_reload', True):
+                self.__watcher = watch.create(
+                    self._watched_paths(), self._handle_changes
+                )
+                self.__watcher.start()
             return super(Server, self).serve_forever(poll_interval)
         finally:
             logger.debug('shutdown initiated...')
-            self._delete_extracted()
+            if self.__watcher is not None:
+                self.__watcher.shutdown()
+                self.__watcher.join()
+                logger.debug('watcher shutdown..successful')
+            self.__scheduler.shutdown()
+            self.__scheduler.join()
+            logger.debug('idle jobs shutdown..successful')
+            for output in self.__outputs.values():
+                self._close_output(output)
+            self.__pool.shutdown()
+            self.__target.close()
             logger.debug('delete pending wallpaper.. successful')
+            self.__mappings.close()
+            self.__backend.close()
+            logger.debug('display backend close..successful')
             self.__timer.shutdown()
-            self.socket.shutdown(socket.SHUT_RDWR)
-            self.socket.close()
+            if self.__activated:
+                # the service manager keeps listening, and restarts us on the next request
+                self.socket.close()
+            else:
+                self.socket.shutdown(socket.SHUT_RDWR)
+                self.socket.close()
+                os.unlink(self.sockfile)
             logger.debug('socket shutdown..successful')
-            os.unlink(self.sockfile)
             self.data.write()
+            self.__history.write(self.historyfile)
+            self.__metadata.write()
             logger.debug('data dump..successful')
-            if os.path.exists(self.sockfile):
+            if not self.__activated and os.path.exists(self.sockfile):
                 os.unlink(self.sockfile)
             self.__timer.join()
             logger.debug('timer shutdown..successful')
             pidfile.close()
             logger.debug('pidfile close..successful')
 
-    def reload(self):
+    def reload(self, reshuffle=False):
+        """ Re-reads the config/datafile, and indexes wallpapers added to archives.
+
+        Args:
+            reshuffle (bool, optional):
+                if True, archives are rescanned and shuffled (restarting their sequences),
+                instead of keeping their order and positions (ex: ``wallmgr reload`` ).
+        """
         logger.info('reloading wallpaper configs..')
+        with trace.span('reload', reshuffle=reshuffle):
+            self._reload(reshuffle)
+
+    def _reload(self, reshuffle=False):
         self.__config.read(force=True)
         self.__data.read(force=True)
-        self.__data.reload_archive(config=self.__config)
-        self.__archive = self.__config.determine_archive()
-        self.__index = self.__data.index(self.__archive)
+        shared.from_config(self.__config)
+        if reshuffle:
+            self.__data.reload_archive(config=self.__config)
+        else:
+            for archive in self.__config.archives():
+                self.__data.update_archive(self.__config, archive)
+        self.__member_cache.clear()
+        self.__playlists = playlist.from_config(self.__config)
+        self._load_budgets()
+        self._load_target()
+        self._refresh_filters()
+        self._reindex_history()
+        self._load_outputs()
+        self._schedule_jobs()
 
         # reload server settings
         data = self.__config.read()
         self.__timer.set_interval(data.get('change_interval', None))
+        self._load_backend()
 
-    def shutdown(self):
-        logger.debug('requesting shutdown...')
-        return super(Server, self).shutdown()
+        if self.__watcher is not None:
+            self.__watcher.set_paths(self._watched_paths())
+
+    def _load_outputs(self):
+        """ (Re)creates outputs from the config.
+        Outputs sharing an archive start on different wallpapers.
+        """
+        outputs = collections.OrderedDict()
+        sharing = collections.Counter()
+        for name in self.config.outputs():
+            archive = self.config.output_archive(name)
+            index = self._output_position(name, archive, offset=sharing[archive])
+            sharing[archive] += 1
+            outputs[name] = Output(name, archive, index, self.__target.wallpaperfile(name))
+
+        # archives were re-shuffled, prefetched wallpapers are stale
+        for output in self.__outputs.values():
+            self._close_output(output)
+        self.__outputs = outputs
+
+    def _load_budgets(self):
+        """ (Re)creates budgets, and the extraction workers, if they changed in the config.
+        """
+        new_budgets = budgets.from_config(self.config)
+        if self.__budgets is not None and self.__budgets.settings == new_budgets.settings:
+            return
 
-    def display(self, archive, index):
+        # submitted extractions finish in the previous pool
+        if self.__pool is not None:
+            self.__pool.shutdown(wait=False)
+        self.__budgets = new_budgets
+        self.__pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=new_budgets.workers, thread_name_prefix='extract',
+        )
+        logger.info('budgets: {} workers, {} bytes per wallpaper in memory, {} bytes extracted'.format(
+            *new_budgets.settings
+        ))
+
+    def _load_target(self):
+        """ (Re)creates the extraction target from the config.
+        Call :py:meth:`_load_outputs` afterwards, to extract to the new target.
+        """
+        for output in self.__outputs.values():
+            self._close_output(output)
+        if self.__target is not None:
+            self.__target.close()
+
+        self.__target = targets.from_config(self.config)
+        self.__target.start()
+        logger.info('extracting wallpapers to {} ({})'.format(
+            self.__target.wallpaperfile(datafile.default_output), self.__target.name
+        ))
+
+    def _close_output(self, output):
+        """ Discards `output` 's prefetched wallpaper, and deletes it's extracted files.
+        """
+        self._cancel_prefetch(output)
+        self._delete_extracted(output)
+
+    def _cancel_prefetch(self, output):
+        if output.prefetch is not None:
+            future = output.prefetch[2]
+            output.prefetch = None
+            future.cancel()
+            concurrent.futures.wait([future])
+
+    def _discard_prefetches(self, archive):
+        """ Discards wallpapers prefetched from `archive` after it's sequence changed
+        (the prefetched position may now hold another wallpaper).
+        """
+        for output in self.__outputs.values():
+            if output.prefetch is not None and output.prefetch[0] == archive:
+                self._cancel_prefetch(output)
+                self._delete_extracted(output, output.next_slot())
+
+    def _load_backend(self):
+        if self.__backend_from_config:
+            if self.__backend is not None:
+                self.__backend.close()
+            self.__backend = backends.from_config(self.__config)
+        self.__backend.start()
+
+    def finish_request(self, request, client_address):
+        # requests and file-change handling share server state.
+        # idle jobs pause until requests stop arriving.
+        with self.__scheduler.busy(), self.__lock:
+            return super(Server, self).finish_request(request, client_address)
+
+    def _watched_paths(self):
+        paths = [self.config.filepath, self.data.filepath]
+        for archive in self.config.archives():
+            paths.append(self._archive_watch_path(archive))
+        return paths
+
+    def _archive_watch_path(self, archive):
+        path = self.config.archive_path(archive)
+        return storage.open_storage(path).watch_path
+
+    def _handle_changes(self, paths):
+        """ Called by the watcher with the set of modified files.
+        Only work required by the specific change is performed.
+        """
+        with self.__lock, trace.span('file_changes', paths=sorted(paths)):
+            if self.config.filepath in paths:
+                self._handle_config_changed()
+
+            if self.data.filepath in paths and self.data.is_modified():
+                logger.info('datafile modified, re-reading..')
+                self.data.read(force=True)
+                self._refresh_filters()
+                self._reindex_history()
+                for output in self.__outputs.values():
+                    output.index = self._output_position(output.name, output.archive)
+
+            for archive in self.config.archives():
+                if self._archive_watch_path(archive) in paths:
+                    self._handle_archive_changed(archive)
+
+            self.__watcher.set_paths(self._watched_paths())
+
+    def _handle_config_changed(self):
+        logger.info('configfile modified, re-reading..')
+        old_data = self.config.data
+        new_data = self.config.read(force=True)  # only modified archives are validated
+
+        if old_data.get('shared_daemon') != new_data.get('shared_daemon'):
+            shared.from_config(self.config)
+            self.__member_cache.clear()
+
+        # index new/moved archives
         data = self.data.read()
-        if index >= self.data.archive_len(archive):
-            raise RuntimeError(
-                'invalid index {} for archive {}'.format(index, archive)
-            )
+        for archive in new_data['archives']:
+            path = new_data['archives'][archive]['archive']
+            old_archive = old_data['archives'].get(archive, {})
+            if archive not in data['archives'] or old_archive.get('archive') != path:
+                self.data.reload_archive(self.config, archive)
+                self._refresh_filters(archive)
+                self._reindex_history(archive)
+
+        if old_data.get('playlists') != new_data.get('playlists'):
+            self.__playlists = playlist.from_config(self.config)
+
+        if old_data.get('extract_target') != new_data.get('extract_target'):
+            self._load_target()
+            self._load_outputs()
+        elif any([
+            old_data.get('outputs') != new_data.get('outputs'),
+            old_data.get('playlists') != new_data.get('playlists'),
+            any(
+                o.archive not in new_data['archives'] and o.archive not in self.__playlists
+                for o in self.__outputs.values()
+            ),
+        ]):
+            self._load_outputs()
 
-        # create wallpaperdir
-        wallpaper_dir = os.path.dirname(self.wallpaperfile)
-        if not os.path.isdir(wallpaper_dir):
-            os.makedirs(wallpaper_dir)
+        if old_data.get('change_interval') != new_data.get('change_interval'):
+            self.__timer.set_interval(new_data.get('change_interval', 0))
 
-        # extract wallpaper if not exist
-        if self.__last_extracted:
-            extracted_path = self.__last_extracted
-        else:
-            extracted_path = self._extract_wallpaper(archive, index, wait=True)
+        if old_data.get('budgets') != new_data.get('budgets'):
+            self._load_budgets()
 
-        # display wallpaper
-        self._display_wallpaper(extracted_path)
-        self.__archive = archive
-        self.__index = index
-        self.data.set_index(archive, index)
-        self.__change_interval = time.time()
+        if any(
+            old_data.get(key) != new_data.get(key)
+            for key in ('archives', 'verify_interval')
+        ):
+            self._schedule_jobs()
 
-        # delete last wallpaper
-        self._delete_extracted()
+        for key in ('display_backend', 'show_wallpaper_cmd'):
+            if old_data.get(key) != new_data.get(key):
+                self._load_backend()
+                break
 
-        # extract next wallpaper in advance
-        if (index + 1) < self.data.archive_len(archive):
-            self._extract_wallpaper(archive, index + 1)
-        else:
-            self._extract_wallpaper(archive, 0)
+    def _handle_archive_changed(self, archive):
+        self.__mappings.invalidate(self.config.archive_path(archive))
+        self.__member_cache.clear()
+        added = self.data.update_archive(self.config, archive)
+        self._discard_prefetches(archive)
+        logger.info('archive "{}" modified, indexed {} new wallpapers'.format(
+            archive, len(added)
+        ))
+        self._refresh_filters(archive)
+        self._reindex_history(archive)
+        self.__scheduler.add(idle.Job('index:' + archive, self._index_job(archive), priority=0))
+        self.__scheduler.add(idle.Job('metadata:' + archive, self._metadata_job(archive), priority=5))
+
+    def _schedule_jobs(self):
+        """ (Re)schedules maintenance jobs of every archive.
+
+        * ``index:ARCHIVE`` builds the archive's member index (mapping, zip directory,
+          checkpoint index) before it is first needed.
+        * ``metadata:ARCHIVE`` reads the size/dimensions/hash of new wallpapers, for ``query`` .
+        * ``verify:ARCHIVE`` verifies the archive every ``verify_interval`` ,
+          quarantining damaged wallpapers.
+        * ``history:ARCHIVE`` rebuilds the index history entries are resolved with,
+          after the archive's sequence changed (see :py:meth:`_reindex_history` ).
+        """
+        archives = self.config.archives()
+        interval = self.config.read().get('verify_interval', 86400)
+        for name in [j['name'] for j in self.__scheduler.status()]:
+            if name.split(':', 1)[1] not in archives:
+                self.__scheduler.remove(name)
+
+        for archive in archives:
+            self.__scheduler.add(idle.Job('index:' + archive, self._index_job(archive), priority=0))
+            self.__scheduler.add(idle.Job('metadata:' + archive, self._metadata_job(archive), priority=5))
+            if interval > 0:
+                self.__scheduler.add(idle.Job(
+                    'verify:' + archive, self._verify_job(archive), priority=10, interval=interval,
+                ))
+            else:
+                self.__scheduler.remove('verify:' + archive)
 
-    def _delete_extracted(self):
-        for old_wallpaper in glob.glob(self.wallpaperfile.format(ext='.*')):
-            os.remove(old_wallpaper)
+    def _reindex_history(self, archive=None):
+        """ Discards the history index of `archive` (or every archive) after it's sequence
+        changed, and rebuilds it while idle (rather than on the next ``prev`` ).
+        """
+        self.__history.invalidate(archive)
+        archives = [archive] if archive is not None else self.config.archives()
+        for archive in archives:
+            self.__scheduler.add(idle.Job('history:' + archive, self._history_job(archive), priority=0))
+
+    def _history_job(self, archive):
+        def steps(checkpoint):
+            with trace.span('history_index', archive=archive):
+                self.__history.index(self.data, archive)
+            yield None
+        return steps
+
+    def _index_job(self, archive):
+        def steps(checkpoint):
+            with self.__lock:
+                path = self.config.archive_path(archive)
+            with trace.span('index', archive=archive):
+                with storage.open_storage(path, self.__mappings) as store:
+                    store.prepare()
+            yield None
+        return steps
+
+    def _metadata_job(self, archive, chunk_size=64):
+        def steps(checkpoint):
+            with self.__lock:
+                if archive not in self.data.read()['archives']:
+                    return
+                indexed = self.data.indexed(archive)
+                path = self.config.archive_path(archive)
+                table = self.__metadata.table(archive)
+                if table.retain(indexed):
+                    self.__metadata.modified(archive)
+                missing = [name for name in indexed if name not in table]
+
+            for i in range(0, len(missing), chunk_size):
+                rows = []
+                with trace.span('metadata', archive=archive, members=len(missing[i:i + chunk_size])):
+                    with storage.open_storage(path, self.__mappings) as store:
+                        for name in missing[i:i + chunk_size]:
+                            try:
+                                rows.append((name, metadata.describe(store, name)))
+                            except storage.read_errors as exc:
+                                logger.debug('no metadata for "{}": {}'.format(name, exc))
+                with self.__lock:
+                    for (name, values) in rows:
+                        table.append(name, values)
+                    self.__metadata.modified(archive)
+                yield len(table)
+
+            with self.__lock:
+                self.__metadata.write()
+                if missing and archive in self.__filters:
+                    # newly described wallpapers may match
+                    self._refresh_filters(archive)
+        return steps
+
+    def _verify_job(self, archive):
+        def steps(checkpoint):
+            with self.__lock:
+                if archive not in self.data.read()['archives']:
+                    return
+                indexed = self.data.indexed(archive)
+                path = self.config.archive_path(archive)
+
+            report = verify.Report(path)
+            steps = verify.verify_steps(
+                report, indexed=indexed, checkpoint=checkpoint, mappings=self.__mappings,
+            )
+            for checkpoint in steps:
+                yield checkpoint
+            logger.info('verified {}'.format(report.summary()))
+            with self.__lock, trace.span('quarantine', archive=archive):
+                self._quarantine(archive, sorted(report.problems))
+        return steps
+
+    def _quarantine(self, archive, names):
+        if archive not in self.data.read()['archives']:
+            return
+        (added, released) = self.data.quarantine(archive, names)
+        if not added and not released:
+            return
+        logger.warning('archive "{}": quarantined {}, released {}'.format(
+            archive, added, released
+        ))
+        self._discard_prefetches(archive)
+        self._refresh_filters(archive)
+        self._reindex_history(archive)
+
+    def shutdown(self):
+        logger.debug('requesting shutdown...')
+        return super(Server, self).shutdown()
+
+    def display(self, archive, index, output=None):
+        """ Displays wallpaper at `index` of `archive` on `output` (default: the first output).
+        """
+        if output is None:
+            output = list(self.__outputs)[0]
+        self.display_outputs({output: (archive, index)})
 
-    def _extract_wallpaper(self, archive, index, wait=False):
+    def display_outputs(self, positions):
+        """ Changes the wallpaper of several outputs at once.
+
+        Wallpapers are extracted in parallel, then passed
+        to the display-backend in a single call.
+
+        Args:
+            positions (dict): ``(ex: {'left': ('normal_walls', 3), 'right': ('wide_walls', 7)})``
+                archive (or playlist) and index to display on each output.
         """
+        changes = collections.OrderedDict()
+        for (name, (archive, index)) in positions.items():
+            if name not in self.__outputs:
+                raise RuntimeError('no output named "{}"'.format(name))
+            if index >= self.sequence_len(archive):
+                raise RuntimeError(
+                    'invalid index {} for archive {}'.format(index, archive)
+                )
+            changes[name] = _Change(self.locate(archive, index), (archive, index), 'append')
+        self._change(changes)
+
+    def step_outputs(self, step, output=None):
+        """ Shows the next ( `step` 1) or previous ( `step` -1) wallpaper
+        on `output` (or every output if None).
+
+        The output's history is walked first, then it's sequence.
+
         Returns:
-            str: filepath to extracted wallpaper
+            collections.OrderedDict: ``(ex: {'left': ('normal_walls', 4)})``
+                position (or history wallpaper) displayed on each output.
         """
-        self.__extract_in_progress = True
-        self.__last_extracted = None
+        names = [output] if output is not None else list(self.__outputs)
+        changes = collections.OrderedDict(
+            (name, self._step_change(self.__outputs[name], step)) for name in names
+        )
+        self._change(changes)
+        return collections.OrderedDict(
+            (name, change.position or change.member) for (name, change) in changes.items()
+        )
 
-        if wait:
-            return extract_wallpaper(
-                self.config, self.data, archive, index
-            )
-        else:
-            t = threading.Thread(
-                target=extract_wallpaper,
-                kwargs=dict(
-                    config=self.config,
-                    data=self.data,
-                    archive=archive,
-                    index=index,
-                    finished_callback=self._wallpaper_extracted,
-                ),
+    def _step_change(self, output, step):
+        ring = self.__history.ring(output.name)
+        move = ring.forward if step > 0 else ring.back
+        entry = move()
+        while entry is not None:
+            member = self.__history.resolve(self.data, entry)
+            if member is not None:
+                metrics.registry.counter('history_steps_total', result='hit').inc()
+                return _Change(member, None, None)
+            entry = move()  # wallpaper no longer exists
+
+        metrics.registry.counter('history_steps_total', result='miss').inc()
+        oldest = self.__history.resolve(self.data, ring.oldest()) if len(ring) else None
+        if step < 0 and oldest is not None:
+            # before the oldest wallpaper in history, in it's archive's sequence
+            (archive, index) = oldest
+            member = (archive, (index - 1) % self.data.archive_len(archive))
+            return _Change(member, None, 'prepend')
+
+        length = self.sequence_len(output.archive)
+        position = (output.archive, (output.index + step) % length if length else 0)
+        return _Change(
+            self.locate(*position), position, 'append' if step > 0 else 'prepend',
+        )
+
+    def _change(self, changes):
+        names = [name for name in self.__outputs if name in changes]
+        fields = {name: list(changes[name].member) for name in names}
+        with trace.span('display', outputs=fields) as span:
+            self._display(names, changes, span)
+
+    def _display(self, names, changes, span):
+        # extract wallpapers (or wait for prefetch) of every output at once
+        display_start = time.monotonic()
+        with metrics.registry.timer('display_seconds', stage='extract'):
+            fetched = [
+                self._fetch_wallpaper(self.__outputs[name], *changes[name].member)
+                for name in names
+            ]
+            span.set(prefetched=[
+                name for (name, (_, hit)) in zip(names, fetched) if hit
+            ])
+            extracted_paths = collections.OrderedDict(
+                (name, self._fetched_path(name, future, changes[name].member))
+                for (name, (future, _)) in zip(names, fetched)
             )
-            t.start()
 
-    def _wallpaper_extracted(self, filepath):
-        self.__last_extracted = filepath
+        # display wallpapers
+        with trace.span('show', filepaths=list(extracted_paths.values())):
+            with metrics.registry.timer('display_seconds', stage='show'):
+                self._display_wallpapers(extracted_paths)
+        metrics.registry.histogram('display_seconds', stage='total').observe(
+            time.monotonic() - display_start
+        )
+
+        for name in names:
+            output = self.__outputs[name]
+            change = changes[name]
+            if change.position is not None:
+                (archive, index) = change.position
+                output.archive = archive
+                output.index = index
+                # (filtered positions are saved as their position in the sequence)
+                self.data.set_output_index(
+                    name, archive, self.locate(archive, index)[1] if archive in self.__filters else index,
+                    playlist=self.__playlists.get(archive),
+                )
+
+            ring = self.__history.ring(name)
+            if change.record is not None:
+                (archive, index) = change.member
+                entry = (archive, history.member_id(self.data.wallpaper(archive, index)))
+                # (ex: same wallpaper redisplayed on startup/reload)
+                if ring.cursor < 0 or ring.get(ring.cursor) != entry:
+                    getattr(ring, change.record)(*entry)
+
+            # delete the previous wallpaper. the displayed one is kept until the
+            # following change, setters may still be reading it.
+            previous = output.slot
+            output.slot = output.next_slot()
+            self._delete_extracted(output, previous)
+
+            # extract next wallpaper in advance
+            upcoming = ring.peek_forward()
+            upcoming = self.__history.resolve(self.data, upcoming) if upcoming else None
+            if upcoming is None:
+                length = self.sequence_len(output.archive)
+                upcoming = self.locate(output.archive, (output.index + 1) % length)
+            self._prefetch_wallpaper(output, *upcoming)
+        self.__change_interval = time.time()
+
+    def _fetch_wallpaper(self, output, archive, index):
+        """
+        Returns:
+            tuple: ``(future, prefetched)`` future resolves to filepath of extracted wallpaper
+        """
+        prefetch = output.prefetch
+        output.prefetch = None
+        if prefetch is not None and prefetch[:2] == (archive, index):
+            future = prefetch[2]
+            # (shed prefetches resolve to None)
+            if not (future.done() and (future.exception() or future.result() is None)):
+                metrics.registry.counter('prefetch_total', result='hit').inc()
+                return (future, True)
+
+        metrics.registry.counter('prefetch_total', result='miss').inc()
+        stale = prefetch[2] if prefetch else None
+        future = self._submit(
+            False, trace.profiled(self._extract_foreground), output, archive, index, stale
+        )
+        return (future, False)
 
-    def _display_wallpaper(self, filepath):
-        logger.debug('displaying wallpaper: {}'.format(filepath))
+    def _fetched_path(self, name, future, member):
+        """ Waits for an output's extracted wallpaper.
+        """
+        filepath = future.result()
         if filepath is None:
-            raise RuntimeError(
-                '`filepath` could not be found. received "{}"'.format(filepath)
-            )
-        subprocess.check_call(
-            self.config.show_wallpaper_cmd(filepath),
-            stdin=None, stdout=None, stderr=None
+            # prefetch was shed after it was fetched (budgets), extract it now
+            filepath = self._extract_foreground(self.__outputs[name], *member)
+        return filepath
+
+    def _submit(self, background, fn, *args, **kwargs):
+        """ Submits an extraction to the workers.
+
+        Returns:
+            concurrent.futures.Future: or None if `background` work was shed (budgets).
+        """
+        budget = self.__budgets
+        if not budget.start_task(background=background):
+            return None
+        future = self.__pool.submit(fn, *args, **kwargs)
+        future.add_done_callback(lambda f: budget.finish_task())
+        return future
+
+    def _extract_foreground(self, output, archive, index, stale=None):
+        # a prefetch of another wallpaper would write to the same slot
+        if stale is not None:
+            stale.cancel()
+            concurrent.futures.wait([stale])
+
+        return extract_wallpaper(
+            self.config, self.data, archive, index,
+            mappings=self.__mappings,
+            target=self.__target,
+            output=output.name,
+            slot=output.next_slot(),
+            cache=self.__member_cache,
+            budgets=self.__budgets,
         )
 
-    def set_archive(self, archive):
+    def _prefetch_wallpaper(self, output, archive, index):
+        future = self._submit(
+            True,
+            trace.profiled(extract_wallpaper),
+            config=self.config,
+            data=self.data,
+            archive=archive,
+            index=index,
+            mappings=self.__mappings,
+            target=self.__target,
+            output=output.name,
+            slot=output.next_slot(),
+            prefetch=True,
+            cache=self.__member_cache,
+            budgets=self.__budgets,
+        )
+        if future is not None:
+            output.prefetch = (archive, index, future)
+
+    def _delete_extracted(self, output, slot=None):
+        self.__target.delete(output.name, slot)
+        for n in (range(targets.slots) if slot is None else [slot]):
+            self.__budgets.release_extracted((output.name, n))
+
+    def _display_wallpapers(self, filepaths):
+        logger.debug('displaying wallpapers: {}'.format(dict(filepaths)))
+        for filepath in filepaths.values():
+            if filepath is None:
+                raise RuntimeError(
+                    '`filepath` could not be found. received "{}"'.format(filepath)
+                )
+        self.__backend.show_outputs(filepaths)
+
+    def set_archive(self, archive, output=None):
+        """ Switches `output` (or every output if None) to `archive` .
+        """
         data = self.data.read()
-        if archive not in data['archives']:
+        if archive not in data['archives'] and archive not in self.__playlists:
             raise RuntimeError(
-                'No archive in config with name: "{}"'.format(archive)
+                'No archive or playlist in config with name: "{}"'.format(archive)
             )
 
+        names = [output] if output is not None else list(self.__outputs)
         try:
-            index = data['archives'][archive]['last_index']
-            self.display(archive, index)
+            positions = collections.OrderedDict(
+                (name, (archive, self._output_position(name, archive, offset=i)))
+                for (i, name) in enumerate(names)
+            )
+            self.display_outputs(positions)
         except(KeyError):
             raise RuntimeError(
                 (
@@ -391,6 +1167,165 @@ class Server(socketserver.UnixStreamServer):
                 ).format(archive, archive)
             )
 
+    def query(self, archive, filters, offset=0, limit=100):
+        """ Lists wallpapers of `archive` matching every filter, one page at a time.
+
+        Args:
+            filters (list): ``(ex: ['width>=3440', 'name~^wallhaven'])``
+                see :py:func:`wallpapermgr.metadata.parse_terms`
+
+        Returns:
+            str: a summary line, then ``id  WIDTHxHEIGHT  size  name`` per wallpaper.
+        """
+        if archive not in self.data.read()['archives']:
+            raise RuntimeError('No archive in config with name: "{}"'.format(archive))
+        terms = metadata.parse_terms(filters)
+        table = self.__metadata.table(archive)
+
+        with metrics.registry.timer('query_seconds'):
+            rows = table.select(terms)
+        page = rows[offset:offset + limit]
+
+        indexed = len(self.data.indexed(archive))
+        lines = ['{} matches, showing {}-{}{}'.format(
+            len(rows),
+            min(offset, len(rows)),
+            offset + len(page),
+            '' if len(table) >= indexed else ' (metadata of {} of {} wallpapers read so far)'.format(
+                len(table), indexed
+            ),
+        )]
+        for i in page:
+            row = table.row(i)
+            lines.append('{:016x}  {:>5}x{:<5}  {:>10}  {}'.format(
+                row['id'], row['width'], row['height'], row['size'], row['name'],
+            ))
+        if offset + len(page) < len(rows):
+            lines.append('next page: offset={}'.format(offset + len(page)))
+        return '\n'.join(lines)
+
+    def set_filter(self, expressions, output=None):
+        """ Only plays the wallpapers matching every expression, in the archive
+        of `output` (default: the first output). Every output on that archive is filtered.
+        The archive's sequence is unchanged, outputs continue from the first match
+        after their current wallpaper.
+
+        Args:
+            expressions (list): ``(ex: ['aspect>2.3', 'name~space'])``
+                see :py:func:`wallpapermgr.metadata.parse_terms`
+
+        Returns:
+            str: ``(ex: 'normal_walls: 42 of 1200 wallpapers match aspect>2.3')``
+
+        Raises:
+            RuntimeError: if nothing matches, or nothing matches yet because
+                the wallpapers' metadata has not been read (ex: just after starting).
+        """
+        archive = self._filtered_archive(output)
+        sequence_filter = filters.Filter(archive, expressions)
+        sequence_filter.build(self.data, self.__metadata.table(archive))
+        if not len(sequence_filter):
+            total = self.data.archive_len(archive)
+            if sequence_filter.described < total and self._metadata_pending(archive):
+                raise RuntimeError(
+                    (
+                        'metadata not ready: metadata of {} of {} wallpapers in "{}" read so far. '
+                        'Retry once the metadata:{} job finished (see `wallmgr jobs`)'
+                    ).format(sequence_filter.described, total, archive, archive)
+                )
+            raise RuntimeError('no wallpapers match: {}'.format(sequence_filter.summary(self.data)))
+
+        self.__filters[archive] = sequence_filter
+        self._reposition_outputs(archive)
+        return sequence_filter.summary(self.data)
+
+    def clear_filter(self, output=None):
+        """ Plays every wallpaper of `output` 's archive again, from the current wallpaper.
+        """
+        archive = self._filtered_archive(output)
+        if self.__filters.pop(archive, None) is None:
+            return '{}: not filtered'.format(archive)
+        self._reposition_outputs(archive)
+        return '{}: filter cleared'.format(archive)
+
+    def filter_status(self):
+        """ Returns a line per filtered archive.
+        """
+        lines = [self.__filters[a].summary(self.data) for a in sorted(self.__filters)]
+        return '\n'.join(lines) or 'no filters'
+
+    def _metadata_pending(self, archive):
+        """ Returns True until the ``metadata:ARCHIVE`` job has read every wallpaper's metadata.
+        """
+        name = 'metadata:' + archive
+        return any(job['name'] == name for job in self.__scheduler.status())
+
+    def _filtered_archive(self, output):
+        if output is None:
+            output = list(self.__outputs)[0]
+        archive = self.__outputs[output].archive
+        if archive in self.__playlists:
+            raise RuntimeError('playlists cannot be filtered, filter their archives instead')
+        return archive
+
+    def _refresh_filters(self, archive=None):
+        """ Rebuilds filters after their archive's sequence (or metadata) changed,
+        and moves outputs to their position in the filtered sequence.
+        Filters nothing matches anymore are cleared.
+        """
+        archives = [archive] if archive is not None else list(self.__filters)
+        for archive in archives:
+            sequence_filter = self.__filters.get(archive)
+            if sequence_filter is None:
+                continue
+            if archive not in self.data.read()['archives']:
+                self.__filters.pop(archive)
+                continue
+            sequence_filter.build(self.data, self.__metadata.table(archive))
+            if not len(sequence_filter):
+                logger.warning('no wallpapers match filter of "{}" anymore, clearing it'.format(archive))
+                self.__filters.pop(archive)
+        for archive in archives:
+            self._reposition_outputs(archive)
+
+    def _reposition_outputs(self, archive):
+        for output in self.__outputs.values():
+            if output.archive == archive:
+                output.index = self._output_position(output.name, archive)
+
+    def _output_position(self, output, archive, offset=0):
+        """ Returns `output` 's saved position in `archive` (or playlist),
+        in the filtered sequence if `archive` is filtered.
+        """
+        index = self.data.output_index(
+            output, archive, offset=offset, playlist=self.__playlists.get(archive),
+        )
+        if archive in self.__filters:
+            return self.__filters[archive].position_of(index)
+        return index
+
+    def sequence_len(self, archive):
+        """ Returns the number of positions in an archive (or it's filter), or a playlist.
+        """
+        if archive in self.__playlists:
+            return self.__playlists[archive].length(self.data)
+        if archive in self.__filters:
+            return len(self.__filters[archive])
+        return self.data.archive_len(archive)
+
+    def locate(self, archive, index):
+        """ Returns the archive/index of the wallpaper at `index`
+        of an archive (or it's filter), or a playlist.
+
+        Returns:
+            tuple: ``(ex: ('wide_walls', 12))``
+        """
+        if archive in self.__playlists:
+            return self.__playlists[archive].locate(self.data, index)
+        if archive in self.__filters:
+            return (archive, self.__filters[archive].locate(index))
+        return (archive, index)
+
     def set_change_interval(self, seconds):
         self.__timer.set_interval(seconds)
 
@@ -460,35 +1395,92 @@ def extract_wallpaper(
         data,
         archive,
         index,
-        finished_callback=None
+        finished_callback=None,
+        mappings=None,
+        target=None,
+        output=datafile.default_output,
+        slot=0,
+        prefetch=False,
+        cache=None,
+        budgets=None,
 ):
-    archive_path = config.archive_path(archive)
-    with tarfile.open(archive_path, 'r') as archive_fd:
-        item_path = data.wallpaper(archive, index)
-        logger.debug('extracting archive/path:n{}({})'.format(
-                archive, item_path
-        ))
-        ext = os.path.splitext(item_path)[-1]
-        extracted_path = Server.wallpaperfile.format(ext=ext)
-        try:
-            fr = archive_fd.extractfile(item_path)
-            if not fr:
-                raise RuntimeError(
-                    'unable to find "{}" within tarfile: "{}"'.format(
-                        item_path, archive_path
-                    )
-                )
-            with open(extracted_path, 'wb') as fw:
-                fw.write(fr.read())
+    """ Extracts wallpaper at `index` of `archive` to :py:attr:`Server.wallpaperfile` .
 
-            if finished_callback:
-                finished_callback(extracted_path)
+    Args:
+        mappings (wallpapermgr.storage.MappingCache, optional):
+            if provided, the archive is read from it's shared memory-map.
 
-            return extracted_path
+        target (wallpapermgr.targets.ExtractTarget, optional):
+            extract to `output` 's file in this target instead of :py:attr:`Server.wallpaperfile`
 
-        finally:
-            if fr:
-                fr.close()
+        output (str, optional): ``(ex: 'left')``
+
+        slot (int, optional):
+            which of `output` 's files in `target` to extract to (see :py:mod:`wallpapermgr.targets` ).
+
+        prefetch (bool, optional):
+            wallpaper is extracted in advance (recorded in metrics/traces).
+
+        cache (wallpapermgr.history.MemberCache, optional):
+            if provided, recently extracted wallpapers are written from it,
+            instead of being read from the archive again.
+
+        budgets (wallpapermgr.budgets.Budgets, optional):
+            if provided, wallpapers too large to read into memory are streamed
+            to the target, and prefetches that exceed the extracted bytes are skipped.
+
+    Returns:
+        str: path of the extracted wallpaper, or None if the prefetch was skipped.
+    """
+    archive_path = config.archive_path(archive)
+    item_path = data.wallpaper(archive, index)
+    logger.debug('extracting archive/path:n{}({})'.format(
+            archive, item_path
+    ))
+    ext = os.path.splitext(item_path)[-1]
+    if target is not None:
+        extracted_path = target.wallpaperfile(output, slot).format(ext=ext)
+    else:
+        extracted_path = Server.wallpaperfile.format(ext=ext)
+
+    mode = 'prefetch' if (prefetch or finished_callback) else 'foreground'
+    with trace.span('extract', archive=archive, index=index, mode=mode) as span:
+        with metrics.registry.timer('extract_seconds', mode=mode):
+            cached = cache.get((archive, item_path)) if cache is not None else None
+            if cached is not None:
+                if budgets is not None and not budgets.reserve_extracted(
+                        (output, slot), len(cached), required=not prefetch):
+                    span.set(shed=True)
+                    return None
+                with open(extracted_path, 'wb') as fw:
+                    fw.write(cached)
+                size = len(cached)
+            else:
+                with storage.open_storage(archive_path, mappings) as store:
+                    in_memory = cache is not None
+                    if budgets is not None:
+                        size = store.size(item_path)
+                        if not budgets.reserve_extracted((output, slot), size, required=not prefetch):
+                            span.set(shed=True)
+                            return None
+                        in_memory = in_memory and budgets.fits_in_memory(size)
+
+                    if in_memory:
+                        contents = store.read(item_path)
+                        cache.put((archive, item_path), contents)
+                        with open(extracted_path, 'wb') as fw:
+                            fw.write(contents)
+                        size = len(contents)
+                    else:
+                        size = store.extract(item_path, extracted_path)
+        span.set(bytes=size, cached=cached is not None)
+    metrics.registry.histogram('extract_bytes').observe(size)
+    metrics.registry.counter(
+        'extract_bytes_total', target=target.name if target else 'disk'
+    ).inc(size)
+
+    if finished_callback:
+        finished_callback(extracted_path)
 
     return extracted_path
 
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+""" Filters restrict the wallpapers an archive plays to the ones matching a query.
+
+The archive's (shuffled) sequence is never modified. A filter is a compact
+array of the sequence positions whose wallpapers match, in sequence order,
+and outputs step through that array instead. Mapping a filtered position to
+a sequence position is constant time, so ``next`` / ``prev`` are unaffected
+by the size of the archive.
+
+Filters match the metadata the server reads while idle
+(see :py:mod:`wallpapermgr.metadata` ), wallpapers are never extracted to filter them.
+
+Example:
+
+    .. code-block:: python
+
+        ultrawide = Filter('normal_walls', ['aspect>2.3'])
+        ultrawide.build(data, store.table('normal_walls'))
+        len(ultrawide)
+        >>> 42
+        ultrawide.locate(3)         # sequence position of 4th match
+        >>> 117
+        ultrawide.position_of(117)  # filtered position of a sequence position
+        >>> 3
+
+"""
+# builtin
+from __future__ import absolute_import, division, print_function
+import array
+import bisect
+# external
+# internal
+from wallpapermgr import metadata
+
+
+class Filter(object):
+    """ The positions of an archive's sequence whose wallpapers match every term.
+    """
+    def __init__(self, archive, expressions):
+        """ Constructor.
+
+        Args:
+            archive (str): ``(ex: 'normal_walls')``
+            expressions (list): ``(ex: ['aspect>2.3', 'name~space'])``
+                see :py:func:`wallpapermgr.metadata.parse_terms`
+
+        Raises:
+            RuntimeError: if an expression is invalid
+        """
+        self.__archive = archive
+        self.__expressions = tuple(expressions)
+        self.__terms = metadata.parse_terms(expressions)
+        self.__positions = array.array('L')
+        self.__described = 0  # wallpapers in the sequence with metadata
+
+    @property
+    def archive(self):
+        return self.__archive
+
+    @property
+    def expressions(self):
+        return self.__expressions
+
+    @property
+    def described(self):
+        """ Returns the number of wallpapers in the sequence the filter could evaluate.
+        Wallpapers without metadata (yet) never match, unless the filter only matches names.
+        """
+        return self.__described
+
+    def __len__(self):
+        return len(self.__positions)
+
+    def build(self, data, table):
+        """ (Re)computes the matching positions, after the sequence or metadata changed.
+
+        Args:
+            data (wallpapermgr.datafile.Data):
+            table (wallpapermgr.metadata.Table): the archive's metadata
+        """
+        sequence = data.read()['archives'][self.__archive]['sequence']
+        if all(term[0] == 'name' for term in self.__terms):
+            positions = metadata.match_names(sequence, self.__terms)
+            self.__described = len(sequence)
+        else:
+            names = table.names
+            matching = set(names[i] for i in table.select(self.__terms))
+            positions = [i for (i, name) in enumerate(sequence) if name in matching]
+            self.__described = len([r for r in table.rows(sequence) if r >= 0])
+        self.__positions = array.array('L', positions)
+
+    def locate(self, position):
+        """ Returns the sequence position of filtered `position` .
+        """
+        return self.__positions[position]
+
+    def position_of(self, index):
+        """ Returns the filtered position of sequence position `index` ,
+        or of the last match before it (so the next step shows the first match after it).
+        """
+        if not self.__positions:
+            return 0
+        return (bisect.bisect_right(self.__positions, index) - 1) % len(self.__positions)
+
+    def summary(self, data):
+        """ Returns a line describing the filter (ex: for ``wallmgr filter`` ).
+        """
+        total = data.archive_len(self.__archive)
+        line = '{}: {} of {} wallpapers match {}'.format(
+            self.__archive, len(self), total, ' '.join(self.__expressions),
+        )
+        if self.__described < total:
+            line += ' (metadata of {} read so far)'.format(self.__described)
+        return line
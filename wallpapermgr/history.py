@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+""" Bounded history of displayed wallpapers, so `prev` returns exactly
+what was shown before, across archive switches, reloads and reshuffles.
+
+Each output has a fixed-size ring of ``(archive id, member id)`` entries,
+stored in two :py:class:`array.array` s. Member ids are a 64bit hash
+of the wallpaper's name, so entries survive reshuffles of the sequence.
+
+Example:
+
+    .. code-block:: python
+
+        hist = History.read('~/.local/share/wallpapermgr/history', size=256)
+        ring = hist.ring('default')
+        ring.append('normal_walls', member_id('wallhaven-474183.png'))
+        ring.back()
+        >>> None   # nothing earlier, fall back to the sequence
+        hist.write('~/.local/share/wallpapermgr/history')
+
+"""
+# builtin
+from __future__ import absolute_import, division, print_function
+import array
+import collections
+import hashlib
+import logging
+import marshal
+import os
+import threading
+# external
+# internal
+from wallpapermgr import metrics
+
+
+logger = logging.getLogger(__name__)
+
+file_version = 1
+
+
+def member_id(name):
+    """ Returns the 64bit id of a wallpaper, from it's name.
+    """
+    digest = hashlib.blake2b(name.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+class Ring(object):
+    """ Fixed-size history of one output. The oldest entry is overwritten when full.
+
+    A cursor points at the entry being displayed. :py:meth:`back` / :py:meth:`forward`
+    move it, :py:meth:`append` discards entries after it (like a browser's history).
+    """
+    def __init__(self, size):
+        self.__size = size
+        self.__archive_ids = array.array('H', [0]) * size
+        self.__member_ids = array.array('Q', [0]) * size
+        self.__archives = []  # archive name of each archive id
+        self.__start = 0      # slot of the oldest entry
+        self.__count = 0
+        self.__cursor = -1    # entry being displayed (0 is the oldest)
+
+    def __len__(self):
+        return self.__count
+
+    @property
+    def size(self):
+        return self.__size
+
+    @property
+    def cursor(self):
+        return self.__cursor
+
+    def _slot(self, position):
+        return (self.__start + position) % self.__size
+
+    def _archive_id(self, archive):
+        try:
+            return self.__archives.index(archive)
+        except(ValueError):
+            self.__archives.append(archive)
+            return len(self.__archives) - 1
+
+    def _write(self, position, archive, member):
+        slot = self._slot(position)
+        self.__archive_ids[slot] = self._archive_id(archive)
+        self.__member_ids[slot] = member
+
+    def get(self, position):
+        """
+        Returns:
+            tuple: ``(ex: ('normal_walls', 8147263311458375217))`` archive name, member id
+        """
+        slot = self._slot(position)
+        return (self.__archives[self.__archive_ids[slot]], self.__member_ids[slot])
+
+    def entries(self):
+        """ Yields entries, oldest first.
+        """
+        for position in range(self.__count):
+            yield self.get(position)
+
+    def append(self, archive, member):
+        """ Records a newly displayed wallpaper after the cursor.
+        """
+        self.__count = self.__cursor + 1
+        if self.__count == self.__size:
+            self.__start = self._slot(1)
+            self.__count -= 1
+        self._write(self.__count, archive, member)
+        self.__count += 1
+        self.__cursor = self.__count - 1
+
+    def prepend(self, archive, member):
+        """ Records a wallpaper shown before the oldest entry (the newest is dropped when full).
+        """
+        if self.__count == self.__size:
+            self.__count -= 1
+        self.__start = (self.__start - 1) % self.__size
+        self.__count += 1
+        self._write(0, archive, member)
+        self.__cursor = 0
+
+    def back(self):
+        """ Moves the cursor to the previous entry.
+
+        Returns:
+            tuple: the entry, or None if the cursor is at the oldest entry.
+        """
+        if self.__cursor <= 0:
+            return None
+        self.__cursor -= 1
+        return self.get(self.__cursor)
+
+    def forward(self):
+        """ Moves the cursor to the next entry.
+
+        Returns:
+            tuple: the entry, or None if the cursor is at the newest entry.
+        """
+        if self.__cursor >= self.__count - 1:
+            return None
+        self.__cursor += 1
+        return self.get(self.__cursor)
+
+    def peek_forward(self):
+        """ Returns the entry :py:meth:`forward` would return, without moving the cursor.
+        """
+        if self.__cursor >= self.__count - 1:
+            return None
+        return self.get(self.__cursor + 1)
+
+    def oldest(self):
+        if not self.__count:
+            return None
+        return self.get(0)
+
+    def dump(self):
+        """ Returns the ring as marshal-able values.
+        """
+        # store entries contiguously, oldest first
+        archive_ids = array.array('H', (self.__archive_ids[self._slot(i)] for i in range(self.__count)))
+        member_ids = array.array('Q', (self.__member_ids[self._slot(i)] for i in range(self.__count)))
+        return (
+            list(self.__archives),
+            self.__cursor,
+            archive_ids.tobytes(),
+            member_ids.tobytes(),
+        )
+
+    @classmethod
+    def load(cls, size, dumped):
+        """ Creates a ring from :py:meth:`dump` . If `size` is smaller, the oldest entries are dropped.
+        """
+        (archives, cursor, archive_bytes, member_bytes) = dumped
+        archive_ids = array.array('H')
+        archive_ids.frombytes(archive_bytes)
+        member_ids = array.array('Q')
+        member_ids.frombytes(member_bytes)
+
+        ring = cls(size)
+        skip = max(0, len(member_ids) - size)
+        for (archive_id, member) in zip(archive_ids[skip:], member_ids[skip:]):
+            ring.append(archives[archive_id], member)
+        ring.__cursor = min(max(cursor - skip, 0), ring.__count - 1)
+        return ring
+
+
+class History(object):
+    """ Rings of every output, persisted in a single file.
+
+    Entries are resolved to positions through an index of each archive's sequence
+    ( ``{member_id: index}`` ). Hashing every wallpaper's name is slow on large archives,
+    so the server rebuilds the index with :py:meth:`index` while idle, after
+    :py:meth:`invalidate` ing it whenever the sequence changes.
+    """
+    def __init__(self, size=256):
+        self.__size = size
+        self.__rings = {}
+        # archive -> (sequence, length, {member_id: index})
+        self.__indexes = {}
+        self.__generations = collections.Counter()  # archive -> number of invalidations
+        self.__lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self.__size
+
+    def ring(self, output):
+        ring = self.__rings.get(output)
+        if ring is None:
+            ring = self.__rings[output] = Ring(self.__size)
+        return ring
+
+    def invalidate(self, archive=None):
+        """ Discards the index of `archive` (or every archive), after it's sequence changed.
+        An :py:meth:`index` being built at the same time is discarded too.
+        """
+        with self.__lock:
+            archives = [archive] if archive is not None else list(self.__generations)
+            for archive in archives:
+                self.__indexes.pop(archive, None)
+                self.__generations[archive] += 1
+
+    def index(self, data, archive):
+        """ Builds the index of `archive` 's sequence, used by :py:meth:`resolve` .
+
+        Returns:
+            tuple: ``(sequence, length, {member_id: index})`` , or None if the archive does not exist.
+        """
+        with self.__lock:
+            archives = data.read()['archives']
+            if archive not in archives:
+                return None
+            sequence = archives[archive]['sequence']
+            names = list(sequence)
+            generation = self.__generations.setdefault(archive, 0)
+
+        index = {}
+        for (i, name) in enumerate(names):
+            index.setdefault(member_id(name), i)
+        metrics.registry.counter('history_index_builds_total').inc()
+
+        indexed = (sequence, len(names), index)
+        with self.__lock:
+            # (invalidated while building, the sequence may have changed after it was copied)
+            if self.__generations[archive] == generation:
+                self.__indexes[archive] = indexed
+        return indexed
+
+    def resolve(self, data, entry):
+        """ Returns the current index of a history entry's wallpaper.
+
+        Args:
+            data (wallpapermgr.datafile.Data):
+            entry (tuple): ``(ex: ('normal_walls', 8147263311458375217))``
+
+        Returns:
+            tuple: ``(ex: ('normal_walls', 12))`` , or None if the wallpaper no longer exists.
+        """
+        (archive, member) = entry
+        archives = data.read()['archives']
+        if archive not in archives:
+            return None
+
+        # reshuffles create a new list, new wallpapers are inserted at random positions
+        # (changing it's length). built here only if it was not rebuilt since.
+        sequence = archives[archive]['sequence']
+        (indexed, length, index) = self.__indexes.get(archive, (None, None, None))
+        if indexed is not sequence or length != len(sequence):
+            (_, _, index) = self.index(data, archive)
+
+        position = index.get(member)
+        if position is None:
+            return None
+        return (archive, position)
+
+    def write(self, filepath):
+        tmppath = '{}.{}'.format(filepath, os.getpid())
+        rings = {output: ring.dump() for (output, ring) in self.__rings.items()}
+        with open(tmppath, 'wb') as fd:
+            marshal.dump((file_version, rings), fd)
+        os.replace(tmppath, filepath)
+
+    @classmethod
+    def read(cls, filepath, size=256):
+        """ Returns the history saved at `filepath` (empty if it does not exist).
+        """
+        history = cls(size)
+        try:
+            with open(filepath, 'rb') as fd:
+                (version, rings) = marshal.load(fd)
+        except(IOError, OSError, EOFError, ValueError, TypeError):
+            return history
+
+        if version != file_version:
+            return history
+        for (output, dumped) in rings.items():
+            history.__rings[output] = Ring.load(size, dumped)
+        return history
+
+
+class MemberCache(object):
+    """ Recently extracted wallpapers (bytes), reused when they are shown again.
+    Least recently used wallpapers are evicted past `max_bytes` .
+    """
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.__max_bytes = max_bytes
+        self.__bytes = 0
+        self.__items = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key):
+        with self.__lock:
+            data = self.__items.get(key)
+            if data is not None:
+                self.__items.move_to_end(key)
+        metrics.registry.counter(
+            'member_cache_total', result='miss' if data is None else 'hit'
+        ).inc()
+        return data
+
+    def put(self, key, data):
+        if len(data) > self.__max_bytes:
+            return
+        with self.__lock:
+            old = self.__items.pop(key, None)
+            if old is not None:
+                self.__bytes -= len(old)
+            self.__items[key] = data
+            self.__bytes += len(data)
+            while self.__bytes > self.__max_bytes:
+                (_, evicted) = self.__items.popitem(last=False)
+                self.__bytes -= len(evicted)
+
+    def clear(self):
+        with self.__lock:
+            self.__items.clear()
+            self.__bytes = 0
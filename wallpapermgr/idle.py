@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+""" Runs maintenance jobs (verification, indexing) while the server is idle.
+
+Jobs are generators, advanced one step at a time by a single low-priority
+thread. Each step yields a checkpoint. Between steps the scheduler switches
+to higher priority jobs, and pauses entirely while a request is being handled
+(and for `idle_delay` seconds after), so jobs never delay ``next`` .
+
+Checkpoints are saved on shutdown, and an interrupted job resumes from it's
+checkpoint when it is scheduled again.
+
+Example:
+
+    .. code-block:: python
+
+        def count(checkpoint):
+            for i in range(checkpoint or 0, 1000):
+                do_work(i)
+                yield i + 1
+
+        scheduler = Scheduler('~/.local/share/wallpapermgr/jobs.json')
+        scheduler.add(Job('count', count, priority=10, interval=3600))
+        scheduler.start()
+
+        with scheduler.busy():
+            handle_request()    # jobs pause
+
+"""
+# builtin
+from __future__ import absolute_import, division, print_function
+import contextlib
+import ctypes
+import json
+import logging
+import os
+import platform
+import threading
+import time
+# external
+# internal
+from wallpapermgr import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# ioprio_set(2) syscall numbers
+_ioprio_set_syscalls = {'x86_64': 251, 'aarch64': 30, 'i686': 289, 'armv7l': 314}
+_ioprio_who_process = 1
+_ioprio_class_idle = 3
+_ioprio_class_shift = 13
+
+
+class Job(object):
+    """ A maintenance job.
+    """
+    def __init__(self, name, steps, priority=10, interval=None):
+        """ Constructor.
+
+        Args:
+            name (str): ``(ex: 'verify:normal_walls')``
+                unique name. Adding a job with the same name replaces it.
+
+            steps (callable):
+                ``steps(checkpoint)`` returns a generator doing the work,
+                yielding a (json serializable) checkpoint after each step.
+                checkpoint is None on the first run.
+
+            priority (int, optional):
+                lower runs first
+
+            interval (numbers.Number, optional):
+                if provided, the job runs again this many seconds after it finishes.
+        """
+        self.name = name
+        self.steps = steps
+        self.priority = priority
+        self.interval = interval
+        self.due = 0
+        self.seq = None         # queue entry
+        self.checkpoint = None
+        self.finished = None    # time of last completion
+        self.generator = None   # in progress
+        self.progress = 0       # steps completed this run
+        self.cancelled = False
+
+    @property
+    def state(self):
+        if self.generator is not None:
+            return 'running'
+        if self.due > time.time():
+            return 'waiting'
+        return 'queued'
+
+
+class Scheduler(threading.Thread):
+    """ Priority queue of :py:class:`Job` s, run by this thread while the server is idle.
+    """
+    def __init__(self, checkpointfile=None, idle_delay=2.0):
+        """ Constructor.
+
+        Args:
+            checkpointfile (str, optional):
+                where checkpoints are saved on shutdown (and read from).
+
+            idle_delay (numbers.Number, optional):
+                seconds without requests before jobs resume.
+        """
+        super(Scheduler, self).__init__(name='idle')
+        self.daemon = True
+        self.__checkpointfile = checkpointfile
+        self.__idle_delay = idle_delay
+        self.__jobs = {}
+        self.__queue = []   # (priority, due, seq, name)
+        self.__seq = 0
+        self.__lock = threading.Lock()
+        self.__wakeup = threading.Condition(self.__lock)
+        self.__busy = 0
+        self.__last_busy = time.monotonic()  # (server is busy starting up)
+        self.__running = None  # job being stepped (outside of lock)
+        self.__stop = False
+        self.__saved = self._read_checkpoints()
+
+    def _read_checkpoints(self):
+        if not self.__checkpointfile or not os.path.isfile(self.__checkpointfile):
+            return {}
+        try:
+            with open(self.__checkpointfile, 'r') as fd:
+                return json.load(fd)
+        except(IOError, OSError, ValueError) as exc:
+            logger.warning('unable to read job checkpoints: {}'.format(exc))
+            return {}
+
+    def _write_checkpoints(self):
+        if not self.__checkpointfile:
+            return
+        saved = {}
+        with self.__lock:
+            for job in self.__jobs.values():
+                saved[job.name] = {'checkpoint': job.checkpoint, 'finished': job.finished}
+        tmppath = '{}.{}'.format(self.__checkpointfile, os.getpid())
+        with open(tmppath, 'w') as fd:
+            json.dump(saved, fd)
+        os.replace(tmppath, self.__checkpointfile)
+
+    def add(self, job, delay=0):
+        """ Queues `job` , replacing any job with the same name.
+        The saved checkpoint (and time of last completion) of a job with the same name is reused.
+
+        Args:
+            delay (numbers.Number, optional):
+                seconds before the job may run.
+        """
+        with self.__lock:
+            previous = self.__jobs.get(job.name)
+            if previous is not None:
+                self._close(previous)
+                (job.checkpoint, job.finished) = (previous.checkpoint, previous.finished)
+            elif job.name in self.__saved:
+                saved = self.__saved.pop(job.name)
+                (job.checkpoint, job.finished) = (saved['checkpoint'], saved['finished'])
+
+            job.due = time.time() + delay
+            if job.interval and job.finished and job.checkpoint is None:
+                job.due = max(job.due, job.finished + job.interval)
+            self.__jobs[job.name] = job
+            self._push(job)
+
+    def _push(self, job):
+        self.__seq += 1
+        job.seq = self.__seq
+        self.__queue.append((job.priority, job.due, job.seq, job.name))
+        self.__wakeup.notify()
+
+    def _is_current(self, entry):
+        # entries of replaced/removed/rescheduled jobs are left in the queue
+        job = self.__jobs.get(entry[3])
+        return job is not None and job.seq == entry[2] and not job.cancelled
+
+    def _close(self, job):
+        job.cancelled = True
+        # a job's generator is closed by this thread, once it's step completes
+        if job.generator is not None and job is not self.__running:
+            job.generator.close()
+            job.generator = None
+
+    def remove(self, name):
+        """ Removes job `name` (ex: of an archive that is no longer configured).
+        """
+        with self.__lock:
+            job = self.__jobs.pop(name, None)
+            if job is not None:
+                self._close(job)
+
+    def cancel(self, name):
+        """ Stops `name` 's current run (it's checkpoint is discarded).
+        Repeating jobs are rescheduled after their interval.
+
+        Returns:
+            bool: False if there is no job named `name`
+        """
+        with self.__lock:
+            job = self.__jobs.pop(name, None)
+            if job is None:
+                return False
+            self._close(job)
+            if job.interval:
+                replacement = Job(job.name, job.steps, job.priority, job.interval)
+                replacement.finished = job.finished
+                replacement.due = time.time() + job.interval
+                self.__jobs[name] = replacement
+                self._push(replacement)
+        return True
+
+    @contextlib.contextmanager
+    def busy(self):
+        """ Context manager, pauses jobs while the server handles a request.
+        """
+        with self.__lock:
+            self.__busy += 1
+        try:
+            yield
+        finally:
+            with self.__lock:
+                self.__busy -= 1
+                self.__last_busy = time.monotonic()
+                self.__wakeup.notify()
+
+    def status(self):
+        """ Returns the state of every job, in the order they will run.
+
+        Returns:
+            list: ``(ex: [{'name': 'verify:normal_walls', 'state': 'running', 'priority': 10, 'due': 0, 'progress': 12, 'checkpoint': ...}])``
+        """
+        with self.__lock:
+            jobs = sorted(self.__jobs.values(), key=lambda j: (j.due > time.time(), j.priority, j.due))
+            return [
+                dict(
+                    name=job.name,
+                    state=job.state,
+                    priority=job.priority,
+                    due=job.due,
+                    progress=job.progress,
+                    checkpoint=job.checkpoint,
+                )
+                for job in jobs
+            ]
+
+    def format_status(self):
+        lines = []
+        now = time.time()
+        for job in self.status():
+            state = job['state']
+            if state == 'waiting':
+                state = 'in {:.0f}s'.format(job['due'] - now)
+            lines.append('{:<32} {:>10}  priority {:<3} steps {}'.format(
+                job['name'], state, job['priority'], job['progress'],
+            ))
+        return '\n'.join(lines) or 'no jobs'
+
+    def shutdown(self):
+        """ Stops the thread after the current step, and saves checkpoints.
+        """
+        with self.__lock:
+            self.__stop = True
+            self.__wakeup.notify()
+
+    def _next_job(self):
+        """ Waits until a job is due, and the server is idle (called with lock held).
+        """
+        while not self.__stop:
+            now = time.time()
+            self.__queue = [e for e in self.__queue if self._is_current(e)]
+
+            timeout = None
+            idle = time.monotonic() - self.__last_busy
+            if self.__busy:
+                timeout = None
+            elif idle < self.__idle_delay:
+                timeout = self.__idle_delay - idle
+            elif self.__queue:
+                ready = [e for e in self.__queue if e[1] <= now]
+                if ready:
+                    # highest priority job that is due
+                    return self.__jobs[min(ready)[3]]
+                timeout = min(e[1] for e in self.__queue) - now
+            self.__wakeup.wait(timeout)
+        return None
+
+    def run(self):
+        lower_thread_priority()
+        try:
+            while True:
+                with self.__lock:
+                    job = self._next_job()
+                    if job is None:
+                        return
+                    if job.generator is None:
+                        job.generator = job.steps(job.checkpoint)
+                        job.progress = 0
+                    self.__running = job
+                self._step(job)
+        finally:
+            with self.__lock:
+                for job in self.__jobs.values():
+                    if job.generator is not None:
+                        job.generator.close()
+                        job.generator = None
+            try:
+                self._write_checkpoints()
+            except(IOError, OSError) as exc:
+                logger.warning('unable to write job checkpoints: {}'.format(exc))
+
+    def _step(self, job):
+        try:
+            with metrics.registry.timer('idle_step_seconds', job=job.name.split(':')[0]):
+                checkpoint = next(job.generator)
+        except(StopIteration):
+            with self.__lock:
+                self._finish(job)
+            return
+        except(Exception):
+            logger.exception('job "{}" failed'.format(job.name))
+            with self.__lock:
+                self._finish(job)
+            return
+
+        with self.__lock:
+            self.__running = None
+            if job.cancelled:
+                job.generator.close()
+                job.generator = None
+                return
+            job.checkpoint = checkpoint
+            job.progress += 1
+
+    def _finish(self, job):
+        self.__running = None
+        job.generator = None
+        job.checkpoint = None
+        job.finished = time.time()
+        if job.cancelled:
+            return
+        metrics.registry.counter('idle_jobs_total', job=job.name.split(':')[0]).inc()
+        if job.interval:
+            job.due = job.finished + job.interval
+            self._push(job)
+        else:
+            self.__jobs.pop(job.name, None)
+
+
+def lower_thread_priority(niceness=19):
+    """ Lowers the cpu (nice) and io (idle class) priority of the calling thread,
+    and threads it starts. Linux only, ignored elsewhere.
+    """
+    if not hasattr(os, 'setpriority') or not hasattr(threading, 'get_native_id'):
+        return
+    tid = threading.get_native_id()
+    try:
+        os.setpriority(os.PRIO_PROCESS, tid, niceness)
+    except(OSError) as exc:
+        logger.debug('unable to lower thread priority: {}'.format(exc))
+
+    syscall = _ioprio_set_syscalls.get(platform.machine())
+    if syscall is None:
+        return
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        ioprio = _ioprio_class_idle << _ioprio_class_shift
+        if libc.syscall(syscall, _ioprio_who_process, tid, ioprio) != 0:
+            logger.debug('unable to lower io priority: errno {}'.format(ctypes.get_errno()))
+    except(OSError, AttributeError) as exc:
+        logger.debug('unable to lower io priority: {}'.format(exc))
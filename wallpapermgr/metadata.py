@@ -0,0 +1,476 @@
+#!/usr/bin/env python
+""" Columnar metadata of every wallpaper in an archive, for ``query`` .
+
+Each archive's :py:class:`Table` holds one :py:class:`array.array` per column,
+row ``i`` describing wallpaper ``names[i]`` :
+
+    =========  =======================================================
+    id         stable 64bit id of the wallpaper (hash of it's name,
+               see :py:func:`wallpapermgr.history.member_id` )
+    size       bytes
+    width      pixels (0 if the image format was not recognized)
+    height     pixels
+    mtime      modification time recorded by the archive (seconds since epoch)
+    hash       first 64bits of the blake2b hash of the contents
+    =========  =======================================================
+
+``aspect`` (width / height) is computed from the width/height columns when filtering.
+
+Filters are evaluated over whole columns at once. By default (numpy is not
+a dependency) in pure python, with numpy when it is installed
+(``pip install wallpapermgr[fast]`` , zero-copy views of the arrays).
+Tables are built by the server's ``metadata:ARCHIVE`` job while idle,
+and saved in ``$XDG_DATA_HOME/wallpapermgr/metadata/`` .
+
+Example:
+
+    .. code-block:: python
+
+        store = Store('~/.local/share/wallpapermgr/metadata')
+        table = store.table('normal_walls')
+        rows = table.select(parse_terms(['width>=3440', 'name~^wallhaven']))
+        [table.row(i) for i in rows[:10]]
+        >>> [{'name': 'wallhaven-474183.png', 'id': 8147263311458375217, 'width': 3440, ...}, ...]
+
+"""
+# builtin
+from __future__ import absolute_import, division, print_function
+import array
+import collections
+import hashlib
+import logging
+import marshal
+import operator
+import os
+import re
+import struct
+import threading
+# external
+try:
+    import numpy
+except(ImportError):
+    # optional, columns are filtered in pure python
+    numpy = None
+# internal
+from wallpapermgr import history
+
+
+logger = logging.getLogger(__name__)
+
+file_version = 1
+
+# {column: array typecode}
+columns = collections.OrderedDict([
+    ('id', 'Q'),
+    ('size', 'Q'),
+    ('width', 'I'),
+    ('height', 'I'),
+    ('mtime', 'q'),
+    ('hash', 'Q'),
+])
+_unsigned = {'id', 'size', 'width', 'height', 'hash', 'aspect'}
+# computed from other columns (ex: aspect>2.3 , aspect>=21:9 )
+derived = ('aspect',)
+
+_operators = collections.OrderedDict([
+    ('>=', operator.ge),
+    ('<=', operator.le),
+    ('!=', operator.ne),
+    ('=', operator.eq),
+    ('>', operator.gt),
+    ('<', operator.lt),
+    ('~', None),  # regex, names only
+])
+_term_pattern = re.compile(r'^(\w+)({})(.*)$'.format('|'.join(re.escape(op) for op in _operators)))
+_suffixes = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+def image_size(data):
+    """ Returns ``(width, height)`` of a png/jpeg/gif/bmp/webp image from it's header,
+    or ``(0, 0)`` if the format is not recognized.
+
+    Args:
+        data (bytes-like): the image (or at least it's first kilobytes)
+    """
+    head = bytes(data[:32])
+    try:
+        if head.startswith(b'\x89PNG\r\n\x1a\n'):
+            return struct.unpack('>II', head[16:24])
+        if head[:6] in (b'GIF87a', b'GIF89a'):
+            return struct.unpack('<HH', head[6:10])
+        if head.startswith(b'BM'):
+            (width, height) = struct.unpack('<ii', head[18:26])
+            return (abs(width), abs(height))
+        if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+            return _webp_size(head)
+        if head.startswith(b'\xff\xd8'):
+            return _jpeg_size(data)
+    except(struct.error, IndexError, ValueError):
+        pass
+    return (0, 0)
+
+
+def _webp_size(head):
+    chunk = head[12:16]
+    if chunk == b'VP8 ':
+        (width, height) = struct.unpack('<HH', head[26:30])
+        return (width & 0x3fff, height & 0x3fff)
+    if chunk == b'VP8L':
+        bits = struct.unpack('<I', head[21:25])[0]
+        return ((bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1)
+    if chunk == b'VP8X':
+        width = int.from_bytes(head[24:27], 'little') + 1
+        height = int.from_bytes(head[27:30], 'little') + 1
+        return (width, height)
+    return (0, 0)
+
+
+def _jpeg_size(data):
+    # walk segments until a start-of-frame (SOF0-15, except DHT/JPG/DAC)
+    pos = 2
+    end = len(data)
+    while pos + 9 <= end:
+        if data[pos] != 0xff:
+            return (0, 0)
+        marker = data[pos + 1]
+        if marker == 0xff:  # fill byte
+            pos += 1
+            continue
+        if marker in (0xd8, 0x01) or 0xd0 <= marker <= 0xd7:
+            pos += 2
+            continue
+        length = struct.unpack('>H', bytes(data[pos + 2:pos + 4]))[0]
+        if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+            (height, width) = struct.unpack('>HH', bytes(data[pos + 5:pos + 9]))
+            return (width, height)
+        pos += 2 + length
+    return (0, 0)
+
+
+def describe(store, name):
+    """ Returns the metadata row of wallpaper `name` , reading it from `store` .
+
+    Returns:
+        tuple: ``(id, size, width, height, mtime, hash)``
+    """
+    data = store.member(name)
+    try:
+        (width, height) = image_size(data)
+        digest = hashlib.blake2b(data, digest_size=8).digest()
+        size = len(data)
+    finally:
+        if isinstance(data, memoryview):
+            data.release()
+    try:
+        mtime = store.mtime(name)
+    except(NotImplementedError):
+        mtime = 0
+    return (
+        history.member_id(name),
+        size,
+        width,
+        height,
+        mtime,
+        int.from_bytes(digest, 'little'),
+    )
+
+
+def parse_terms(args):
+    """ Parses filter expressions (all must match).
+
+    ``COLUMN OP VALUE`` , where OP is one of ``= != < <= > >=`` ,
+    and ``name~REGEX`` / ``name=NAME`` match names.
+    sizes accept a k/m/g suffix (ex: ``size<2m`` ), ids/hashes may be hexadecimal (``0x...``),
+    aspect ratios may be a fraction (ex: ``aspect>2.3`` , ``aspect>=21:9`` ).
+
+    Args:
+        args (list): ``(ex: ['width>=3440', 'name~^wallhaven'])``
+
+    Returns:
+        list: ``(ex: [('width', '>=', 3440), ('name', '~', re.compile('^wallhaven'))])``
+    """
+    terms = []
+    for arg in args:
+        match = _term_pattern.match(arg)
+        if not match:
+            raise RuntimeError('invalid filter: "{}" (expected COLUMN OP VALUE)'.format(arg))
+        (column, op, value) = match.groups()
+
+        if column == 'name':
+            if op == '~':
+                try:
+                    terms.append((column, op, re.compile(value)))
+                except(re.error) as exc:
+                    raise RuntimeError('invalid regex "{}": {}'.format(value, exc))
+            elif op in ('=', '!='):
+                terms.append((column, op, value))
+            else:
+                raise RuntimeError('names can only be matched with =, != or ~')
+            continue
+
+        if column not in columns and column not in derived:
+            raise RuntimeError('unknown column "{}" (expected name, {})'.format(
+                column, ', '.join(list(columns) + list(derived))
+            ))
+        if op == '~':
+            raise RuntimeError('`~` only matches names')
+        if column == 'aspect':
+            number = _parse_ratio(value)
+        else:
+            number = _parse_number(value)
+        if number is None or (number < 0 and column in _unsigned):
+            raise RuntimeError('invalid value for {}: "{}"'.format(column, value))
+        terms.append((column, op, number))
+    return terms
+
+
+def _parse_number(value):
+    value = value.strip().lower()
+    multiplier = 1
+    if value[-1:] in _suffixes:
+        multiplier = _suffixes[value[-1]]
+        value = value[:-1]
+    try:
+        return int(value, 0) * multiplier
+    except(ValueError):
+        return None
+
+
+def _parse_ratio(value):
+    (numerator, _, denominator) = value.strip().partition(':')
+    try:
+        if denominator:
+            return float(numerator) / float(denominator)
+        return float(numerator)
+    except(ValueError, ZeroDivisionError):
+        return None
+
+
+def match_names(names, terms):
+    """ Returns indexes of `names` matching every ``name`` term (other terms are ignored).
+
+    Args:
+        names (list): ``(ex: ['wallhaven-474183.png', ...])``
+        terms (list): from :py:func:`parse_terms`
+    """
+    return _match_names(names, range(len(names)), terms)
+
+
+def _match_names(names, selected, terms):
+    for term in terms:
+        if term[0] == 'name':
+            match = _name_matcher(term)
+            selected = [i for i in selected if match(names[i])]
+    return list(selected)
+
+
+class Table(object):
+    """ Metadata of one archive's wallpapers, one array per column.
+    """
+    def __init__(self):
+        self.__names = []
+        self.__rows = {}  # {name: row}
+        self.__columns = collections.OrderedDict(
+            (column, array.array(typecode)) for (column, typecode) in columns.items()
+        )
+
+    def __len__(self):
+        return len(self.__names)
+
+    def __contains__(self, name):
+        return name in self.__rows
+
+    @property
+    def names(self):
+        return self.__names
+
+    def column(self, name):
+        """ Returns a column's :py:class:`array.array` .
+        """
+        return self.__columns[name]
+
+    def append(self, name, values):
+        """ Adds (or replaces) wallpaper `name` 's row.
+
+        Args:
+            values (tuple): ``(id, size, width, height, mtime, hash)`` (see :py:func:`describe` )
+        """
+        row = self.__rows.get(name)
+        if row is None:
+            self.__rows[name] = len(self.__names)
+            self.__names.append(name)
+            for (column, value) in zip(self.__columns.values(), values):
+                column.append(value)
+        else:
+            for (column, value) in zip(self.__columns.values(), values):
+                column[row] = value
+
+    def retain(self, names):
+        """ Drops rows of wallpapers that are not in `names` (ex: removed from the archive).
+
+        Returns:
+            int: number of rows dropped
+        """
+        names = set(names)
+        keep = [i for (i, name) in enumerate(self.__names) if name in names]
+        dropped = len(self.__names) - len(keep)
+        if not dropped:
+            return 0
+
+        self.__names = [self.__names[i] for i in keep]
+        self.__rows = dict((name, i) for (i, name) in enumerate(self.__names))
+        for (column, values) in self.__columns.items():
+            self.__columns[column] = array.array(values.typecode, (values[i] for i in keep))
+        return dropped
+
+    def row(self, i):
+        """ Returns row `i` as a dict (with it's ``name`` ).
+        """
+        row = collections.OrderedDict([('name', self.__names[i])])
+        for (column, values) in self.__columns.items():
+            row[column] = values[i]
+        return row
+
+    def rows(self, names):
+        """ Returns the row of each wallpaper in `names` (-1 where it has none).
+        """
+        return [self.__rows.get(name, -1) for name in names]
+
+    def select(self, terms):
+        """ Returns indexes of the rows matching every term, in row order.
+
+        Args:
+            terms (list): from :py:func:`parse_terms`
+
+        Returns:
+            list: ``(ex: [3, 17, 42])`` (a numpy array, if numpy is installed)
+        """
+        if not self.__names:
+            return []
+
+        # numeric columns narrow the rows first, names are only matched on what is left
+        numeric = [t for t in terms if t[0] != 'name']
+        named = [t for t in terms if t[0] == 'name']
+
+        if numpy is not None:
+            mask = numpy.ones(len(self.__names), dtype=bool)
+            for (column, op, value) in numeric:
+                mask &= _operators[op](self._vector(column), value)
+            selected = numpy.flatnonzero(mask)
+        else:
+            selected = range(len(self.__names))
+            for (column, op, value) in numeric:
+                value_of = self._getter(column)
+                compare = _operators[op]
+                selected = [i for i in selected if compare(value_of(i), value)]
+
+        if named:
+            selected = _match_names(self.__names, selected, named)
+        if numpy is not None:
+            return numpy.asarray(selected, dtype=numpy.int64)
+        return list(selected)
+
+    def _vector(self, column):
+        """ Returns a column as a numpy array (zero-copy, except derived columns).
+        """
+        if column == 'aspect':
+            width = self._vector('width').astype(numpy.float64)
+            height = self._vector('height').astype(numpy.float64)
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                return numpy.where(height > 0, width / height, 0.0)
+        values = self.__columns[column]
+        return numpy.frombuffer(values, dtype=values.typecode)
+
+    def _getter(self, column):
+        """ Returns a function returning a column's value in row ``i`` .
+        """
+        if column == 'aspect':
+            (width, height) = (self.__columns['width'], self.__columns['height'])
+            return lambda i: width[i] / height[i] if height[i] else 0.0
+        return self.__columns[column].__getitem__
+
+    def dump(self):
+        return (
+            list(self.__names),
+            dict((column, values.tobytes()) for (column, values) in self.__columns.items()),
+        )
+
+    @classmethod
+    def load(cls, dumped):
+        (names, dumped_columns) = dumped
+        table = cls()
+        for (column, typecode) in columns.items():
+            values = array.array(typecode)
+            values.frombytes(dumped_columns[column])
+            if len(values) != len(names):
+                raise ValueError('column "{}" has {} rows, expected {}'.format(
+                    column, len(values), len(names)
+                ))
+            table.__columns[column] = values
+        table.__names = list(names)
+        table.__rows = dict((name, i) for (i, name) in enumerate(names))
+        return table
+
+
+def _name_matcher(term):
+    (_, op, value) = term
+    if op == '~':
+        return lambda name: value.search(name) is not None
+    if op == '=':
+        return lambda name: name == value
+    return lambda name: name != value
+
+
+class Store(object):
+    """ :py:class:`Table` of every archive, each saved in it's own file in `dirpath` .
+    """
+    def __init__(self, dirpath):
+        self.__dirpath = dirpath
+        self.__tables = {}
+        self.__modified = set()
+        self.__lock = threading.Lock()
+
+    def _filepath(self, archive):
+        return os.path.join(self.__dirpath, archive)
+
+    def table(self, archive):
+        """ Returns `archive` 's table (read from disk the first time, empty if it was never built).
+        """
+        with self.__lock:
+            table = self.__tables.get(archive)
+            if table is None:
+                table = self.__tables[archive] = self._read(archive)
+            return table
+
+    def _read(self, archive):
+        try:
+            with open(self._filepath(archive), 'rb') as fd:
+                (version, dumped) = marshal.load(fd)
+            if version == file_version:
+                return Table.load(dumped)
+        except(IOError, OSError, EOFError, ValueError, TypeError, KeyError) as exc:
+            if os.path.exists(self._filepath(archive)):
+                logger.warning('unable to read metadata of "{}": {}'.format(archive, exc))
+        return Table()
+
+    def modified(self, archive):
+        """ Marks `archive` 's table to be saved by :py:meth:`write` .
+        """
+        with self.__lock:
+            self.__modified.add(archive)
+
+    def write(self):
+        """ Saves modified tables.
+        """
+        with self.__lock:
+            archives = sorted(self.__modified)
+            self.__modified.clear()
+            tables = [(archive, self.__tables[archive]) for archive in archives]
+        if tables and not os.path.isdir(self.__dirpath):
+            os.makedirs(self.__dirpath)
+        for (archive, table) in tables:
+            filepath = self._filepath(archive)
+            tmppath = '{}.{}'.format(filepath, os.getpid())
+            with open(tmppath, 'wb') as fd:
+                marshal.dump((file_version, table.dump()), fd)
+            os.replace(tmppath, filepath)
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# builtin
+from __future__ import absolute_import, division, print_function
+import bisect
+import contextlib
+import os
+import threading
+import time
+# external
+# internal
+
+
+class Counter(object):
+    """ A value that only increases.
+    """
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self.__lock:
+            self.value += amount
+
+
+class Histogram(object):
+    """ Counts observations in fixed, exponentially sized buckets.
+
+    Recording an observation is a bisect and an increment,
+    no observations are stored.
+
+    Example:
+
+        .. code-block:: python
+
+            hist = Histogram()
+            hist.observe(0.0021)
+            hist.percentile(50)
+            >>> 0.00216
+
+    """
+    def __init__(self, start=1e-6, factor=2 ** 0.5, count=80):
+        """ Constructor.
+
+        Args:
+            start (float):   upper bound of smallest bucket
+            factor (float):  ratio between each bucket's upper bound
+            count (int):     number of buckets (plus one overflow bucket)
+        """
+        self.bounds = [start * factor ** i for i in range(count)]
+        self.counts = [0] * (count + 1)
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+        self.__lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self.__lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def percentile(self, percent):
+        """ Returns approximate value at `percent` (0-100),
+        interpolated within the bucket it falls in.
+        """
+        with self.__lock:
+            if not self.count:
+                return None
+            target = self.count * percent / 100
+            seen = 0
+            for (index, count) in enumerate(self.counts):
+                if not count or seen + count < target:
+                    seen += count
+                    continue
+
+                lower = self.bounds[index - 1] if index > 0 else 0
+                upper = self.bounds[index] if index < len(self.bounds) else self.max
+                lower = max(lower, self.min)
+                upper = min(upper, self.max)
+                return lower + (upper - lower) * ((target - seen) / count)
+            return self.max
+
+
+class Registry(object):
+    """ Collection of named counters/histograms.
+
+    Metrics are identified by name and (optional) labels.
+
+    Example:
+
+        .. code-block:: python
+
+            registry.counter('prefetch_total', result='hit').inc()
+            with registry.timer('display_seconds', stage='show'):
+                backend.show(filepath)
+
+    """
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__counters = {}
+        self.__histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def counter(self, name, **labels):
+        key = self._key(name, labels)
+        metric = self.__counters.get(key)
+        if metric is None:
+            with self.__lock:
+                metric = self.__counters.setdefault(key, Counter())
+        return metric
+
+    def histogram(self, name, **labels):
+        key = self._key(name, labels)
+        metric = self.__histograms.get(key)
+        if metric is None:
+            # sizes are measured in bytes, everything else in seconds
+            if name.endswith('_bytes'):
+                new = Histogram(start=64, factor=2, count=40)
+            else:
+                new = Histogram()
+            with self.__lock:
+                metric = self.__histograms.setdefault(key, new)
+        return metric
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """ Records the duration of a with-block, in seconds.
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.histogram(name, **labels).observe(time.monotonic() - start)
+
+    def reset(self):
+        with self.__lock:
+            self.__counters.clear()
+            self.__histograms.clear()
+
+    def _items(self, metrics):
+        with self.__lock:
+            return sorted(metrics.items(), key=lambda x: x[0])
+
+    @staticmethod
+    def _labelstr(labels, extra=None):
+        labels = list(labels) + list(extra or [])
+        if not labels:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(k, v) for (k, v) in labels) + '}'
+
+    def format_text(self):
+        """ Returns human-readable summary of all metrics.
+        """
+        lines = ['', 'counters:', '=========']
+        for ((name, labels), counter) in self._items(self.__counters):
+            lines.append('  {}{}: {}'.format(name, self._labelstr(labels), counter.value))
+
+        lines.extend(['', 'histograms:', '==========='])
+        for ((name, labels), hist) in self._items(self.__histograms):
+            if not hist.count:
+                continue
+            if name.endswith('_bytes'):
+                def fmt(x):
+                    return '{:.0f}B'.format(x)
+            else:
+                def fmt(x):
+                    return '{:.2f}ms'.format(x * 1000)
+            lines.append(
+                '  {}{}: count={} p50={} p90={} p99={} max={}'.format(
+                    name, self._labelstr(labels),
+                    hist.count,
+                    fmt(hist.percentile(50)),
+                    fmt(hist.percentile(90)),
+                    fmt(hist.percentile(99)),
+                    fmt(hist.max),
+                )
+            )
+        lines.append('')
+        return '\n'.join(lines)
+
+    def format_prometheus(self, prefix='wallpapermgr_'):
+        """ Returns all metrics in the prometheus text exposition format.
+        """
+        lines = []
+        declared = set()
+
+        def declare(name, metric_type):
+            if name not in declared:
+                declared.add(name)
+                lines.append('# TYPE {}{} {}'.format(prefix, name, metric_type))
+
+        for ((name, labels), counter) in self._items(self.__counters):
+            declare(name, 'counter')
+            lines.append('{}{}{} {}'.format(
+                prefix, name, self._labelstr(labels), counter.value
+            ))
+
+        for ((name, labels), hist) in self._items(self.__histograms):
+            declare(name, 'histogram')
+            cumulative = 0
+            for (bound, count) in zip(hist.bounds, hist.counts):
+                cumulative += count
+                if not count:
+                    continue
+                lines.append('{}{}_bucket{} {}'.format(
+                    prefix, name,
+                    self._labelstr(labels, [('le', '{:g}'.format(bound))]),
+                    cumulative,
+                ))
+            lines.append('{}{}_bucket{} {}'.format(
+                prefix, name, self._labelstr(labels, [('le', '+Inf')]), hist.count
+            ))
+            lines.append('{}{}_sum{} {}'.format(prefix, name, self._labelstr(labels), hist.sum))
+            lines.append('{}{}_count{} {}'.format(prefix, name, self._labelstr(labels), hist.count))
+        return '\n'.join(lines) + '\n'
+
+    def export(self, filepath):
+        """ Writes metrics in prometheus format (ex: for node_exporter's textfile collector).
+        """
+        tmppath = '{}.{}'.format(filepath, os.getpid())
+        with open(tmppath, 'w') as fd:
+            fd.write(self.format_prometheus())
+        os.replace(tmppath, filepath)
+
+
+registry = Registry()
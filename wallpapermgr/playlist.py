@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+""" Playlists interleave the (shuffled) sequences of several archives, by weight.
+
+The combined order is never built. One period of the interleaving
+(``sum(weights)`` slots) is computed with smooth weighted round-robin,
+and any position is mapped to an archive/index in constant time.
+
+Example:
+
+    .. code-block:: python
+
+        mixed = Playlist('mixed', [('normal_walls', 3), ('wide_walls', 1)])
+        mixed.pattern
+        >>> ('normal_walls', 'normal_walls', 'wide_walls', 'normal_walls')
+        mixed.locate(data, 9)
+        >>> ('normal_walls', 7)
+
+"""
+# builtin
+from __future__ import absolute_import, division, print_function
+# external
+# internal
+
+
+class Playlist(object):
+    """ A weighted union of archives.
+    """
+    def __init__(self, name, weights):
+        """ Constructor.
+
+        Args:
+            name (str): ``(ex: 'mixed')``
+            weights (list): ``(ex: [('normal_walls', 3), ('wide_walls', 1)])``
+                archives, and number of wallpapers shown from each per period.
+        """
+        self.__name = name
+        self.__weights = tuple((archive, int(weight)) for (archive, weight) in weights)
+        self.__weight_of = dict(self.__weights)
+        self.__period = sum(weight for (_, weight) in self.__weights)
+        (self.__pattern, self.__ranks) = self._interleave(self.__weights)
+
+    @property
+    def name(self):
+        return self.__name
+
+    @property
+    def weights(self):
+        return self.__weights
+
+    @property
+    def archives(self):
+        return tuple(archive for (archive, _) in self.__weights)
+
+    @property
+    def pattern(self):
+        """ Returns the archive of each slot in one period.
+        """
+        return self.__pattern
+
+    @staticmethod
+    def _interleave(weights):
+        """ Smooth weighted round-robin. Archives are spread evenly through
+        the period instead of being shown in runs.
+
+        Returns:
+            tuple: ``(pattern, ranks)`` archive of each slot, and the number of
+            times that archive appeared earlier in the period.
+        """
+        total = sum(weight for (_, weight) in weights)
+        current = [0] * len(weights)
+        seen = [0] * len(weights)
+        pattern = []
+        ranks = []
+        for _ in range(total):
+            for (i, (_, weight)) in enumerate(weights):
+                current[i] += weight
+            best = current.index(max(current))
+            current[best] -= total
+            pattern.append(weights[best][0])
+            ranks.append(seen[best])
+            seen[best] += 1
+        return (tuple(pattern), tuple(ranks))
+
+    def length(self, data):
+        """ Returns the number of positions before the playlist repeats
+        (every archive's wallpapers have been shown at least once).
+
+        Args:
+            data (wallpapermgr.datafile.Data):
+        """
+        periods = 0
+        for (archive, weight) in self.__weights:
+            periods = max(periods, -(-data.archive_len(archive) // weight))
+        return periods * self.__period
+
+    def locate(self, data, position):
+        """ Returns the archive/index shown at `position` of the playlist.
+
+        Returns:
+            tuple: ``(ex: ('wide_walls', 12))``
+        """
+        (period, slot) = divmod(position, self.__period)
+        archive = self.__pattern[slot]
+        length = data.archive_len(archive)
+        if not length:
+            raise RuntimeError(
+                'archive "{}" in playlist "{}" is empty'.format(archive, self.__name)
+            )
+        weight = self.__weight_of[archive]
+        return (archive, (period * weight + self.__ranks[slot]) % length)
+
+
+def from_config(config):
+    """ Creates the playlists configured in `config` .
+
+    Example:
+
+        .. code-block:: yaml
+
+            playlists:
+               mixed:
+                  normal_walls: 3
+                  wide_walls:   1
+
+    Returns:
+        dict: ``{name: Playlist}``
+    """
+    data = config.read()
+    playlists = {}
+    for (name, weights) in (data.get('playlists') or {}).items():
+        playlists[name] = Playlist(name, list(weights.items()))
+    return playlists
@@ -0,0 +1,589 @@
+#!/usr/bin/env python
+""" Shared archive daemon, for workstations where several users display
+wallpapers from the same archives (ex: on a shared/network path).
+
+One system daemon owns everything that can be shared: the memory-maps
+of the archives, their member indexes, full scans, and an extraction cache.
+Each user's :py:class:`wallpapermgr.display.Server` becomes a lightweight
+front-end: it keeps it's own positions/history in it's own datafile, and
+reads archives under the daemon's roots through :py:class:`RemoteStorage` .
+
+Extracted wallpapers are passed to front-ends as sealed (read-only)
+memfds over the unix socket (``SCM_RIGHTS`` ), so a wallpaper shown by
+several users is extracted, and held in memory, once.
+
+Requests are a single line of json, replies are a single line of json
+(with the memfd attached, for ``extract`` ).
+
+Example:
+
+    ::
+
+        # system daemon (see data/systemd/wallpapermgr-shared.socket)
+        wallmgr shared --root /srv/wallpapers
+
+    .. code-block:: yaml
+
+        # each user's ~/.config/wallpapermgr/config.yml
+        shared_daemon: /run/wallpapermgr/shared.sock
+
+"""
+# builtin
+from __future__ import absolute_import, division, print_function
+import array
+import collections
+import fcntl
+import grp
+import json
+import logging
+import mmap
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+# external
+# internal
+from wallpapermgr import activation, budgets, metrics, storage
+
+
+logger = logging.getLogger(__name__)
+
+default_sockfile = '/run/wallpapermgr/shared.sock'
+
+_max_request = 1024 * 1024
+_seals = (
+    getattr(fcntl, 'F_SEAL_SEAL', 0x1)
+    | getattr(fcntl, 'F_SEAL_SHRINK', 0x2)
+    | getattr(fcntl, 'F_SEAL_GROW', 0x4)
+    | getattr(fcntl, 'F_SEAL_WRITE', 0x8)
+)
+_peercred = struct.Struct('3i')  # pid, uid, gid
+
+
+def is_supported():
+    """ The daemon requires sealable memfds (linux).
+    """
+    return all([
+        hasattr(os, 'memfd_create'),
+        hasattr(os, 'MFD_ALLOW_SEALING'),
+        hasattr(fcntl, 'F_ADD_SEALS'),
+        hasattr(socket, 'SCM_RIGHTS'),
+    ])
+
+
+def send_message(sock, message, fd=None):
+    """ Sends a json `message` line, optionally with file-descriptor `fd` attached.
+    """
+    payload = json.dumps(message).encode('utf-8') + b'\n'
+    if fd is None:
+        sock.sendall(payload)
+        return
+    ancdata = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', [fd]))]
+    sent = sock.sendmsg([payload], ancdata)
+    sock.sendall(payload[sent:])
+
+
+def recv_message(sock, maxsize=None):
+    """ Receives a json message line.
+
+    Returns:
+        tuple: ``(message, fds)`` file-descriptors attached to the message are owned by the caller.
+    """
+    chunks = []
+    fds = array.array('i')
+    size = 0
+    while True:
+        (chunk, ancdata, _, _) = sock.recvmsg(64 * 1024, socket.CMSG_SPACE(fds.itemsize))
+        for (level, kind, data) in ancdata:
+            if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size += len(chunk)
+        if chunk.endswith(b'\n'):
+            break
+        if maxsize and size > maxsize:
+            for fd in fds:
+                os.close(fd)
+            raise RuntimeError('message exceeds {} bytes'.format(maxsize))
+
+    if not chunks:
+        for fd in fds:
+            os.close(fd)
+        raise RuntimeError('connection closed without a reply')
+    return (json.loads(b''.join(chunks).decode('utf-8')), list(fds))
+
+
+def request(sockfile, message, timeout=30):
+    """ Sends a request to the shared daemon listening at `sockfile` .
+
+    Returns:
+        tuple: ``(reply, fd)`` fd is the attached memfd (or None), owned by the caller.
+
+    Raises:
+        wallpapermgr.storage.RewrittenError: a scan cursor is no longer valid
+        RuntimeError: the daemon could not complete the request
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        _connect(sock, sockfile, timeout)
+        send_message(sock, message)
+        (reply, fds) = recv_message(sock)
+    finally:
+        sock.close()
+
+    fd = fds.pop(0) if fds else None
+    for extra in fds:
+        os.close(extra)
+    if 'error' in reply:
+        if fd is not None:
+            os.close(fd)
+        if reply.get('rewritten'):
+            raise storage.RewrittenError(reply['error'])
+        raise RuntimeError('shared daemon: {}'.format(reply['error']))
+    return (reply, fd)
+
+
+def _connect(sock, sockfile, timeout):
+    """ Connects to the daemon, waiting while it's backlog is full
+    (every handler is busy, unix sockets with a timeout do not block in connect).
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return sock.connect(sockfile)
+        except(BlockingIOError):
+            if time.monotonic() > deadline:
+                raise socket.timeout('shared daemon is busy')
+            time.sleep(0.01)
+
+
+class MemfdCache(object):
+    """ Extracted wallpapers, in sealed memfds. Least recently used are closed past `max_bytes` .
+    Front-ends receive duplicates of the fds, evicting a wallpaper never affects them.
+    """
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.__max_bytes = max_bytes
+        self.__bytes = 0
+        self.__items = collections.OrderedDict()  # {key: (fd, size)}
+        self.__lock = threading.Lock()
+
+    def get(self, key):
+        """ Returns ``(fd, size)`` of a duplicate of the cached memfd (owned by the caller), or None.
+        """
+        with self.__lock:
+            item = self.__items.get(key)
+            if item is not None:
+                self.__items.move_to_end(key)
+                item = (os.dup(item[0]), item[1])
+        metrics.registry.counter(
+            'shared_cache_total', result='miss' if item is None else 'hit'
+        ).inc()
+        return item
+
+    def put(self, key, fd, size):
+        """ Caches a duplicate of sealed memfd `fd` .
+        """
+        if size > self.__max_bytes:
+            return
+        with self.__lock:
+            old = self.__items.pop(key, None)
+            if old is not None:
+                os.close(old[0])
+                self.__bytes -= old[1]
+            self.__items[key] = (os.dup(fd), size)
+            self.__bytes += size
+            while self.__bytes > self.__max_bytes:
+                (_, (evicted, evicted_size)) = self.__items.popitem(last=False)
+                os.close(evicted)
+                self.__bytes -= evicted_size
+
+    def close(self):
+        with self.__lock:
+            for (fd, _) in self.__items.values():
+                os.close(fd)
+            self.__items.clear()
+            self.__bytes = 0
+
+
+def _default_budgets():
+    return budgets.Budgets()
+
+
+def sealed_memfd(name, data=None, extract=None):
+    """ Returns a memfd containing `data` , sealed against modification
+    (it is safe to share with other users).
+
+    Args:
+        extract (callable, optional):
+            instead of `data` , called with the memfd's path to write it's contents
+            (ex: streamed by :py:meth:`wallpapermgr.storage.Storage.extract` ).
+    """
+    fd = os.memfd_create(name, os.MFD_CLOEXEC | os.MFD_ALLOW_SEALING)
+    try:
+        if extract is not None:
+            extract('/proc/self/fd/{}'.format(fd))
+        else:
+            with open(os.dup(fd), 'wb') as fw:
+                fw.write(data)
+        fcntl.fcntl(fd, fcntl.F_ADD_SEALS, _seals)
+    except(Exception):
+        os.close(fd)
+        raise
+    return fd
+
+
+class SharedRequestHandler(socketserver.StreamRequestHandler):
+    """ Handles a single request to the :py:class:`SharedServer` .
+    """
+    def handle(self):
+        fd = None
+        try:
+            message = json.loads(self.rfile.readline(_max_request).decode('utf-8'))
+            op = message['op']
+            handler = getattr(self.server, '_op_{}'.format(op), None)
+            if handler is None:
+                raise RuntimeError('unknown request "{}"'.format(op))
+            metrics.registry.counter('shared_requests_total', op=op).inc()
+            with metrics.registry.timer('shared_request_seconds', op=op):
+                (reply, fd) = handler(message)
+        except(storage.RewrittenError) as exc:
+            reply = {'error': str(exc), 'rewritten': True}
+        except(KeyError, TypeError, ValueError) as exc:
+            reply = {'error': 'invalid request: {}'.format(exc)}
+        except storage.read_errors as exc:
+            logger.warning('request failed: {}'.format(exc))
+            reply = {'error': str(exc)}
+
+        try:
+            send_message(self.request, reply, fd)
+        except(OSError) as exc:
+            logger.debug('unable to reply: {}'.format(exc))
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+
+class SharedServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """ System daemon owning the archives under `roots` , for every user's front-end.
+
+    Archives outside of `roots` are refused (the daemon may read files users cannot).
+    At most ``budgets.workers`` requests are handled at once, further connections
+    wait in the socket's backlog.
+    """
+    daemon_threads = True
+    request_queue_size = socket.SOMAXCONN
+
+    def __init__(
+            self,
+            roots,
+            sockfile=default_sockfile,
+            cache_size=512 * 1024 * 1024,
+            budgets=None,
+            group=None,
+            mode=None,
+    ):
+        """ Constructor.
+
+        Args:
+            roots (list): ``(ex: ['/srv/wallpapers'])``
+                directories containing the shared archives.
+
+            sockfile (str, optional):
+                unix socket front-ends connect to (ignored when socket-activated).
+
+            cache_size (int, optional):
+                max bytes of extracted wallpapers kept in memory.
+
+            budgets (wallpapermgr.budgets.Budgets, optional):
+                ``workers`` caps request handlers, wallpapers larger than
+                ``member_memory`` are streamed into their memfd.
+
+            group (str, optional): ``(ex: 'wallpapers')``
+                group owning `sockfile` (default: the daemon's group).
+
+            mode (int, optional): ``(ex: 0o660)``
+                permissions of `sockfile` (default: 0o660 with a `group` , otherwise 0o666).
+        """
+        if not is_supported():
+            raise RuntimeError('shared daemon requires memfd_create with sealing (linux)')
+        if not roots:
+            raise RuntimeError('shared daemon requires at least one root directory')
+
+        self.__roots = [os.path.realpath(os.path.expanduser(r)) for r in roots]
+        self.__sockfile = sockfile
+        self.__gid = None
+        if group is not None:
+            try:
+                self.__gid = grp.getgrnam(group).gr_gid
+            except(KeyError):
+                raise RuntimeError('unknown group "{}"'.format(group))
+        self.__mode = mode if mode is not None else (0o660 if group is not None else 0o666)
+        self.__budgets = budgets if budgets is not None else _default_budgets()
+        self.__handlers = threading.BoundedSemaphore(self.__budgets.workers)
+        self.__mappings = storage.MappingCache()
+        self.__members = MemfdCache(cache_size)
+        self.__scans = {}  # {path: (statkey, names, cursor)}
+        self.__lock = threading.Lock()
+
+        sockets = activation.listen_sockets()
+        self.__activated = bool(sockets)
+        super(SharedServer, self).__init__(
+            sockfile, SharedRequestHandler, bind_and_activate=not sockets,
+        )
+        if sockets:
+            self.socket.close()
+            self.socket = sockets[0]
+
+    @property
+    def roots(self):
+        return list(self.__roots)
+
+    def server_bind(self):
+        sockdir = os.path.dirname(self.__sockfile)
+        if sockdir and not os.path.isdir(sockdir):
+            os.makedirs(sockdir)
+        if os.path.exists(self.__sockfile):
+            os.unlink(self.__sockfile)
+        self.socket.bind(self.__sockfile)
+        # (by default any local user may connect, only archives under roots are served)
+        if self.__gid is not None:
+            os.chown(self.__sockfile, -1, self.__gid)
+        os.chmod(self.__sockfile, self.__mode)
+
+    def process_request(self, request, client_address):
+        # waits for a free handler (budgets.workers), instead of starting a thread per connection
+        self.__handlers.acquire()
+        try:
+            super(SharedServer, self).process_request(request, client_address)
+        except(Exception):
+            self.__handlers.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super(SharedServer, self).process_request_thread(request, client_address)
+        finally:
+            self.__handlers.release()
+
+    def serve_forever(self, poll_interval=0.5):
+        logger.info('serving archives under {} on {}'.format(
+            ', '.join(self.__roots), self.__sockfile
+        ))
+        try:
+            return super(SharedServer, self).serve_forever(poll_interval)
+        finally:
+            self.server_close()
+            self.__members.close()
+            self.__mappings.close()
+            if not self.__activated and os.path.exists(self.__sockfile):
+                os.unlink(self.__sockfile)
+
+    def verify_request(self, request, client_address):
+        if logger.isEnabledFor(logging.DEBUG):
+            try:
+                creds = request.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, _peercred.size)
+                (pid, uid, _) = _peercred.unpack(creds)
+                logger.debug('request from pid {} (uid {})'.format(pid, uid))
+            except(OSError, AttributeError):
+                pass
+        return True
+
+    def _resolve(self, path):
+        """ Returns the real path of archive `path` , if it is under one of the roots.
+        """
+        real = os.path.realpath(os.path.expanduser(path))
+        for root in self.__roots:
+            if real == root or real.startswith(root.rstrip(os.sep) + os.sep):
+                return real
+        raise RuntimeError('"{}" is not under a shared root'.format(path))
+
+    @staticmethod
+    def _statkey(store):
+        stat = os.stat(store.watch_path)
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _open(self, message):
+        return storage.open_storage(self._resolve(message['path']), self.__mappings, remote=False)
+
+    def _op_roots(self, message):
+        return ({'roots': self.roots}, None)
+
+    def _op_scan(self, message):
+        cursor = message.get('cursor')
+        with self._open(message) as store:
+            if cursor is not None:
+                (names, cursor) = store.scan(cursor)
+                return ({'names': names, 'cursor': cursor}, None)
+
+            # full scans are shared by every front-end, until the archive changes
+            statkey = self._statkey(store)
+            with self.__lock:
+                cached = self.__scans.get(store.path)
+            if cached is not None and cached[0] == statkey:
+                return ({'names': cached[1], 'cursor': cached[2]}, None)
+            (names, cursor) = store.scan()
+            with self.__lock:
+                self.__scans[store.path] = (statkey, names, cursor)
+        return ({'names': names, 'cursor': cursor}, None)
+
+    def _op_extract(self, message):
+        name = message['name']
+        with self._open(message) as store:
+            key = (store.path, self._statkey(store), name)
+            cached = self.__members.get(key)
+            if cached is not None:
+                (fd, size) = cached
+                return ({'size': size}, fd)
+
+            data = None
+            if self.__budgets.fits_in_memory(store.size(name)):
+                data = store.member(name)
+                size = len(data)
+                fd = sealed_memfd('wallpapermgr-shared', data)
+            else:
+                # streamed into the memfd, in chunks
+                fd = sealed_memfd(
+                    'wallpapermgr-shared', extract=lambda path: store.extract(name, path),
+                )
+                size = os.fstat(fd).st_size
+        if isinstance(data, memoryview):
+            data.release()
+        self.__members.put(key, fd, size)
+        metrics.registry.counter('shared_extract_bytes_total').inc(size)
+        return ({'size': size}, fd)
+
+    def _op_size(self, message):
+        with self._open(message) as store:
+            return ({'size': store.size(message['name'])}, None)
+
+    def _op_mtime(self, message):
+        with self._open(message) as store:
+            return ({'mtime': store.mtime(message['name'])}, None)
+
+    def _op_prepare(self, message):
+        with self._open(message) as store:
+            store.prepare()
+        return ({}, None)
+
+    def _op_verify(self, message):
+        with self._open(message) as store:
+            (checked, problems) = store.verify(message['names'])
+        return ({'bytes': checked, 'problems': problems}, None)
+
+    def _op_verify_layout(self, message):
+        with self._open(message) as store:
+            return ({'layout': store.verify_layout()}, None)
+
+
+class RemoteStorage(storage.Storage):
+    """ An archive read through the shared daemon (see :py:func:`from_config` ).
+    Read-only, archives are modified on the daemon's host.
+    """
+    def __init__(self, path, sockfile):
+        super(RemoteStorage, self).__init__(path)
+        self.__sockfile = sockfile
+
+    @property
+    def watch_path(self):
+        return storage.storage_type(self.path)(self.path).watch_path
+
+    def _request(self, op, **kwargs):
+        kwargs.update(op=op, path=self.path)
+        return request(self.__sockfile, kwargs)
+
+    def scan(self, cursor=None):
+        (reply, _) = self._request('scan', cursor=cursor)
+        return (reply['names'], reply['cursor'])
+
+    def _extract_fd(self, name):
+        (reply, fd) = self._request('extract', name=name)
+        if fd is None:
+            raise RuntimeError('shared daemon did not send "{}"'.format(name))
+        return (fd, reply['size'])
+
+    def read(self, name):
+        (fd, size) = self._extract_fd(name)
+        try:
+            if not size:
+                return b''
+            with mmap.mmap(fd, size, access=mmap.ACCESS_READ) as mapped:
+                return mapped[:]
+        finally:
+            os.close(fd)
+
+    def extract(self, name, filepath):
+        (fd, size) = self._extract_fd(name)
+        try:
+            with open(filepath, 'wb') as fw:
+                offset = 0
+                while offset < size:
+                    sent = os.sendfile(fw.fileno(), fd, offset, size - offset)
+                    if not sent:
+                        raise RuntimeError('short read of "{}" from shared daemon'.format(name))
+                    offset += sent
+        finally:
+            os.close(fd)
+        return size
+
+    def size(self, name):
+        (reply, _) = self._request('size', name=name)
+        return reply['size']
+
+    def mtime(self, name):
+        (reply, _) = self._request('mtime', name=name)
+        return reply['mtime']
+
+    def prepare(self):
+        self._request('prepare')
+
+    def verify(self, names):
+        (reply, _) = self._request('verify', names=list(names))
+        return (reply['bytes'], reply['problems'])
+
+    def verify_layout(self):
+        (reply, _) = self._request('verify_layout')
+        return reply['layout']
+
+    def _read_only(self):
+        return RuntimeError(
+            '"{}" is read through the shared daemon, modify it on the daemon\'s host'.format(self.path)
+        )
+
+    def add(self, filepaths):
+        raise self._read_only()
+
+    def remove(self, names):
+        raise self._read_only()
+
+
+def from_config(config):
+    """ Reads archives under the shared daemon's roots through it,
+    if ``shared_daemon`` is configured (otherwise archives are read directly).
+
+    If the daemon cannot be reached, archives are read directly (and a warning is logged).
+
+    Returns:
+        list: roots of the archives read through the daemon
+    """
+    sockfile = config.read().get('shared_daemon')
+    if not sockfile:
+        storage.set_remote_roots([], None)
+        return []
+
+    sockfile = os.path.expanduser(sockfile)
+    try:
+        (reply, _) = request(sockfile, {'op': 'roots'})
+        roots = reply['roots']
+    except(OSError, RuntimeError) as exc:
+        logger.warning('shared daemon unavailable ({}), reading archives directly'.format(exc))
+        roots = []
+
+    storage.set_remote_roots(roots, lambda path: RemoteStorage(path, sockfile))
+    if roots:
+        logger.info('reading archives under {} through the shared daemon'.format(', '.join(roots)))
+    return roots
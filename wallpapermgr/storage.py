@@ -0,0 +1,1519 @@
+#!/usr/bin/env python
+# builtin
+from __future__ import absolute_import, division, print_function
+import array
+import binascii
+import bisect
+import collections
+import hashlib
+import json
+import logging
+import lzma
+import mmap
+import os
+import shutil
+import tarfile
+import struct
+import threading
+import time
+import zipfile
+import zlib
+# external
+# internal
+from wallpapermgr import metrics, tarscan
+
+
+logger = logging.getLogger(__name__)
+
+_chunk_size = 64 * 1024
+# signature, version, flags, method, time, date, crc32, sizes, name length, extra length
+_zip_local_header = struct.Struct('<4s5H3L2H')
+_zip_local_signature = b'PK\x03\x04'
+_remote_roots = []  # [(root, opener)] see set_remote_roots()
+
+# raised when reading a damaged archive/member
+read_errors = (
+    RuntimeError, IOError, OSError, ValueError, EOFError,
+    tarfile.TarError, zipfile.BadZipFile, zlib.error, lzma.LZMAError,
+)
+
+
+class RewrittenError(RuntimeError):
+    """ Raised by :py:meth:`Storage.scan` when an archive was rewritten
+    (rather than appended to) since the cursor was issued.
+    """
+    pass
+
+
+class MappedFile(object):
+    """ A read-only memory-map of an archive, shared by every thread reading from it.
+
+    Members are exposed as ``memoryview`` slices of :py:attr:`view` (no copies,
+    no open/seek/read syscalls). Storages may cache their member offsets in
+    :py:attr:`members` , which lives as long as the mapping.
+
+    Files replaced on disk (ex: ``git pull``) remain mapped until the mapping
+    is refreshed by :py:class:`MappingCache` .
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.members = None
+        with open(path, 'rb') as fd:
+            stat = os.fstat(fd.fileno())
+            self.statkey = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+            self._mmap = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self._mmap)
+
+    def close(self):
+        """ Unmaps the file. If a member's memoryview is still in use,
+        it is left to be unmapped once released.
+        """
+        try:
+            self.view.release()
+            self._mmap.close()
+        except(BufferError):
+            pass
+
+
+class MappingCache(object):
+    """ One :py:class:`MappedFile` per archive, refreshed when the archive changes.
+
+    Example:
+
+        .. code-block:: python
+
+            mappings = MappingCache()
+            with open_storage('~/wallpapers/normal_walls.tar', mappings) as store:
+                view = store.member('wallhaven-474183.png')   # memoryview
+
+    """
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__mappings = {}
+
+    def get(self, path):
+        """ Returns the mapping of `path` , or None if it cannot be mapped
+        (directories, empty files).
+        """
+        try:
+            stat = os.stat(path)
+        except(OSError):
+            return None
+        if not os.path.isfile(path) or not stat.st_size:
+            return None
+
+        statkey = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        with self.__lock:
+            mapping = self.__mappings.get(path)
+            if mapping is not None and mapping.statkey == statkey:
+                return mapping
+
+            # threads using the previous mapping keep it alive until they are done
+            logger.debug('mapping archive: {}'.format(path))
+            mapping = MappedFile(path)
+            self.__mappings[path] = mapping
+            metrics.registry.counter('archive_mmap_total').inc()
+            return mapping
+
+    def invalidate(self, path):
+        """ Forgets mapping of `path` (ex: when the archive changes).
+        """
+        with self.__lock:
+            self.__mappings.pop(path, None)
+
+    def close(self):
+        with self.__lock:
+            mappings = list(self.__mappings.values())
+            self.__mappings.clear()
+        for mapping in mappings:
+            mapping.close()
+
+
+class Storage(object):
+    """ Base class for the on-disk formats wallpapers are stored in.
+
+    Example:
+
+        .. code-block:: python
+
+            with storage.open_storage('~/wallpapers/normal_walls.tar') as store:
+                store.names()
+                >>> ['wallhaven-474183.png', 'wallhaven-258640.jpg', ...]
+                store.extract('wallhaven-474183.png', '/tmp/wallpaper.png')
+
+    """
+    def __init__(self, path, mapping=None):
+        """ Constructor.
+
+        Args:
+            path (str):
+                path to archive
+
+            mapping (MappedFile, optional):
+                if provided, members are read from this shared memory-map
+                of the archive instead of opening it (when supported).
+        """
+        self.__path = path
+        self.__mapping = mapping
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def path(self):
+        return self.__path
+
+    @property
+    def mapping(self):
+        return self.__mapping
+
+    @property
+    def watch_path(self):
+        """ Returns the file that is modified whenever wallpapers are added/removed.
+        """
+        return self.path
+
+    def names(self):
+        """ Returns names of all wallpapers, in the order they were added.
+        """
+        return self.scan()[0]
+
+    def scan(self, cursor=None):
+        """ Lists wallpapers added after `cursor` .
+
+        Args:
+            cursor (int, optional):
+                cursor returned by a previous scan. If not provided,
+                all wallpapers are returned.
+
+        Returns:
+            tuple: ``(names, cursor)``
+
+        Raises:
+            RewrittenError: the cursor is no longer valid, rescan with no cursor.
+        """
+        raise NotImplementedError()
+
+    def read(self, name):
+        """ Returns the contents of wallpaper `name` as bytes.
+        """
+        raise NotImplementedError()
+
+    def member(self, name):
+        """ Returns the contents of wallpaper `name` as a bytes-like object.
+        When reading from a :py:class:`MappedFile` , this is a zero-copy
+        ``memoryview`` of the mapping (valid until it is released).
+        """
+        return self.read(name)
+
+    def size(self, name):
+        """ Returns the size of wallpaper `name` in bytes (without reading it, where the format allows).
+        """
+        return len(self.member(name))
+
+    def mtime(self, name):
+        """ Returns the modification time of wallpaper `name` (seconds since epoch),
+        as recorded by the archive.
+        """
+        raise NotImplementedError()
+
+    def prepare(self):
+        """ Builds whatever is needed to find members (ex: an index),
+        ahead of the first extraction.
+        """
+        pass
+
+    def verify(self, names):
+        """ Checks that wallpapers `names` are intact (headers, size bounds,
+        and stored checksums, where the format has them).
+
+        Returns:
+            tuple: ``(ex: (8317001, {'wallhaven-474183.png': 'bad CRC'}))``
+                number of bytes checked, and the problem with each bad wallpaper.
+        """
+        checked = 0
+        problems = {}
+        for name in names:
+            try:
+                checked += len(self.member(name))
+            except read_errors as exc:
+                problems[name] = str(exc)
+        return (checked, problems)
+
+    def verify_layout(self):
+        """ Checks the archive as a whole (ex: data that cannot be read as members).
+
+        Returns:
+            str: the problem, or None
+        """
+        return None
+
+    def extract(self, name, filepath):
+        """ Writes wallpaper `name` to `filepath` .
+
+        Returns:
+            int: number of bytes written
+        """
+        data = self.member(name)
+        with open(filepath, 'wb') as fw:
+            fw.write(data)
+        return len(data)
+
+    def add(self, filepaths):
+        """ Adds files to the archive, named after their basename.
+
+        Returns:
+            list: paths of files created/modified/deleted (to be committed).
+        """
+        raise NotImplementedError()
+
+    def remove(self, names):
+        """ Removes wallpapers from the archive.
+
+        Returns:
+            list: paths of files created/modified/deleted (to be committed).
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class TarStorage(Storage):
+    """ Wallpapers stored in a single uncompressed tar archive.
+    The scan cursor is the byte-offset of the end of the last member.
+    """
+    def scan(self, cursor=None):
+        if cursor is not None and os.path.getsize(self.path) < cursor:
+            raise RewrittenError(self.path)
+
+        try:
+            scanned = self._scan_headers(cursor or 0)
+            names = [
+                name.replace('./', '') for name in scanned.names if name not in ('..', '.')
+            ]
+            if scanned.error is not None:
+                if cursor is not None or not names:
+                    raise tarfile.ReadError(scanned.error)
+                # (ex: truncated) keep members before the damage,
+                # see `wallmgr archive <name> --verify`
+                logger.warning('damaged archive "{}": {}'.format(self.path, scanned.error))
+            return (names, scanned.end)
+        except(tarfile.ReadError):
+            if cursor is None:
+                raise
+            raise RewrittenError(self.path)
+
+    def _scan_headers(self, offset=0):
+        """ Returns :py:class:`wallpapermgr.tarscan.Members` of every member after `offset` .
+        """
+        try:
+            if self.mapping is not None:
+                return tarscan.scan(self.mapping.view, offset)
+            return tarscan.scan_file(self.path, offset)
+        except(tarscan.UnsupportedError) as exc:
+            logger.debug('scanning "{}" with tarfile: {}'.format(self.path, exc))
+            return _tarfile_scan(self.path, offset)
+
+    def _mapped_members(self):
+        """ Returns ``{name: (offset, size)}`` of members within the mapping,
+        built once per mapping.
+        """
+        mapping = self.mapping
+        with mapping.lock:
+            if mapping.members is None:
+                members = {}
+                with metrics.registry.timer('archive_open_seconds', format='tar'):
+                    scanned = self._scan_headers()
+                for (i, name) in enumerate(scanned.names):
+                    if scanned.types[i:i + 1] in tarfile.REGULAR_TYPES:
+                        member = (scanned.offsets[i], scanned.sizes[i])
+                        members[name] = member
+                        members[name.replace('./', '')] = member
+                if scanned.error is not None:
+                    # (ex: truncated) members before the damage are still readable
+                    logger.warning('damaged archive "{}": {}'.format(self.path, scanned.error))
+                mapping.members = members
+            return mapping.members
+
+    def member(self, name):
+        if self.mapping is None:
+            return self.read(name)
+
+        with metrics.registry.timer('member_lookup_seconds', format='tar'):
+            members = self._mapped_members()
+        if name not in members:
+            raise RuntimeError(
+                'unable to find "{}" within tarfile: "{}"'.format(name, self.path)
+            )
+        (offset, size) = members[name]
+        return self.mapping.view[offset:offset + size]
+
+    def size(self, name):
+        if self.mapping is None:
+            with tarfile.open(self.path, 'r') as archive_fd:
+                return archive_fd.getmember(name).size
+
+        members = self._mapped_members()
+        if name not in members:
+            raise RuntimeError(
+                'unable to find "{}" within tarfile: "{}"'.format(name, self.path)
+            )
+        return members[name][1]
+
+    def mtime(self, name):
+        if self.mapping is None:
+            with tarfile.open(self.path, 'r') as archive_fd:
+                return int(archive_fd.getmember(name).mtime)
+
+        members = self._mapped_members()
+        if name not in members:
+            raise RuntimeError(
+                'unable to find "{}" within tarfile: "{}"'.format(name, self.path)
+            )
+        # the member's own header always precedes it's data
+        offset = members[name][0]
+        return _tar_header_mtime(self.mapping.view[offset - tarfile.BLOCKSIZE:offset])
+
+    def read(self, name):
+        if self.mapping is not None:
+            return bytes(self.member(name))
+
+        with metrics.registry.timer('archive_open_seconds', format='tar'):
+            archive_fd = tarfile.open(self.path, 'r')
+
+        with archive_fd:
+            with metrics.registry.timer('member_lookup_seconds', format='tar'):
+                fr = archive_fd.extractfile(name)
+            if not fr:
+                raise RuntimeError(
+                    'unable to find "{}" within tarfile: "{}"'.format(
+                        name, self.path
+                    )
+                )
+            try:
+                with metrics.registry.timer('member_read_seconds', format='tar'):
+                    return fr.read()
+            finally:
+                fr.close()
+
+    def prepare(self):
+        if self.mapping is not None:
+            self._mapped_members()
+
+    def verify(self, names):
+        # tar has no checksum of member contents, only of headers
+        if self.mapping is None:
+            return super(TarStorage, self).verify(names)
+
+        view = self.mapping.view
+        members = self._mapped_members()
+        checked = 0
+        problems = {}
+        for name in names:
+            if name not in members:
+                problems[name] = 'missing from archive'
+                continue
+            (offset, size) = members[name]
+            # the member's own header always precedes it's data (after any longname/pax headers)
+            problem = _tar_header_problem(bytes(view[offset - tarfile.BLOCKSIZE:offset]), name)
+            if problem is None and offset + size > len(view):
+                problem = 'truncated, ends {} bytes past the end of the archive'.format(
+                    offset + size - len(view)
+                )
+            if problem is not None:
+                problems[name] = problem
+            checked += tarfile.BLOCKSIZE + size
+        return (checked, problems)
+
+    def verify_layout(self):
+        # scanning stops at the first damaged header,
+        # only end-of-archive blocks (zeros) should follow.
+        with open(self.path, 'rb') as fd:
+            try:
+                scanned = self._scan_headers()
+            except(tarfile.ReadError) as exc:
+                return str(exc)
+            if scanned.error is not None:
+                return scanned.error
+            end = scanned.end
+            fd.seek(end)
+            for chunk in iter(lambda: fd.read(_chunk_size), b''):
+                if chunk.strip(b'\0'):
+                    return 'unreadable data after offset {} (damaged header?)'.format(end)
+        return None
+
+    def add(self, filepaths):
+        with tarfile.open(self.path, 'a') as archive_fd:
+            for filepath in filepaths:
+                archive_fd.add(filepath, os.path.basename(filepath))
+        return [self.path]
+
+    def remove(self, names):
+        (present, _) = self.scan()
+        missing = set(names) - set(present)
+        if missing:
+            raise RuntimeError(
+                'unable to find {} within archive: "{}"'.format(
+                    repr(sorted(missing)), self.path
+                )
+            )
+
+        # members are copied (streamed) to a new archive, which replaces this one
+        removed = set(names)
+        tmppath = '{}.{}'.format(self.path, os.getpid())
+        try:
+            with tarfile.open(self.path, 'r|') as archive_fd:
+                with tarfile.open(tmppath, 'w', format=archive_fd.format or tarfile.DEFAULT_FORMAT) as new_fd:
+                    for info in archive_fd:
+                        if info.isfile() and info.name.replace('./', '') in removed:
+                            continue
+                        fileobj = archive_fd.extractfile(info) if info.isfile() else None
+                        new_fd.addfile(info, fileobj)
+            shutil.copymode(self.path, tmppath)
+            os.replace(tmppath, self.path)
+        finally:
+            if os.path.isfile(tmppath):
+                os.remove(tmppath)
+        return [self.path]
+
+
+class LooseStorage(Storage):
+    """ Wallpapers stored as individual, content-addressed files in a directory.
+
+    Adding a wallpaper only adds one new file to the git repo, rather than
+    a new copy of an entire tar archive.
+
+    Example:
+
+        ::
+
+            normal_walls/
+                manifest.json
+                objects/
+                    3f/
+                        9a0c1e...d2.png
+                    c4/
+                        51bd07...8e.jpg
+
+        .. code-block:: python
+
+            # manifest.json
+            {
+                "serial": 3,              # serial of next added wallpaper
+                "rewritten": 0,           # serial when last wallpaper was removed
+                "members": [
+                    {"name": "wallhaven-474183.png", "sha256": "3f9a0c1e...", "serial": 0},
+                    {"name": "wallhaven-258640.jpg", "sha256": "c451bd07...", "serial": 2},
+                ]
+            }
+
+    """
+    manifest_name = 'manifest.json'
+
+    def __init__(self, path):
+        super(LooseStorage, self).__init__(path)
+        self.__manifest = None
+        self.__members = None  # {name: member}
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.path, self.manifest_name)
+
+    @property
+    def watch_path(self):
+        return self.manifest_path
+
+    def manifest(self):
+        if self.__manifest is None:
+            manifest = {'serial': 0, 'rewritten': 0, 'members': []}
+            if os.path.isfile(self.manifest_path):
+                with open(self.manifest_path, 'r') as fd:
+                    manifest = json.load(fd)
+            self.__manifest = manifest
+        return self.__manifest
+
+    def _write_manifest(self, manifest):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        tmppath = '{}.{}'.format(self.manifest_path, os.getpid())
+        with open(tmppath, 'w') as fd:
+            json.dump(manifest, fd, indent=1, sort_keys=True)
+        os.replace(tmppath, self.manifest_path)
+        self.__manifest = manifest
+        self.__members = None
+
+    @staticmethod
+    def _mark_rewritten(manifest):
+        # invalidates all previously issued scan cursors
+        manifest['serial'] += 1
+        manifest['rewritten'] = manifest['serial']
+
+    def object_path(self, sha256, name):
+        ext = os.path.splitext(name)[-1].lower()
+        return os.path.join(self.path, 'objects', sha256[:2], sha256[2:] + ext)
+
+    def _member(self, name):
+        if self.__members is None:
+            self.__members = dict(
+                (m['name'], m) for m in self.manifest()['members']
+            )
+        if name not in self.__members:
+            raise RuntimeError(
+                'unable to find "{}" within archive: "{}"'.format(name, self.path)
+            )
+        return self.__members[name]
+
+    def scan(self, cursor=None):
+        manifest = self.manifest()
+        if cursor is None:
+            cursor = 0
+        elif cursor < manifest['rewritten']:
+            raise RewrittenError(self.path)
+
+        names = [m['name'] for m in manifest['members'] if m['serial'] >= cursor]
+        return (names, manifest['serial'])
+
+    def read(self, name):
+        member = self._member(name)
+        with open(self.object_path(member['sha256'], name), 'rb') as fd:
+            return fd.read()
+
+    def size(self, name):
+        member = self._member(name)
+        return os.path.getsize(self.object_path(member['sha256'], name))
+
+    def mtime(self, name):
+        member = self._member(name)
+        return int(os.path.getmtime(self.object_path(member['sha256'], name)))
+
+    def verify(self, names):
+        checked = 0
+        problems = {}
+        for name in names:
+            try:
+                member = self._member(name)
+                object_path = self.object_path(member['sha256'], name)
+                sha256 = _sha256(object_path)
+                checked += os.path.getsize(object_path)
+            except read_errors as exc:
+                problems[name] = str(exc)
+                continue
+            if sha256 != member['sha256']:
+                problems[name] = 'sha256 does not match manifest ({})'.format(sha256)
+        return (checked, problems)
+
+    def extract(self, name, filepath):
+        with metrics.registry.timer('member_lookup_seconds', format='loose'):
+            member = self._member(name)
+        object_path = self.object_path(member['sha256'], name)
+        shutil.copyfile(object_path, filepath)
+        return os.path.getsize(filepath)
+
+    def add(self, filepaths):
+        manifest = self.manifest()
+        modified = [self.manifest_path]
+        names = [os.path.basename(p) for p in filepaths]
+        members = [m for m in manifest['members'] if m['name'] not in names]
+        if len(members) != len(manifest['members']):
+            self._mark_rewritten(manifest)
+
+        for filepath in filepaths:
+            name = os.path.basename(filepath)
+            sha256 = _sha256(filepath)
+            object_path = self.object_path(sha256, name)
+            if not os.path.isfile(object_path):
+                if not os.path.isdir(os.path.dirname(object_path)):
+                    os.makedirs(os.path.dirname(object_path))
+                shutil.copyfile(filepath, object_path)
+                modified.append(object_path)
+
+            members.append({'name': name, 'sha256': sha256, 'serial': manifest['serial']})
+            manifest['serial'] += 1
+
+        manifest['members'] = members
+        self._write_manifest(manifest)
+        return modified
+
+    def remove(self, names):
+        manifest = self.manifest()
+        removed = [m for m in manifest['members'] if m['name'] in names]
+        missing = set(names) - set(m['name'] for m in removed)
+        if missing:
+            raise RuntimeError(
+                'unable to find {} within archive: "{}"'.format(
+                    repr(sorted(missing)), self.path
+                )
+            )
+
+        manifest['members'] = [m for m in manifest['members'] if m['name'] not in names]
+        self._mark_rewritten(manifest)
+        self._write_manifest(manifest)
+
+        # objects may be shared by several (identical) wallpapers
+        modified = [self.manifest_path]
+        referenced = set(
+            self.object_path(m['sha256'], m['name']) for m in manifest['members']
+        )
+        for member in removed:
+            object_path = self.object_path(member['sha256'], member['name'])
+            if object_path not in referenced and os.path.isfile(object_path):
+                os.remove(object_path)
+                modified.append(object_path)
+        return modified
+
+
+def _gzip_compress(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31: gzip header
+    return compressor.compress(data) + compressor.flush()
+
+
+# {codec: (compress, create-decompressor)}
+_codecs = {
+    'gzip': (_gzip_compress, lambda: zlib.decompressobj(31)),
+    'xz': (
+        lambda data: lzma.compress(data, format=lzma.FORMAT_XZ),
+        lambda: lzma.LZMADecompressor(format=lzma.FORMAT_XZ),
+    ),
+}
+
+# {extension: codec}
+compressed_extensions = {
+    '.tar.gz': 'gzip',
+    '.tgz': 'gzip',
+    '.tar.xz': 'xz',
+    '.txz': 'xz',
+}
+
+
+class _FrameReader(object):
+    """ File-like object that decompresses a stream of concatenated
+    gzip-members/xz-streams (frames), recording where each frame starts.
+
+    Attributes:
+        frames (list):
+            ``[[compressed_offset, compressed_size, offset, size], ...]``
+            for every frame read so far (offsets/sizes of decompressed data).
+    """
+    def __init__(self, fd, codec):
+        self.frames = []
+        self._fd = fd
+        self._create_decompressor = _codecs[codec][1]
+        self._decompressor = None
+        self._frame = None
+        self._pending = b''      # compressed data read, but not yet decompressed
+        self._compressed_pos = 0
+        self._pos = 0
+        self._buf = b''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buf) < size:
+            if not self._fill():
+                break
+        if size < 0:
+            size = len(self._buf)
+        data = self._buf[:size]
+        self._buf = self._buf[size:]
+        return data
+
+    def drain(self):
+        """ Reads until the end of the file (recording all frames).
+        """
+        while self._fill():
+            self._buf = b''
+
+    def _fill(self):
+        if self._decompressor is None:
+            # xz streams may be separated by null-padding
+            while True:
+                if not self._pending:
+                    self._pending = self._fd.read(_chunk_size)
+                    if not self._pending:
+                        return False
+                stripped = self._pending.lstrip(b'\0')
+                self._compressed_pos += len(self._pending) - len(stripped)
+                self._pending = stripped
+                if self._pending:
+                    break
+            self._decompressor = self._create_decompressor()
+            self._frame = [self._compressed_pos, 0, self._pos, 0]
+
+        data = self._pending or self._fd.read(_chunk_size)
+        self._pending = b''
+        if not data:
+            raise tarfile.ReadError('truncated compressed frame')
+
+        out = self._decompressor.decompress(data)
+        consumed = len(data)
+        if self._decompressor.eof:
+            self._pending = self._decompressor.unused_data
+            consumed -= len(self._pending)
+        self._compressed_pos += consumed
+        self._pos += len(out)
+        self._frame[3] += len(out)
+        self._buf += out
+
+        if self._decompressor.eof:
+            self._frame[1] = self._compressed_pos - self._frame[0]
+            self.frames.append(self._frame)
+            self._decompressor = None
+            self._frame = None
+        return True
+
+
+class CompressedStorage(Storage):
+    """ Wallpapers stored in a compressed tar archive (``.tar.gz`` , ``.tar.xz`` ),
+    where every member is compressed as a separate frame (gzip-member/xz-stream).
+
+    Concatenated frames are still a valid ``.tar.gz`` / ``.tar.xz`` ,
+    but any wallpaper can be extracted by only decompressing it's own frame.
+
+    A checkpoint index is written beside the archive (``<archive>.idx``)
+    by the first scan (or by :py:meth:`add` ). Archives compressed as a single
+    stream (ex: ``tar -czf``) are still readable, but extraction must decompress
+    from the start of the stream. Convert them to add frames.
+
+    Example:
+
+        .. code-block:: python
+
+            # normal_walls.tar.gz.idx
+            {
+                "version": 1,
+                "codec": "gzip",
+                "size": 8317001,                # archive size/tail when indexed
+                "tail": "0f3c...",
+                "frames": [[0, 290466, 0, 291328], ...],    # [compressed_offset, compressed_size, offset, size]
+                "members": [["wallhaven-474183.png", 512, 290394], ...],  # [name, offset, size]
+                "end": 8412160,               # offset of the tar end-of-archive marker
+            }
+
+    """
+    index_version = 1
+    _index_cache = {}  # {index_path: (statkey, index, {name: member})}
+    _index_cache_lock = threading.Lock()
+
+    def __init__(self, path):
+        super(CompressedStorage, self).__init__(path)
+        self.__codec = compressed_codec(path)
+
+    @property
+    def codec(self):
+        return self.__codec
+
+    @property
+    def index_path(self):
+        return '{}.idx'.format(self.path)
+
+    def _archive_key(self):
+        # mtimes differ between clones, the gzip/xz trailer (checksum, size) does not
+        with open(self.path, 'rb') as fd:
+            size = os.fstat(fd.fileno()).st_size
+            fd.seek(max(0, size - 32))
+            return (size, binascii.hexlify(fd.read()).decode())
+
+    def _index(self):
+        """ Returns ``(index, {name: [name, offset, size]})`` ,
+        rebuilding the index if the archive changed since it was written.
+        """
+        if not os.path.isfile(self.path):
+            index = self._empty_index()
+            return (index, {})
+
+        (size, tail) = self._archive_key()
+        try:
+            stat = os.stat(self.index_path)
+            statkey = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        except(OSError):
+            statkey = None
+
+        with self._index_cache_lock:
+            cached = self._index_cache.get(self.index_path)
+        if cached and cached[0] == statkey:
+            (_, index, lookup) = cached
+        else:
+            index = None
+            if statkey:
+                with open(self.index_path, 'r') as fd:
+                    index = json.load(fd)
+            lookup = None
+
+        valid = (
+            index is not None
+            and index.get('version') == self.index_version
+            and (index['size'], index['tail']) == (size, tail)
+        )
+        if not valid:
+            logger.info('building checkpoint index: "{}"'.format(self.index_path))
+            with metrics.registry.timer('archive_index_seconds', format=self.codec):
+                index = self._build_index()
+            statkey = self._write_index(index)
+            lookup = None
+
+        if lookup is None:
+            lookup = dict((m[0], m) for m in index['members'])
+            with self._index_cache_lock:
+                self._index_cache[self.index_path] = (statkey, index, lookup)
+        return (index, lookup)
+
+    def _empty_index(self):
+        return {
+            'version': self.index_version,
+            'codec': self.codec,
+            'size': 0,
+            'tail': '',
+            'frames': [],
+            'members': [],
+            'end': 0,
+        }
+
+    def _build_index(self):
+        index = self._empty_index()
+        with open(self.path, 'rb') as fd:
+            reader = _FrameReader(fd, self.codec)
+            with tarfile.open(fileobj=reader, mode='r|') as archive_fd:
+                for info in archive_fd:
+                    if not info.isfile():
+                        continue
+                    name = info.name.replace('./', '')
+                    index['members'].append([name, info.offset_data, info.size])
+                index['end'] = archive_fd.offset
+            reader.drain()
+            index['frames'] = reader.frames
+
+        (index['size'], index['tail']) = self._archive_key()
+        return index
+
+    def _write_index(self, index):
+        """ Writes index, returning it's statkey (or None if it could not be written).
+        """
+        tmppath = '{}.{}'.format(self.index_path, os.getpid())
+        try:
+            with open(tmppath, 'w') as fd:
+                json.dump(index, fd, separators=(',', ':'))
+            os.replace(tmppath, self.index_path)
+            stat = os.stat(self.index_path)
+        except(IOError, OSError) as exc:
+            logger.warning('unable to write index "{}": {}'.format(self.index_path, exc))
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def scan(self, cursor=None):
+        (index, _) = self._index()
+        if cursor is None:
+            cursor = 0
+        elif cursor > index['end']:
+            raise RewrittenError(self.path)
+
+        names = [m[0] for m in index['members'] if m[1] >= cursor]
+        return (names, index['end'])
+
+    def _decompress(self, fd, frame):
+        """ Yields decompressed chunks of a single frame.
+        """
+        (offset, size) = frame[:2]
+        fd.seek(offset)
+        decompressor = _codecs[self.codec][1]()
+        remaining = size
+        while remaining > 0 and not decompressor.eof:
+            data = fd.read(min(_chunk_size, remaining))
+            if not data:
+                raise RuntimeError('truncated archive: "{}"'.format(self.path))
+            remaining -= len(data)
+            yield decompressor.decompress(data)
+
+    def _lookup(self, name):
+        with metrics.registry.timer('member_lookup_seconds', format=self.codec):
+            (index, lookup) = self._index()
+        if name not in lookup:
+            raise RuntimeError(
+                'unable to find "{}" within archive: "{}"'.format(name, self.path)
+            )
+        return (index, lookup[name])
+
+    def _member_chunks(self, name):
+        """ Yields the contents of wallpaper `name` , one decompressed chunk at a time.
+        """
+        (index, (_, start, size)) = self._lookup(name)
+        return self._range_chunks(index, start, start + size)
+
+    def _range_chunks(self, index, start, end):
+        """ Yields decompressed bytes ``[start, end)`` of the tar stream, one chunk at a time.
+        """
+        if start >= end:
+            return
+
+        # frames containing [start, end)
+        frames = index['frames']
+        first = bisect.bisect_right([f[2] for f in frames], start) - 1
+
+        with open(self.path, 'rb') as fd:
+            for frame in frames[first:]:
+                pos = frame[2]
+                for chunk in self._decompress(fd, frame):
+                    chunk_start = max(start, pos)
+                    chunk_end = min(end, pos + len(chunk))
+                    if chunk_start < chunk_end:
+                        yield chunk[chunk_start - pos:chunk_end - pos]
+                    pos += len(chunk)
+                    if pos >= end:
+                        return
+        raise RuntimeError('truncated archive: "{}"'.format(self.path))
+
+    def read(self, name):
+        with metrics.registry.timer('member_read_seconds', format=self.codec):
+            return b''.join(self._member_chunks(name))
+
+    def size(self, name):
+        return self._lookup(name)[1][2]
+
+    def mtime(self, name):
+        (index, (_, start, _)) = self._lookup(name)
+        header = b''.join(self._range_chunks(index, start - tarfile.BLOCKSIZE, start))
+        return _tar_header_mtime(header)
+
+    def extract(self, name, filepath):
+        # streamed, only one chunk of the wallpaper is held in memory
+        written = 0
+        with metrics.registry.timer('member_read_seconds', format=self.codec):
+            with open(filepath, 'wb') as fw:
+                for chunk in self._member_chunks(name):
+                    fw.write(chunk)
+                    written += len(chunk)
+        return written
+
+    def prepare(self):
+        if os.path.isfile(self.path):
+            self._index()
+
+    def verify(self, names):
+        # every frame holding part of a member (or it's header) is decompressed
+        # in full, so the codec checks it's checksum (gzip CRC32, xz check).
+        (index, lookup) = self._index()
+        frames = index['frames']
+        starts = [f[2] for f in frames]
+        problems = {}
+        frame_members = collections.OrderedDict()
+        for name in names:
+            if name not in lookup:
+                problems[name] = 'missing from index "{}"'.format(self.index_path)
+                continue
+            (_, offset, size) = lookup[name]
+            first = bisect.bisect_right(starts, offset - tarfile.BLOCKSIZE) - 1
+            last = bisect.bisect_right(starts, offset + max(size, 1) - 1) - 1
+            for i in range(max(first, 0), last + 1):
+                frame_members.setdefault(i, []).append(name)
+
+        checked = 0
+        with open(self.path, 'rb') as fd:
+            for (i, frame_names) in frame_members.items():
+                frame = frames[i]
+                try:
+                    (data, problem) = self._verify_frame(fd, frame)
+                except read_errors as exc:
+                    (data, problem) = (b'', str(exc))
+                checked += frame[1]
+                for name in frame_names:
+                    header_offset = lookup[name][1] - tarfile.BLOCKSIZE - frame[2]
+                    if problem is None and 0 <= header_offset < len(data):
+                        header = data[header_offset:header_offset + tarfile.BLOCKSIZE]
+                        problem = _tar_header_problem(header, name)
+                    if problem is not None:
+                        problems.setdefault(name, problem)
+        return (checked, problems)
+
+    def _verify_frame(self, fd, frame):
+        """ Decompresses an entire frame.
+
+        Returns:
+            tuple: ``(data, problem)`` problem is None if the frame is intact.
+        """
+        (offset, size, _, expected) = frame
+        fd.seek(offset)
+        decompressor = _codecs[self.codec][1]()
+        chunks = []
+        remaining = size
+        while remaining > 0 and not decompressor.eof:
+            data = fd.read(min(_chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            chunks.append(decompressor.decompress(data))
+        data = b''.join(chunks)
+
+        if not decompressor.eof:
+            return (data, 'truncated frame at offset {}'.format(offset))
+        if len(data) != expected:
+            return (data, 'frame at offset {} decompressed to {} bytes, index expects {}'.format(
+                offset, len(data), expected
+            ))
+        return (data, None)
+
+    def add(self, filepaths):
+        (index, lookup) = self._index()
+        names = [os.path.basename(p) for p in filepaths]
+        duplicates = [n for n in names if n in lookup]
+        if duplicates:
+            raise RuntimeError(
+                'archive already contains {}: "{}"'.format(repr(duplicates), self.path)
+            )
+
+        # new frames replace the frame holding the end-of-archive marker
+        frames = [f for f in index['frames'] if f[2] < index['end']]
+        append_at = frames[-1][0] + frames[-1][1] if frames else 0
+        if frames and frames[-1][2] + frames[-1][3] != index['end']:
+            raise RuntimeError(
+                (
+                    'cannot append to "{}", it was not compressed one member per frame. '
+                    'Use `wallmgr archive <name> --convert` to rewrite it.'
+                ).format(self.path)
+            )
+
+        pos = index['end']
+        mode = 'r+b' if os.path.isfile(self.path) else 'wb'
+        with open(self.path, mode) as fd:
+            fd.seek(append_at)
+
+            for filepath in filepaths:
+                name = os.path.basename(filepath)
+                info = tarfile.TarInfo(name)
+                info.size = os.path.getsize(filepath)
+                info.mtime = int(os.path.getmtime(filepath))
+                info.mode = 0o644
+                with open(filepath, 'rb') as fr:
+                    data = fr.read()
+                (header, member) = self._tar_member(info, data)
+                self._write_frame(fd, frames, pos, member)
+                index['members'].append([name, pos + len(header), len(data)])
+                pos += len(member)
+
+            index['end'] = pos
+            self._write_frame(fd, frames, pos, b'\0' * tarfile.BLOCKSIZE * 2)  # end-of-archive marker
+            fd.truncate()
+
+        index['frames'] = frames
+        (index['size'], index['tail']) = self._archive_key()
+        self._write_index(index)
+        return [self.path, self.index_path]
+
+    def remove(self, names):
+        (index, lookup) = self._index()
+        missing = set(names) - set(lookup)
+        if missing:
+            raise RuntimeError(
+                'unable to find {} within archive: "{}"'.format(
+                    repr(sorted(missing)), self.path
+                )
+            )
+
+        # the archive is rewritten one member per frame (one member in memory
+        # at a time), without `names` , then replaces this one
+        removed = set(names)
+        new_index = self._empty_index()
+        frames = new_index['frames']
+        pos = 0
+        tmppath = '{}.{}'.format(self.path, os.getpid())
+        try:
+            with open(self.path, 'rb') as fd, open(tmppath, 'wb') as fw:
+                reader = _FrameReader(fd, self.codec)
+                with tarfile.open(fileobj=reader, mode='r|') as archive_fd:
+                    for info in archive_fd:
+                        name = info.name.replace('./', '')
+                        if info.isfile() and name in removed:
+                            continue
+                        data = archive_fd.extractfile(info).read() if info.isfile() else b''
+                        (header, member) = self._tar_member(info, data)
+                        self._write_frame(fw, frames, pos, member)
+                        if info.isfile():
+                            new_index['members'].append([name, pos + len(header), len(data)])
+                        pos += len(member)
+
+                new_index['end'] = pos
+                self._write_frame(fw, frames, pos, b'\0' * tarfile.BLOCKSIZE * 2)
+            shutil.copymode(self.path, tmppath)
+            os.replace(tmppath, self.path)
+        finally:
+            if os.path.isfile(tmppath):
+                os.remove(tmppath)
+
+        (new_index['size'], new_index['tail']) = self._archive_key()
+        self._write_index(new_index)
+        return [self.path, self.index_path]
+
+    def _write_frame(self, fd, frames, pos, data):
+        """ Compresses `data` (bytes at `pos` of the tar stream) as a new frame at the position of `fd` .
+        """
+        compressed = _codecs[self.codec][0](data)
+        frames.append([fd.tell(), len(compressed), pos, len(data)])
+        fd.write(compressed)
+
+    @staticmethod
+    def _tar_member(info, data):
+        """ Returns ``(header, member)`` the tar header of `info` , and the header followed by `data` (padded).
+        """
+        header = info.tobuf(tarfile.DEFAULT_FORMAT, 'utf-8', 'surrogateescape')
+        padding = b'\0' * (-len(data) % tarfile.BLOCKSIZE)
+        return (header, header + data + padding)
+
+
+class ZipStorage(Storage):
+    """ Wallpapers stored in a zip archive (stored, not deflated).
+
+    Zip archives end with a central directory (a table of contents), so
+    listing members does not read through the archive, and each member
+    is read by seeking directly to it's local header.
+
+    The scan cursor is one past the local-header offset of the last member.
+    """
+    _index_cache = {}  # {path: (statkey, [ZipMember, ...], {name: ZipMember})}
+    _index_cache_lock = threading.Lock()
+
+    def _index(self):
+        """ Returns ``(members, {name: member})`` , members in the order they were added,
+        read from the central directory (reused until the archive is modified).
+        """
+        stat = os.stat(self.path)
+        statkey = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        with self._index_cache_lock:
+            cached = self._index_cache.get(self.path)
+        if cached and cached[0] == statkey:
+            return cached[1:]
+
+        with metrics.registry.timer('archive_index_seconds', format='zip'):
+            with zipfile.ZipFile(self.path, 'r') as archive_fd:
+                members = [
+                    i for i in archive_fd.infolist() if not i.is_dir()
+                ]
+        members.sort(key=lambda i: i.header_offset)
+        lookup = dict((i.filename, i) for i in members)
+        with self._index_cache_lock:
+            self._index_cache[self.path] = (statkey, members, lookup)
+        return (members, lookup)
+
+    def scan(self, cursor=None):
+        if not os.path.isfile(self.path):
+            return ([], 0)
+
+        (members, _) = self._index()
+        if cursor:
+            # the last member seen must still be where it was
+            offsets = [i.header_offset for i in members]
+            index = bisect.bisect_left(offsets, cursor - 1)
+            if index >= len(offsets) or offsets[index] != cursor - 1:
+                raise RewrittenError(self.path)
+            members = members[index + 1:]
+
+        names = [i.filename for i in members]
+        if members:
+            cursor = members[-1].header_offset + 1
+        return (names, cursor or 0)
+
+    def member(self, name):
+        with metrics.registry.timer('member_lookup_seconds', format='zip'):
+            (_, lookup) = self._index()
+        if name not in lookup:
+            raise RuntimeError(
+                'unable to find "{}" within archive: "{}"'.format(name, self.path)
+            )
+        info = lookup[name]
+
+        with metrics.registry.timer('member_read_seconds', format='zip'):
+            if self.mapping is not None:
+                view = self.mapping.view
+                offset = info.header_offset + self._header_size(info, view, info.header_offset)
+                data = view[offset:offset + info.compress_size]
+            else:
+                with open(self.path, 'rb') as fd:
+                    fd.seek(info.header_offset)
+                    header = fd.read(_zip_local_header.size)
+                    fd.seek(info.header_offset + self._header_size(info, header))
+                    data = fd.read(info.compress_size)
+
+        if info.compress_type == zipfile.ZIP_DEFLATED:
+            data = zlib.decompress(data, -15)
+        elif info.compress_type != zipfile.ZIP_STORED:
+            # other compression methods, let zipfile handle them
+            with zipfile.ZipFile(self.path, 'r') as archive_fd:
+                return archive_fd.read(name)
+
+        if zlib.crc32(data) != info.CRC:
+            raise RuntimeError(
+                'bad CRC for "{}" in "{}"'.format(name, self.path)
+            )
+        return data
+
+    def read(self, name):
+        return bytes(self.member(name))
+
+    def size(self, name):
+        (_, lookup) = self._index()
+        if name not in lookup:
+            raise RuntimeError(
+                'unable to find "{}" within archive: "{}"'.format(name, self.path)
+            )
+        return lookup[name].file_size
+
+    def mtime(self, name):
+        (_, lookup) = self._index()
+        if name not in lookup:
+            raise RuntimeError(
+                'unable to find "{}" within archive: "{}"'.format(name, self.path)
+            )
+        return int(time.mktime(lookup[name].date_time + (0, 0, -1)))
+
+    def prepare(self):
+        if os.path.isfile(self.path):
+            self._index()
+
+    def verify(self, names):
+        (_, lookup) = self._index()
+        checked = 0
+        problems = {}
+        for name in names:
+            try:
+                data = self.member(name)  # checks CRC
+            except read_errors as exc:
+                problems[name] = str(exc)
+                continue
+            info = lookup[name]
+            if len(data) != info.file_size:
+                problems[name] = 'truncated ({} of {} bytes)'.format(len(data), info.file_size)
+            checked += info.compress_size
+        return (checked, problems)
+
+    def _header_size(self, info, buf, offset=0):
+        """ Returns size of a member's local header (at `offset` within `buf` ),
+        which precedes it's data.
+        """
+        header = _zip_local_header.unpack_from(buf, offset)
+        (signature, name_length, extra_length) = (header[0], header[-2], header[-1])
+        if signature != _zip_local_signature:
+            raise RuntimeError(
+                'bad zip local header for "{}" in "{}"'.format(info.filename, self.path)
+            )
+        return _zip_local_header.size + name_length + extra_length
+
+    def add(self, filepaths):
+        mode = 'a' if os.path.isfile(self.path) else 'w'
+        with zipfile.ZipFile(self.path, mode, compression=zipfile.ZIP_STORED) as archive_fd:
+            for filepath in filepaths:
+                archive_fd.write(filepath, os.path.basename(filepath))
+        return [self.path]
+
+    def remove(self, names):
+        (members, lookup) = self._index()
+        missing = set(names) - set(lookup)
+        if missing:
+            raise RuntimeError(
+                'unable to find {} within archive: "{}"'.format(
+                    repr(sorted(missing)), self.path
+                )
+            )
+
+        # members are copied (streamed) to a new archive, which replaces this one
+        removed = set(names)
+        tmppath = '{}.{}'.format(self.path, os.getpid())
+        try:
+            with zipfile.ZipFile(self.path, 'r') as archive_fd:
+                with zipfile.ZipFile(tmppath, 'w') as new_fd:
+                    for info in archive_fd.infolist():
+                        if info.filename in removed:
+                            continue
+                        with archive_fd.open(info) as fr, new_fd.open(info, 'w') as fw:
+                            shutil.copyfileobj(fr, fw, _chunk_size)
+            shutil.copymode(self.path, tmppath)
+            os.replace(tmppath, self.path)
+        finally:
+            if os.path.isfile(tmppath):
+                os.remove(tmppath)
+        return [self.path]
+
+
+def _tarfile_scan(path, offset=0):
+    """ :py:func:`wallpapermgr.tarscan.scan` , with :py:mod:`tarfile` (slower, but reads every tar feature).
+    """
+    (names, offsets, sizes, types) = ([], array.array('Q'), array.array('Q'), bytearray())
+    error = None
+    with open(path, 'rb') as fd:
+        fd.seek(offset)
+        with tarfile.open(fileobj=fd, mode='r:') as archive_fd:
+            try:
+                for info in archive_fd:
+                    names.append(info.name)
+                    offsets.append(info.offset_data)
+                    sizes.append(info.size)
+                    types.extend(info.type)
+            except(tarfile.ReadError) as exc:
+                error = str(exc)
+            return tarscan.Members(names, offsets, sizes, bytes(types), archive_fd.offset, error)
+
+
+def _tar_header_mtime(header):
+    """ Returns the mtime field of a member's 512 byte tar header.
+    """
+    if len(header) < tarfile.BLOCKSIZE:
+        raise RuntimeError('truncated tar header')
+    return tarfile.nti(bytes(header[136:148]))
+
+
+def _tar_header_problem(header, name):
+    """ Returns what is wrong with a member's 512 byte tar header, or None.
+    """
+    if len(header) < tarfile.BLOCKSIZE:
+        return 'truncated header'
+    try:
+        chksum = tarfile.nti(header[148:156])
+    except(tarfile.HeaderError):
+        return 'unreadable header checksum'
+    if chksum not in tarfile.calc_chksums(header):
+        return 'bad header checksum'
+
+    # long names are stored in a longname/pax header, the name field is truncated
+    encoded = name.encode('utf-8', 'surrogateescape')
+    if len(encoded) < 100 and header[:100].rstrip(b'\0') not in (encoded, b'./' + encoded):
+        return 'header belongs to "{}"'.format(
+            header[:100].rstrip(b'\0').decode('utf-8', 'replace')
+        )
+    return None
+
+
+def _sha256(filepath):
+    sha = hashlib.sha256()
+    with open(filepath, 'rb') as fd:
+        for chunk in iter(lambda: fd.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+# {magic bytes: file type}
+_magic = {
+    b'PK\x03\x04': 'zip',
+    b'PK\x05\x06': 'zip',  # empty zip
+    b'\x1f\x8b': 'gzip',
+    b'\xfd7zXZ\x00': 'xz',
+}
+
+
+def _sniff(path):
+    """ Returns the type of an existing file from it's magic bytes (ex: ``'zip'`` ), or None.
+    """
+    try:
+        with open(path, 'rb') as fd:
+            head = fd.read(8)
+    except(IOError, OSError):
+        return None
+    for magic in _magic:
+        if head.startswith(magic):
+            return _magic[magic]
+    return None
+
+
+def compressed_codec(path):
+    """ Returns the codec of a compressed archive path (ex: ``'gzip'`` ), or None.
+    """
+    filetype = _sniff(path)
+    if filetype in _codecs:
+        return filetype
+    for ext in compressed_extensions:
+        if path.lower().endswith(ext):
+            return compressed_extensions[ext]
+    return None
+
+
+def storage_type(path):
+    """ Returns the :py:class:`Storage` subclass used for an archive path.
+
+    Existing files are identified by their magic bytes, otherwise by extension.
+    Directories (or paths without an extension, that do not exist yet)
+    are :py:class:`LooseStorage` , ``.zip`` is :py:class:`ZipStorage` ,
+    ``.tar.gz`` / ``.tar.xz`` are :py:class:`CompressedStorage` ,
+    everything else is :py:class:`TarStorage` .
+    """
+    if os.path.isdir(path):
+        return LooseStorage
+    if not os.path.exists(path) and not os.path.splitext(path)[-1]:
+        return LooseStorage
+
+    filetype = _sniff(path) if os.path.isfile(path) else None
+    if filetype == 'zip' or (filetype is None and path.lower().endswith('.zip')):
+        return ZipStorage
+    if compressed_codec(path):
+        return CompressedStorage
+    return TarStorage
+
+
+def set_remote_roots(roots, opener):
+    """ Opens archives under directories `roots` with ``opener(path)`` ,
+    instead of reading them directly (ex: :py:class:`wallpapermgr.shared.RemoteStorage` ).
+    An empty list reads every archive directly again.
+    """
+    global _remote_roots
+    _remote_roots = [(os.path.realpath(root).rstrip(os.sep) + os.sep, opener) for root in roots]
+
+
+def open_storage(path, mappings=None, remote=True):
+    """ Returns a :py:class:`Storage` for the archive at `path` .
+
+    Args:
+        path (str):
+            path to archive
+
+        mappings (MappingCache, optional):
+            if provided, the archive is read through it's shared memory-map.
+
+        remote (bool, optional):
+            if False, archives under :py:func:`set_remote_roots` are read directly
+            (ex: by the shared daemon itself).
+    """
+    path = os.path.expanduser(path)
+    if remote and _remote_roots:
+        real = os.path.realpath(path)
+        for (root, opener) in _remote_roots:
+            if real.startswith(root):
+                return opener(path)
+
+    cls = storage_type(path)
+    if mappings is not None and cls in (TarStorage, ZipStorage):
+        return cls(path, mapping=mappings.get(path))
+    return cls(path)
+
+
+def convert(src_path, dst_path, batch_size=256):
+    """ Copies all wallpapers from one archive into a new archive,
+    whose format is chosen by :py:func:`storage_type` .
+
+    Example:
+
+        .. code-block:: python
+
+            # migrate a tar archive to loose files
+            convert('~/wallpapers/normal_walls.tar', '~/wallpapers/normal_walls')
+
+    """
+    dst_path = os.path.expanduser(dst_path)
+    if os.path.exists(dst_path):
+        raise RuntimeError('destination already exists: "{}"'.format(dst_path))
+
+    tmpdir = '{}.convert-tmp'.format(dst_path)
+    os.makedirs(tmpdir)
+    try:
+        with open_storage(src_path) as src:
+            with open_storage(dst_path) as dst:
+                names = src.names()
+                # adding is batched, appending to a tar reads it's headers
+                for i in range(0, len(names), batch_size):
+                    filepaths = []
+                    for name in names[i:i + batch_size]:
+                        filepath = os.path.join(tmpdir, name)
+                        src.extract(name, filepath)
+                        filepaths.append(filepath)
+                    dst.add(filepaths)
+                    for filepath in filepaths:
+                        os.remove(filepath)
+    finally:
+        shutil.rmtree(tmpdir)
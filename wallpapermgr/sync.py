@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# builtin
+from __future__ import absolute_import, division, print_function
+import collections
+import concurrent.futures
+import logging
+import os
+import subprocess
+import sys
+import time
+# external
+# internal
+from wallpapermgr import datafile
+
+
+logger = logging.getLogger(__name__)
+
+operations = ('fetch', 'pull', 'push')
+
+
+def group_by_gitroot(config):
+    """ Groups archives that share a git repository.
+
+    Returns:
+        collections.OrderedDict:
+            ``(ex: {'/home/you/wallpapers': ['normal_walls', 'wide_walls']})``
+    """
+    data = config.read()
+    groups = collections.OrderedDict()
+    for archive in config.archives():
+        gitroot = data['archives'][archive]['gitroot']
+        if not gitroot:
+            continue
+        gitroot = os.path.expanduser(gitroot)
+        groups.setdefault(gitroot, []).append(archive)
+    return groups
+
+
+def _git(gitroot, *args):
+    """ Runs a git command in `gitroot`, capturing it's output
+    so that output from concurrent repos is not interleaved.
+    """
+    env = dict(os.environ)
+    env['GIT_TERMINAL_PROMPT'] = '0'  # fail instead of prompting from N threads
+    proc = subprocess.run(
+        ['git', '-C', gitroot] + list(args),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+        env=env,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(
+            '`git {}` failed in "{}":\n{}'.format(
+                ' '.join(args), gitroot, proc.stdout.strip()
+            )
+        )
+    return proc.stdout
+
+
+def sync_repo(archive, operation='pull', depth=None, blobless=False):
+    """ fetch/pull/push the git repo of a single archive.
+    Repos that do not exist yet are cloned (pull/fetch only).
+
+    Args:
+        archive (wallpapermgr.datafile.Archive):
+            any archive stored in the repo.
+
+        operation (str): ``(ex: 'pull')``
+            one of :py:data:`operations`
+
+        depth (int, optional):
+        blobless (bool, optional):
+            used if repo is cloned.
+            See :py:meth:`wallpapermgr.datafile.Archive.clone` .
+    """
+    gitroot = archive.gitroot
+
+    if not os.path.exists('{}/.git'.format(gitroot)):
+        if operation == 'push':
+            raise RuntimeError('cannot push, no repo at "{}"'.format(gitroot))
+        if archive.is_submodule():
+            return archive.clone(depth=depth, blobless=blobless)
+
+        parentdir = os.path.dirname(gitroot)
+        if not os.path.isdir(parentdir):
+            os.makedirs(parentdir)
+        cmds = archive.clone_cmd(depth=depth, blobless=blobless)
+        _git(parentdir, *cmds[1:])
+        return True
+
+    if operation == 'fetch':
+        _git(gitroot, 'fetch')
+    elif operation == 'pull':
+        if _git(gitroot, 'status', '--porcelain', '--untracked-files=all').strip():
+            raise RuntimeError(
+                (
+                    'cannot git-pull, '
+                    'repo contains untracked-files/changes: '
+                    '"{}"'
+                ).format(gitroot)
+            )
+        _git(gitroot, 'pull')
+        _git(gitroot, 'checkout', 'master')
+    elif operation == 'push':
+        _git(gitroot, 'push')
+    else:
+        raise RuntimeError('invalid sync operation: "{}"'.format(operation))
+    return True
+
+
+def sync(config=None, operation='pull', jobs=4, out=None, depth=None, blobless=False):
+    """ fetch/pull/push every archive's git repo concurrently.
+    Repos shared by several archives are only synchronized once.
+
+    Args:
+        config (wallpapermgr.datafile.Config, optional):
+            You may reuse a config, if you already have one instantiated.
+
+        operation (str): ``(ex: 'pull')``
+            one of :py:data:`operations`
+
+        jobs (int, optional):
+            maximum number of repos synchronized at once.
+
+        out (file, optional):
+            where progress is written (default: stdout)
+
+        depth (int, optional):
+        blobless (bool, optional):
+            used for repos that are cloned.
+            See :py:meth:`wallpapermgr.datafile.Archive.clone` .
+
+    Returns:
+        dict: ``{gitroot: exception or None}``
+    """
+    if config is None:
+        config = datafile.Config()
+    if out is None:
+        out = sys.stdout
+
+    groups = group_by_gitroot(config)
+    results = {}
+    total = len(groups)
+
+    def run(gitroot, archives):
+        start = time.monotonic()
+        out.write('{} {} ({}) ...\n'.format(
+            operation, gitroot, ', '.join(archives)
+        ))
+        out.flush()
+        archive = datafile.Archive(archives[0], config=config)
+        sync_repo(archive, operation, depth=depth, blobless=blobless)
+        return time.monotonic() - start
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        futures = dict(
+            (pool.submit(run, gitroot, groups[gitroot]), gitroot)
+            for gitroot in groups
+        )
+        for (done, future) in enumerate(concurrent.futures.as_completed(futures), 1):
+            gitroot = futures[future]
+            try:
+                elapsed = future.result()
+                results[gitroot] = None
+                out.write('[{}/{}] {} ok ({:.1f}s)\n'.format(
+                    done, total, gitroot, elapsed
+                ))
+            except(Exception) as exc:
+                results[gitroot] = exc
+                out.write('[{}/{}] {} FAILED: {}\n'.format(
+                    done, total, gitroot, exc
+                ))
+            out.flush()
+
+    return results
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+""" Where wallpapers are extracted to, before they are displayed.
+
+Every wallpaper change writes a full image, and deletes the previous one.
+On a tmpfs (or in a memfd) those writes never reach the disk.
+
+Each output alternates between two slots (files). The next wallpaper is
+extracted to the slot that is not displayed, so the displayed file is never
+rewritten while a setter may still be reading it. It is deleted on the following change.
+"""
+# builtin
+from __future__ import absolute_import, division, print_function
+import glob
+import logging
+import os
+import threading
+# external
+import xdg.BaseDirectory
+# internal
+from wallpapermgr import datafile
+
+
+logger = logging.getLogger(__name__)
+
+tmpfs_types = ('tmpfs', 'ramfs')
+slots = 2  # files per output (displayed, next)
+
+
+class ExtractTarget(object):
+    """ Base class for locations wallpapers are extracted to.
+
+    Targets are created by the :py:class:`wallpapermgr.display.Server` ,
+    and shared by every output.
+    """
+    name = None  # (ex: 'disk') used to label metrics
+
+    def start(self):
+        """ Prepare the target. Called once before the first extraction.
+        """
+        pass
+
+    def wallpaperfile(self, output, slot=0):
+        """ Returns the path `output` 's wallpapers are extracted to.
+
+        Args:
+            output (str): ``(ex: 'left')``
+            slot (int, optional): ``(ex: 1)`` which of the output's files
+
+        Returns:
+            str: ``(ex: '/run/user/1000/wallpapermgr/wallpapers/wallpaper-left{ext}')``
+                ``{ext}`` is replaced by the extension of the wallpaper.
+        """
+        raise NotImplementedError()
+
+    def delete(self, output, slot=None):
+        """ Deletes `output` 's wallpaper extracted to `slot` (or every slot).
+        """
+        pass
+
+    def close(self):
+        """ Release any resources held by the target.
+        """
+        pass
+
+
+class DirTarget(ExtractTarget):
+    """ Extracts wallpapers to files in a directory (one per output slot).
+
+    Example:
+
+        .. code-block:: python
+
+            target = DirTarget('/run/user/1000/wallpapermgr/wallpapers', name='runtime')
+            target.wallpaperfile('default')
+            >>> '/run/user/1000/wallpapermgr/wallpapers/wallpaper{ext}'
+            target.wallpaperfile('left', slot=1)
+            >>> '/run/user/1000/wallpapermgr/wallpapers/wallpaper-left~1{ext}'
+
+    """
+    def __init__(self, dirpath, name='disk'):
+        self.__dirpath = dirpath
+        self.name = name
+
+    @property
+    def dirpath(self):
+        return self.__dirpath
+
+    def start(self):
+        if not os.path.isdir(self.__dirpath):
+            os.makedirs(self.__dirpath)
+
+    def wallpaperfile(self, output, slot=0):
+        if output == datafile.default_output:
+            basename = 'wallpaper'
+        else:
+            basename = 'wallpaper-{}'.format(output)
+        if slot:
+            basename += '~{}'.format(slot)
+        return os.path.join(self.__dirpath, basename + '{ext}')
+
+    def delete(self, output, slot=None):
+        for n in (range(slots) if slot is None else [slot]):
+            stem = self.wallpaperfile(output, n).format(ext='')
+            # (ex: 'wallpaper*' also matches slot 1's 'wallpaper~1.png')
+            for old_wallpaper in glob.glob(glob.escape(stem) + '*'):
+                if os.path.splitext(old_wallpaper)[0] == stem or old_wallpaper == stem:
+                    os.remove(old_wallpaper)
+
+
+class MemfdTarget(ExtractTarget):
+    """ Extracts wallpapers into anonymous memory files (one per output slot),
+    exposed to setters as ``/proc/<server-pid>/fd/N`` .
+
+    Paths have no extension, setters must detect the image format from it's contents,
+    and are only valid while the server runs (setters that restore the last wallpaper
+    on login need a directory target). A slot's file is freed when it is deleted,
+    the slot's next wallpaper is written to a new one.
+    """
+    name = 'memfd'
+
+    def __init__(self):
+        self.__fds = {}
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def is_supported():
+        return hasattr(os, 'memfd_create') and os.path.isdir('/proc/self/fd')
+
+    def wallpaperfile(self, output, slot=0):
+        with self.__lock:
+            fd = self.__fds.get((output, slot))
+            if fd is None:
+                fd = os.memfd_create('wallpapermgr-{}-{}'.format(output, slot))
+                self.__fds[(output, slot)] = fd
+        return '/proc/{}/fd/{}'.format(os.getpid(), fd)
+
+    def delete(self, output, slot=None):
+        with self.__lock:
+            for n in (range(slots) if slot is None else [slot]):
+                fd = self.__fds.pop((output, n), None)
+                if fd is not None:
+                    os.close(fd)
+
+    def close(self):
+        with self.__lock:
+            for fd in self.__fds.values():
+                os.close(fd)
+            self.__fds.clear()
+
+
+def disk_dir():
+    """ Returns the directory wallpapers were always extracted to (in ``$XDG_DATA_HOME`` ).
+    """
+    return os.path.join(xdg.BaseDirectory.save_data_path('wallpapermgr'), 'wallpapers')
+
+
+def runtime_dir():
+    """ Returns ``$XDG_RUNTIME_DIR/wallpapermgr/wallpapers`` , or None if it is not set.
+    """
+    dirpath = os.environ.get('XDG_RUNTIME_DIR')
+    if not dirpath or not os.path.isdir(dirpath):
+        return None
+    return os.path.join(dirpath, 'wallpapermgr', 'wallpapers')
+
+
+def filesystem_type(path):
+    """ Returns the type of the filesystem `path` is on (from ``/proc/self/mounts`` ).
+
+    Returns:
+        str: ``(ex: 'tmpfs')`` , or None if it could not be determined.
+    """
+    path = os.path.realpath(path)
+    try:
+        with open('/proc/self/mounts', 'r') as fd:
+            mounts = [line.split() for line in fd]
+    except(IOError, OSError):
+        return None
+
+    # longest mountpoint containing path
+    best = (None, None)
+    for fields in mounts:
+        mountpoint = fields[1].replace('\\040', ' ')
+        if path == mountpoint or path.startswith(mountpoint.rstrip('/') + '/'):
+            if best[0] is None or len(mountpoint) > len(best[0]):
+                best = (mountpoint, fields[2])
+    return best[1]
+
+
+def from_config(config):
+    """ Creates the extraction target configured in `config` .
+
+    Example:
+
+        .. code-block:: yaml
+
+            # (default) $XDG_RUNTIME_DIR if it is a tmpfs, otherwise disk
+            extract_target: auto
+
+            extract_target: runtime         # $XDG_RUNTIME_DIR
+            extract_target: memfd           # /proc/<pid>/fd/N (only while the server runs)
+            extract_target: disk            # $XDG_DATA_HOME/wallpapermgr/wallpapers
+            extract_target: /dev/shm/walls  # any directory
+
+    Returns:
+        ExtractTarget: the target (not yet started)
+    """
+    setting = config.read().get('extract_target', 'auto')
+
+    if setting == 'auto':
+        dirpath = runtime_dir()
+        if dirpath and filesystem_type(os.path.dirname(os.path.dirname(dirpath))) in tmpfs_types:
+            return DirTarget(dirpath, name='runtime')
+        # (memfd paths die with the server, it must be chosen explicitly)
+        logger.debug('$XDG_RUNTIME_DIR is not a tmpfs, extracting wallpapers to disk')
+        return DirTarget(disk_dir(), name='disk')
+
+    if setting == 'runtime':
+        dirpath = runtime_dir()
+        if dirpath is None:
+            raise RuntimeError('extract_target is "runtime", but $XDG_RUNTIME_DIR is not set')
+        return DirTarget(dirpath, name='runtime')
+    elif setting == 'memfd':
+        if not MemfdTarget.is_supported():
+            raise RuntimeError('extract_target is "memfd", but memfd_create is not available')
+        return MemfdTarget()
+    elif setting == 'disk':
+        return DirTarget(disk_dir(), name='disk')
+
+    dirpath = os.path.expanduser(setting)
+    name = 'tmpfs' if filesystem_type(dirpath) in tmpfs_types else 'disk'
+    return DirTarget(dirpath, name=name)
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+""" Lists the members of an uncompressed tar archive, by walking it's 512 byte headers.
+
+:py:mod:`tarfile` builds a :py:class:`tarfile.TarInfo` (parsing every field) for each
+member. Indexing an archive only needs the name, data offset, size and type of each
+member, which are unpacked straight from the headers (over an mmap, without copying
+member data). GNU longname/longlink and PAX (extended, global) headers are applied
+the same way :py:mod:`tarfile` applies them, and scanning stops where it would stop
+(end-of-archive blocks, damaged headers), so results match ``tarfile.getmembers()`` .
+
+GNU sparse members are not supported (:py:class:`UnsupportedError` ), fall back to :py:mod:`tarfile` .
+
+Example:
+
+    .. code-block:: python
+
+        members = scan_file('~/wallpapers/normal_walls.tar')
+        members.names[:2]
+        >>> ['wallhaven-474183.png', 'wallhaven-581722.jpg']
+        (members.offsets[0], members.sizes[0], members.types[0:1])
+        >>> (512, 2480417, b'0')
+        members.end      # offset of the end-of-archive blocks (where members are appended)
+        >>> 9801216
+
+"""
+# builtin
+from __future__ import absolute_import, division, print_function
+import array
+import collections
+import contextlib
+import mmap
+import os
+import re
+import struct
+import tarfile
+# external
+# internal
+
+
+Members = collections.namedtuple('Members', [
+    'names',    # list of str
+    'offsets',  # array('Q') offset of each member's data
+    'sizes',    # array('Q') bytes
+    'types',    # bytes, tar typeflag of each member (ex: b'0' regular file, b'5' directory)
+    'end',      # offset after the last member
+    'error',    # str if the archive is damaged after the last member (ex: truncated), else None
+])
+
+# name, size, checksum, typeflag, ustar prefix
+_header = struct.Struct('100s24x12s12x8sc188x155s12x')
+_blocksize = tarfile.BLOCKSIZE
+_zero_block = tarfile.NUL * _blocksize
+_skip_data_types = set(tarfile.REGULAR_TYPES)
+_supported_types = set(tarfile.SUPPORTED_TYPES)
+_pax_types = (tarfile.XHDTYPE, tarfile.SOLARIS_XHDTYPE)
+_pax_record = re.compile(br'(\d+) ([^=]+)=')
+_pax_hdrcharset = re.compile(br'\d+ hdrcharset=([^\n]+)\n')
+
+
+class UnsupportedError(RuntimeError):
+    """ The archive uses a feature the scanner does not implement (GNU sparse files).
+    """
+    pass
+
+
+class _InvalidHeader(Exception):
+    pass
+
+
+class _EndOfArchive(_InvalidHeader):
+    pass
+
+
+def scan_file(path, offset=0, encoding=tarfile.ENCODING):
+    """ Memory-maps `path` , and returns it's :py:func:`scan` .
+    """
+    with open(path, 'rb') as fd:
+        if not os.fstat(fd.fileno()).st_size:
+            return scan(b'', offset, encoding)
+        with contextlib.closing(mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)) as mapped:
+            return scan(mapped, offset, encoding)
+
+
+def scan(buf, offset=0, encoding=tarfile.ENCODING):
+    """ Lists members of the tar archive in `buf` , starting with the header at `offset` .
+
+    Args:
+        buf (mmap.mmap, bytes, memoryview):
+            the archive
+        offset (int, optional):
+            offset of the first header to read (ex: the previous scan's ``end`` )
+
+    Raises:
+        tarfile.ReadError: if the header at offset 0 is unreadable (not a tar archive)
+        UnsupportedError: if the archive holds GNU sparse members
+
+    Returns:
+        Members:
+    """
+    names = []
+    offsets = array.array('Q')
+    sizes = array.array('Q')
+    types = bytearray()
+    global_pax = {}
+    pending = []  # longname/pax headers of the next member (outermost first)
+    error = None
+    length = len(buf)
+    pos = offset
+    start = offset  # of the member's first (longname/pax) header
+
+    while True:
+        if not pending:
+            start = pos
+            if pos > length:
+                # the last member's data is missing
+                error = 'unexpected end of data'
+                break
+
+        try:
+            (name, size, typeflag) = _parse_header(bytes(buf[pos:pos + _blocksize]), encoding)
+        except(_InvalidHeader) as exc:
+            if pending:
+                error = str(exc)
+            elif pos == 0 and not isinstance(exc, _EndOfArchive):
+                raise tarfile.ReadError('empty file' if pos >= length else str(exc))
+            break
+        data_offset = pos + _blocksize
+
+        # headers describing the next member
+        if typeflag in (tarfile.GNUTYPE_LONGNAME, tarfile.GNUTYPE_LONGLINK):
+            data = bytes(buf[data_offset:data_offset + _block(size)])
+            if typeflag == tarfile.GNUTYPE_LONGNAME:
+                pending.append({'longname': _nts(data, encoding)})
+            else:
+                pending.append({})
+            pos = data_offset + _block(size)
+            continue
+        if typeflag in _pax_types or typeflag == tarfile.XGLTYPE:
+            data = bytes(buf[data_offset:data_offset + _block(size)])
+            pax = global_pax if typeflag == tarfile.XGLTYPE else dict(global_pax)
+            try:
+                _parse_pax(data, pax, encoding)
+            except(_InvalidHeader) as exc:
+                if pending:
+                    error = str(exc)
+                elif pos == 0:
+                    raise tarfile.ReadError(str(exc))
+                break
+            if any(key.startswith('GNU.sparse.') for key in pax):
+                raise UnsupportedError('GNU sparse member (pax)')
+            pending.append(pax if typeflag in _pax_types else {})
+            pos = data_offset + _block(size)
+            continue
+
+        # the member. it's data is only skipped for files (and unknown types)
+        skip = typeflag in _skip_data_types or typeflag not in _supported_types
+        end = data_offset + (_block(size) if skip else 0)
+        (name, size) = _apply_pax(name, size, global_pax)
+        for override in reversed(pending):
+            (name, size) = _apply_pax(name, size, override)
+            if 'size' in override:
+                # (pax headers replacing the size move the next header)
+                end = data_offset + (_block(size) if skip else 0)
+        if pending and typeflag == tarfile.DIRTYPE:
+            name = name.rstrip('/')
+        pending = []
+
+        names.append(name)
+        offsets.append(data_offset)
+        sizes.append(max(size, 0))
+        types.extend(typeflag)
+        pos = end
+
+    return Members(names, offsets, sizes, bytes(types), start, error)
+
+
+def _parse_header(header, encoding):
+    """ Returns ``(name, size, typeflag)`` of a 512 byte header (like :py:meth:`tarfile.TarInfo.frombuf` ).
+
+    Raises:
+        _InvalidHeader: if `header` does not start a member
+    """
+    if not header:
+        raise _InvalidHeader('empty header')
+    if len(header) != _blocksize:
+        raise _InvalidHeader('truncated header')
+    if header == _zero_block:
+        raise _EndOfArchive('end of file header')
+
+    (name, size, chksum, typeflag, prefix) = _header.unpack_from(header)
+    # unsigned sum (with the checksum field as spaces), signed for some old tars
+    chksum = _number(chksum)
+    if chksum != 256 + sum(header) - sum(header[148:156]) and chksum not in tarfile.calc_chksums(header):
+        raise _InvalidHeader('bad checksum')
+    size = _number(size)
+
+    name = _nts(name, encoding)
+    if typeflag == tarfile.AREGTYPE and name.endswith('/'):
+        typeflag = tarfile.DIRTYPE
+    if typeflag == tarfile.GNUTYPE_SPARSE:
+        raise UnsupportedError('GNU sparse member "{}"'.format(name))
+    if typeflag == tarfile.DIRTYPE:
+        name = name.rstrip('/')
+    prefix = _nts(prefix, encoding)
+    if prefix and typeflag not in tarfile.GNU_TYPES:
+        name = prefix + '/' + name
+    return (name, size, typeflag)
+
+
+def _number(field):
+    """ Parses a header's number field (octal, or base-256 like :py:func:`tarfile.nti` ).
+    """
+    if field[0] in (0o200, 0o377):
+        return tarfile.nti(field)
+    try:
+        return int(field.split(tarfile.NUL, 1)[0].strip() or b'0', 8)
+    except(ValueError):
+        raise _InvalidHeader('invalid header')
+
+
+def _nts(field, encoding):
+    return field.split(tarfile.NUL, 1)[0].decode(encoding, 'surrogateescape')
+
+
+def _block(size):
+    return (size + _blocksize - 1) // _blocksize * _blocksize
+
+
+def _parse_pax(data, pax, encoding):
+    """ Adds the records of a pax header to `pax` (like :py:meth:`tarfile.TarInfo._proc_pax` ).
+    """
+    match = _pax_hdrcharset.search(data)
+    if match is not None:
+        pax['hdrcharset'] = match.group(1).decode('utf-8')
+    name_encoding = encoding if pax.get('hdrcharset') == 'BINARY' else 'utf-8'
+
+    pos = 0
+    while True:
+        match = _pax_record.match(data, pos)
+        if not match:
+            return
+        (length, keyword) = match.groups()
+        length = int(length)
+        if length == 0:
+            raise _InvalidHeader('invalid header')
+        value = data[match.end(2) + 1:match.start(1) + length - 1]
+        keyword = _decode_pax(keyword, 'utf-8', 'utf-8')
+        if keyword in tarfile.PAX_NAME_FIELDS:
+            pax[keyword] = _decode_pax(value, name_encoding, encoding)
+        else:
+            pax[keyword] = _decode_pax(value, 'utf-8', 'utf-8')
+        pos += length
+
+
+def _decode_pax(value, encoding, fallback_encoding):
+    try:
+        return value.decode(encoding, 'strict')
+    except(UnicodeDecodeError):
+        return value.decode(fallback_encoding, 'surrogateescape')
+
+
+def _apply_pax(name, size, pax):
+    """ Returns name/size of a member, replaced by it's longname/pax header.
+    """
+    if 'longname' in pax:
+        name = pax['longname']
+    if 'path' in pax:
+        name = pax['path'].rstrip('/')
+    if 'size' in pax:
+        try:
+            size = int(pax['size'])
+        except(ValueError):
+            size = 0
+    return (name, size)
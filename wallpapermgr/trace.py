@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+""" Opt-in structured tracing, and runtime cProfile sampling of the server.
+
+When disabled, :py:func:`span` returns a shared no-op object,
+so instrumented code pays for a single global lookup.
+
+Example:
+
+    .. code-block:: python
+
+        trace.enable('/tmp/wallpapermgr.trace')
+        with trace.span('extract', archive='normal_walls', index=3) as span:
+            size = store.extract(name, filepath)
+            span.set(bytes=size)
+
+        # /tmp/wallpapermgr.trace  (one json object per line)
+        {"name": "extract", "start": 9046.21, "duration": 0.0031, "thread": 1403..,
+         "thread_name": "Thread-3", "id": 7, "parent": null,
+         "archive": "normal_walls", "index": 3, "bytes": 1048576}
+
+"""
+# builtin
+from __future__ import absolute_import, division, print_function
+import argparse
+import collections
+import cProfile
+import io
+import itertools
+import json
+import os
+import pstats
+import threading
+import time
+# external
+# internal
+
+
+_lock = threading.Lock()
+_local = threading.local()
+_ids = itertools.count(1)
+_writer = None
+_filepath = None
+
+_profiler = None           # profiles the thread that started profiling
+_profiler_thread = None
+_thread_profiles = []      # profiles of other (short-lived) threads
+
+
+# =======
+# tracing
+# =======
+
+class _NullSpan(object):
+    """ Returned by :py:func:`span` while tracing is disabled.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def set(self, **fields):
+        pass
+
+
+_null_span = _NullSpan()
+
+
+class Span(object):
+    """ Records the duration of a with-block as a json line.
+    """
+    __slots__ = ('name', 'fields', 'id', 'parent', 'start')
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.id = None
+        self.parent = None
+        self.start = None
+
+    def set(self, **fields):
+        """ Adds fields only known once the span has started (ex: byte counts).
+        """
+        self.fields.update(fields)
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        self.id = next(_ids)
+        self.parent = stack[-1] if stack else None
+        stack.append(self.id)
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        duration = time.monotonic() - self.start
+        _local.stack.pop()
+
+        record = {
+            'name': self.name,
+            'start': self.start,
+            'duration': duration,
+            'thread': threading.get_ident(),
+            'thread_name': threading.current_thread().name,
+            'id': self.id,
+            'parent': self.parent,
+        }
+        record.update(self.fields)
+        if exc_type is not None:
+            record['error'] = '{}: {}'.format(exc_type.__name__, exc_val)
+        _write(record)
+
+
+def span(name, **fields):
+    """ Returns a context-manager that traces a with-block.
+
+    Args:
+        name (str): ``(ex: 'extract')``
+        fields: extra (json-serializable) values recorded with the span.
+    """
+    if _writer is None:
+        return _null_span
+    return Span(name, fields)
+
+
+def event(name, **fields):
+    """ Records a single point in time.
+    """
+    if _writer is None:
+        return
+    record = {
+        'name': name,
+        'start': time.monotonic(),
+        'duration': 0,
+        'thread': threading.get_ident(),
+        'thread_name': threading.current_thread().name,
+    }
+    record.update(fields)
+    _write(record)
+
+
+def _write(record):
+    line = json.dumps(record, default=str) + '\n'
+    with _lock:
+        if _writer is not None:
+            _writer.write(line)
+
+
+def enable(filepath):
+    """ Starts appending spans to `filepath` .
+    """
+    global _writer
+    global _filepath
+    filepath = os.path.abspath(os.path.expanduser(filepath))
+    fd = open(filepath, 'a', buffering=1)
+    with _lock:
+        if _writer is not None:
+            _writer.close()
+        _writer = fd
+        _filepath = filepath
+    event('trace_start', pid=os.getpid())
+
+
+def disable():
+    global _writer
+    global _filepath
+    with _lock:
+        if _writer is not None:
+            _writer.close()
+        _writer = None
+        _filepath = None
+
+
+def is_enabled():
+    return _writer is not None
+
+
+def filepath():
+    """ Returns the trace file being written to, or None.
+    """
+    return _filepath
+
+
+# =========
+# profiling
+# =========
+
+def start_profile():
+    """ Starts profiling the calling thread (the server's request thread),
+    and every thread started with :py:func:`profiled` .
+    """
+    global _profiler
+    global _profiler_thread
+    with _lock:
+        if _profiler is not None:
+            raise RuntimeError('profiler is already running')
+        _profiler = cProfile.Profile()
+        _profiler_thread = threading.get_ident()
+        del _thread_profiles[:]
+    _profiler.enable()
+
+
+def is_profiling():
+    return _profiler is not None
+
+
+def stop_profile(filepath=None, limit=25):
+    """ Stops profiling.
+
+    Args:
+        filepath (str, optional):
+            if provided, stats are written here (see :py:mod:`pstats` ).
+
+        limit (int, optional):
+            number of functions included in the returned report.
+
+    Returns:
+        str: functions sorted by cumulative time
+    """
+    global _profiler
+    global _profiler_thread
+    with _lock:
+        if _profiler is None:
+            raise RuntimeError('profiler is not running')
+        profiler = _profiler
+        profiles = list(_thread_profiles)
+        _profiler = None
+        _profiler_thread = None
+        del _thread_profiles[:]
+
+    profiler.disable()
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    for profile in profiles:
+        stats.add(profile)
+
+    if filepath:
+        stats.dump_stats(os.path.abspath(os.path.expanduser(filepath)))
+    stats.sort_stats('cumulative').print_stats(limit)
+    return out.getvalue()
+
+
+def profiled(func):
+    """ Wraps a thread's target, so that it is profiled if profiling
+    is enabled when it is called.
+
+    Example:
+
+        .. code-block:: python
+
+            t = threading.Thread(target=trace.profiled(extract_wallpaper), ...)
+
+    """
+    def wrapper(*args, **kwargs):
+        if _profiler is None or _profiler_thread == threading.get_ident():
+            return func(*args, **kwargs)
+
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            with _lock:
+                if _profiler is not None:
+                    _thread_profiles.append(profile)
+    return wrapper
+
+
+# =======
+# summary
+# =======
+
+def read(filepath):
+    """ Yields the records of a trace file.
+    """
+    with open(filepath, 'r') as fd:
+        for line in fd:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def summarize(filepath, slowest=5):
+    """ Returns a report of a trace file's spans, grouped by name.
+
+    Example:
+
+        ::
+
+            name         count    total       p50       p90       max      bytes
+            request         42  812.1ms    3.20ms   41.07ms   97.12ms          0
+            extract         43  140.8ms    2.91ms    5.33ms   12.40ms   44040192
+
+    """
+    durations = collections.defaultdict(list)
+    byte_counts = collections.defaultdict(int)
+    records = []
+    for record in read(filepath):
+        if not record.get('duration'):
+            continue
+        durations[record['name']].append(record['duration'])
+        byte_counts[record['name']] += record.get('bytes', 0)
+        records.append(record)
+
+    def percentile(values, percent):
+        return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+    lines = ['{:<20} {:>7} {:>10} {:>9} {:>9} {:>9} {:>12}'.format(
+        'name', 'count', 'total', 'p50', 'p90', 'max', 'bytes'
+    )]
+    order = sorted(durations, key=lambda n: sum(durations[n]), reverse=True)
+    for name in order:
+        values = sorted(durations[name])
+        lines.append('{:<20} {:>7} {:>8.1f}ms {:>7.2f}ms {:>7.2f}ms {:>7.2f}ms {:>12}'.format(
+            name, len(values),
+            sum(values) * 1000,
+            percentile(values, 50) * 1000,
+            percentile(values, 90) * 1000,
+            values[-1] * 1000,
+            byte_counts[name],
+        ))
+
+    lines.extend(['', 'slowest spans:'])
+    ignored = ('name', 'start', 'duration', 'thread', 'id', 'parent')
+    for record in sorted(records, key=lambda r: r['duration'], reverse=True)[:slowest]:
+        fields = ' '.join(
+            '{}={}'.format(k, record[k]) for k in sorted(record) if k not in ignored
+        )
+        lines.append('  {:>9.2f}ms {} {}'.format(
+            record['duration'] * 1000, record['name'], fields
+        ))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize a wallpapermgr trace file')
+    parser.add_argument('filepath', help='trace file written by `wallmgr --trace`')
+    parser.add_argument(
+        '-n', '--slowest', help='number of slowest spans to print (default: 5)',
+        type=int, default=5,
+    )
+    args = parser.parse_args()
+    print(summarize(args.filepath, slowest=args.slowest))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+""" Integrity checks of archives, so damaged wallpapers (ex: a truncated pull,
+an interrupted ``--add`` ) are found before the slideshow tries to display them.
+
+Members are checked in chunks, by several threads (hashing and decompression
+release the GIL). Each format is checked as far as it can be:
+
+    * tar:       header checksums, member bounds within the archive
+    * zip:       local headers, CRC32 of contents
+    * loose:     sha256 of contents (from the manifest)
+    * .tar.gz/xz: every frame decompressed (gzip CRC32/xz check), against the ``.idx`` sidecar
+
+Wallpapers in the datafile's sequence that are missing from the archive are reported too.
+
+Example:
+
+    .. code-block:: python
+
+        report = verify_archive('~/wallpapers/normal_walls.tar', indexed=data.indexed('normal_walls'))
+        print(report.summary())
+        >>> 'normal_walls.tar: 1520 wallpapers, 3.21GB in 1.40s (2.29GB/s), 1 bad'
+        data.quarantine('normal_walls', sorted(report.problems))
+
+"""
+# builtin
+from __future__ import absolute_import, division, print_function
+import concurrent.futures
+import logging
+import os
+import time
+# external
+# internal
+from wallpapermgr import metrics, storage
+
+
+logger = logging.getLogger(__name__)
+
+
+class Report(object):
+    """ Result of verifying an archive.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.members = 0
+        self.bytes = 0
+        self.seconds = 0
+        self.problems = {}   # {name: problem}
+        self.layout = None   # problem with the archive as a whole
+        self.unindexed = []  # in the archive, but not the datafile
+
+    @property
+    def throughput(self):
+        """ Returns bytes checked per second.
+        """
+        if not self.seconds:
+            return 0
+        return self.bytes / self.seconds
+
+    def summary(self):
+        summary = '{}: {} wallpapers, {:.2f}GB in {:.2f}s ({:.2f}GB/s), {} bad'.format(
+            os.path.basename(self.path.rstrip('/')),
+            self.members,
+            self.bytes / 1e9,
+            self.seconds,
+            self.throughput / 1e9,
+            len(self.problems),
+        )
+        if self.layout:
+            summary += ' ({})'.format(self.layout)
+        return summary
+
+
+def verify_archive(path, indexed=None, jobs=None, chunk_size=32, mappings=None):
+    """ Checks every wallpaper in the archive at `path` .
+
+    Args:
+        path (str):
+            path to archive
+
+        indexed (list, optional): ``(ex: ['wallhaven-474183.png', ...])``
+            wallpapers the datafile expects in the archive (sequence and quarantine).
+            those that are missing are reported as problems.
+
+        jobs (int, optional):
+            number of threads checking chunks (default: number of cpus)
+
+        chunk_size (int, optional):
+            number of wallpapers checked by a thread at a time
+
+        mappings (wallpapermgr.storage.MappingCache, optional):
+            reuse memory-maps of the archive (ex: the server's)
+
+    Returns:
+        Report:
+    """
+    report = Report(path)
+    start = time.monotonic()
+
+    owned_mappings = mappings is None
+    if owned_mappings:
+        mappings = storage.MappingCache()
+    try:
+        with storage.open_storage(path, mappings) as store:
+            names = _list_members(store, report, indexed)
+            chunks = [names[i:i + chunk_size] for i in range(0, len(names), chunk_size)]
+            workers = max(jobs or os.cpu_count() or 1, 1)
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix='verify',
+            ) as pool:
+                for (checked, problems) in pool.map(store.verify, chunks):
+                    report.bytes += checked
+                    report.problems.update(problems)
+    finally:
+        if owned_mappings:
+            mappings.close()
+
+    report.seconds = time.monotonic() - start
+    _finish(report, names, indexed)
+    return report
+
+
+def verify_steps(report, indexed=None, checkpoint=None, chunk_size=32, mappings=None):
+    """ Generator version of :py:func:`verify_archive` , checking one chunk per step
+    in the calling thread (for :py:class:`wallpapermgr.idle.Scheduler` ).
+
+    Yields a checkpoint after every chunk. If resumed from a `checkpoint`
+    (and the archive still has the same members), verified chunks are skipped.
+
+    Args:
+        report (Report):
+            ``Report(path)`` of the archive to verify, filled in as chunks are checked.
+    """
+    path = report.path
+    with storage.open_storage(path, mappings) as store:
+        names = _list_members(store, report, indexed)
+    chunks = [names[i:i + chunk_size] for i in range(0, len(names), chunk_size)]
+
+    first = 0
+    if checkpoint and checkpoint['members'] == len(names):
+        first = checkpoint['chunk']
+        report.bytes = checkpoint['bytes']
+        report.seconds = checkpoint['seconds']
+        report.problems.update(checkpoint['problems'])
+
+    for (i, chunk) in enumerate(chunks[first:], first):
+        start = time.monotonic()
+        with storage.open_storage(path, mappings) as store:
+            (checked, problems) = store.verify(chunk)
+        report.bytes += checked
+        report.problems.update(problems)
+        report.seconds += time.monotonic() - start
+        yield {
+            'members': len(names),
+            'chunk': i + 1,
+            'bytes': report.bytes,
+            'seconds': report.seconds,
+            'problems': report.problems,
+        }
+
+    _finish(report, names, indexed)
+
+
+def _list_members(store, report, indexed):
+    try:
+        names = store.names()
+    except storage.read_errors as exc:
+        # members cannot be listed, check those the datafile expects
+        report.layout = str(exc)
+        names = list(indexed or [])
+    report.layout = report.layout or store.verify_layout()
+    return names
+
+
+def _finish(report, names, indexed):
+    report.members = len(names)
+    if indexed is not None:
+        present = set(names)
+        for name in indexed:
+            if name not in present:
+                report.problems[name] = 'in datafile, but missing from archive'
+        indexed = set(indexed)
+        report.unindexed = [n for n in names if n not in indexed]
+
+    metrics.registry.counter('verify_bytes_total').inc(report.bytes)
+    metrics.registry.counter('verify_bad_members_total').inc(len(report.problems))
+    metrics.registry.histogram('verify_seconds').observe(report.seconds)
+    if report.layout:
+        logger.warning('damaged archive "{}": {}'.format(report.path, report.layout))
+    for (name, problem) in sorted(report.problems.items()):
+        logger.warning('damaged wallpaper "{}" in "{}": {}'.format(name, report.path, problem))
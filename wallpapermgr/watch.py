@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# builtin
+from __future__ import absolute_import, division, print_function
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+# external
+# internal
+
+
+logger = logging.getLogger(__name__)
+
+# <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+_event_struct = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+class Watcher(threading.Thread):
+    """ Thread that calls `callback` with a set of paths, once they
+    stop changing for `debounce` seconds.
+
+    Subclasses implement :py:meth:`_wait` .
+    """
+    def __init__(self, paths, callback, debounce=0.5):
+        """ Constructor.
+
+        Args:
+            paths (list): ``(ex: ['~/.config/wallpapermgr/config2.yml', ...])``
+                files to watch. (they do not need to exist)
+
+            callback (callable):
+                called with a ``set`` of changed paths.
+
+            debounce (float, optional):
+                seconds without changes before `callback` is called.
+        """
+        super(Watcher, self).__init__()
+        self.daemon = True
+        self.callback = callback
+        self.debounce = debounce
+        self._lock = threading.RLock()
+        self._paths = set()
+        self._pending = set()
+        self._last_event = None
+        self._request_stop = False
+        self.set_paths(paths)
+
+    @property
+    def paths(self):
+        with self._lock:
+            return set(self._paths)
+
+    def set_paths(self, paths):
+        with self._lock:
+            self._paths = set(os.path.abspath(p) for p in paths)
+
+    def shutdown(self):
+        self._request_stop = True
+
+    def _changed(self, path):
+        with self._lock:
+            if path not in self._paths:
+                return
+            self._pending.add(path)
+            self._last_event = time.monotonic()
+
+    def _flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            if (time.monotonic() - self._last_event) < self.debounce:
+                return
+            pending = self._pending
+            self._pending = set()
+
+        logger.debug('watched files changed: {}'.format(sorted(pending)))
+        try:
+            self.callback(pending)
+        except(Exception):
+            logger.exception('error handling changed files')
+
+    def _wait(self, timeout):
+        """ Blocks up to `timeout` seconds, calling :py:meth:`_changed`
+        for any modified paths.
+        """
+        raise NotImplementedError()
+
+    def run(self):
+        while not self._request_stop:
+            self._wait(min(self.debounce, 0.5))
+            self._flush()
+
+
+class InotifyWatcher(Watcher):
+    """ Watcher using linux's inotify.
+
+    The parent directory of each path is watched, so files that are
+    replaced (``git pull``, editors that write a new file and rename it)
+    are still noticed.
+    """
+    _libc = None
+
+    def __init__(self, paths, callback, debounce=0.5):
+        self._watches = {}  # {wd: dirpath}
+        if InotifyWatcher._libc is None:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            libc.inotify_init1  # AttributeError if not supported
+            InotifyWatcher._libc = libc
+
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        super(InotifyWatcher, self).__init__(paths, callback, debounce)
+
+    def set_paths(self, paths):
+        super(InotifyWatcher, self).set_paths(paths)
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_CREATE | IN_DELETE | IN_MODIFY
+
+        with self._lock:
+            dirpaths = set(os.path.dirname(p) for p in self._paths)
+            for wd in [wd for wd in self._watches if self._watches[wd] not in dirpaths]:
+                self._libc.inotify_rm_watch(self._fd, wd)
+                self._watches.pop(wd)
+
+            for dirpath in dirpaths - set(self._watches.values()):
+                if not os.path.isdir(dirpath):
+                    continue
+                wd = self._libc.inotify_add_watch(
+                    self._fd, dirpath.encode(), mask
+                )
+                if wd < 0:
+                    logger.warning('unable to watch: {}'.format(dirpath))
+                    continue
+                self._watches[wd] = dirpath
+
+    def _wait(self, timeout):
+        (readable, _, _) = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return
+
+        try:
+            buf = os.read(self._fd, 64 * 1024)
+        except(BlockingIOError):
+            return
+
+        offset = 0
+        while offset + _event_struct.size <= len(buf):
+            (wd, mask, cookie, length) = _event_struct.unpack_from(buf, offset)
+            offset += _event_struct.size
+            name = buf[offset:offset + length].rstrip(b'\0').decode()
+            offset += length
+
+            dirpath = self._watches.get(wd)
+            if dirpath and name:
+                self._changed(os.path.join(dirpath, name))
+
+    def run(self):
+        try:
+            super(InotifyWatcher, self).run()
+        finally:
+            os.close(self._fd)
+
+
+class PollingWatcher(Watcher):
+    """ Watcher that periodically compares each path's mtime/size/inode.
+    """
+    def __init__(self, paths, callback, debounce=0.5, interval=2):
+        self.interval = interval
+        self._stats = {}
+        self._next_poll = 0
+        super(PollingWatcher, self).__init__(paths, callback, debounce)
+
+    def set_paths(self, paths):
+        super(PollingWatcher, self).set_paths(paths)
+        with self._lock:
+            self._stats = dict((p, self._stat(p)) for p in self._paths)
+
+    @staticmethod
+    def _stat(path):
+        try:
+            stat = os.stat(path)
+        except(OSError):
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _wait(self, timeout):
+        time.sleep(timeout)
+        if time.monotonic() < self._next_poll:
+            return
+        self._next_poll = time.monotonic() + self.interval
+
+        for path in self.paths:
+            stat = self._stat(path)
+            if stat != self._stats.get(path):
+                self._stats[path] = stat
+                self._changed(path)
+
+
+def create(paths, callback, debounce=0.5):
+    """ Returns an :py:class:`InotifyWatcher` if inotify is available,
+    otherwise a :py:class:`PollingWatcher` .
+    """
+    try:
+        return InotifyWatcher(paths, callback, debounce)
+    except(AttributeError, OSError, TypeError) as exc:
+        logger.info('inotify unavailable ({}), polling for changes'.format(exc))
+        return PollingWatcher(paths, callback, debounce)